@@ -1,7 +1,8 @@
 from dataclasses import dataclass
 from typing import Any
 import httpx
-import requests
+
+import http_transport
 from env import REPORT_ANSWER_URL, AIDEVS_API_KEY
 from logger import logger
 from pydantic import BaseModel
@@ -22,7 +23,7 @@ class Response:
 
 def send_answer(answer: Answer) -> Response:
     answer_json = answer.model_dump_json(by_alias=True)
-    response = requests.post(REPORT_ANSWER_URL, data=answer_json)
+    response = http_transport.post(REPORT_ANSWER_URL, data=answer_json)
 
     logger.info(f"Sent answer in json:\n: {answer_json}")
 
@@ -34,17 +35,24 @@ def send_answer(answer: Answer) -> Response:
     return api_response
 
 
-async def send_answer_async(answer: Answer) -> Response:
+async def send_answer_async(answer: Answer, client: httpx.AsyncClient = None) -> Response:
+    """
+    :param answer: Answer to report.
+    :param client: Shared client to reuse its connection pool, a short-lived one is created if missing.
+    """
     answer_json = answer.model_dump_json(by_alias=True)
-    async with httpx.AsyncClient() as client:
+    timeout = httpx.Timeout(connect=60.0, read=60.0, write=60.0, pool=60.0)
 
-        timeout = httpx.Timeout(connect=60.0, read=60.0, write=60.0, pool=60.0)
+    if client:
         response = await client.post(REPORT_ANSWER_URL, data=answer_json, timeout=timeout)
-        logger.info(f"Sent answer with async in json:\n: {answer_json}")
+    else:
+        async with http_transport.create_async_client() as client:
+            response = await client.post(REPORT_ANSWER_URL, data=answer_json, timeout=timeout)
+    logger.info(f"Sent answer with async in json:\n: {answer_json}")
 
-        response_json = response.json()
+    response_json = response.json()
 
-        logger.info(f"Received response in json:\n: {response_json}")
+    logger.info(f"Received response in json:\n: {response_json}")
 
-        api_response = Response(code=response_json.get("code"), message=response_json.get("message"))
-        return api_response
+    api_response = Response(code=response_json.get("code"), message=response_json.get("message"))
+    return api_response
@@ -0,0 +1,89 @@
+"""
+Recall and latency of the IVF index of NumpyDb against exact search.
+
+Builds a synthetic clustered collection (unit vectors around random topic centres, like embeddings of
+a corpus with recurring subjects), then for every nprobe reports recall@k against brute force and the
+median query latency. Use it to pick nprobe / n_lists for a collection size.
+
+Requires the same .env as the episode scripts, OPENAI_API_KEY may be a dummy value.
+
+Usage:
+    python -m benchmarks.ann_recall --size 200000 --dim 384 --nprobe 1 4 8 16 32
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from statistics import median
+
+import numpy as np
+
+from lib.vector_db.ivf_index import IvfParams
+from lib.vector_db.numpy_db import NumpyDb
+
+
+def synthetic_vectors(size: int, dim: int, topics: int, rng: np.random.Generator) -> np.ndarray:
+    centres = rng.standard_normal((topics, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, topics, size)] + 0.6 * rng.standard_normal((size, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def timed_search(db: NumpyDb, collection_name: str, queries: np.ndarray, top_k: int, nprobe=None):
+    results, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        hits = db.search_vectors(collection_name, query, top_k, nprobe=nprobe)
+        latencies.append(time.perf_counter() - started)
+        results.append({hit["id"] for hit in hits})
+    return results, median(latencies) * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100_000, help="Number of vectors in the collection.")
+    parser.add_argument("--dim", type=int, default=384, help="Vector dimension.")
+    parser.add_argument("--topics", type=int, default=500, help="Number of clusters in the synthetic data.")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries.")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--n-lists", type=int, default=None, help="IVF lists, 4 * sqrt(size) if missing.")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument("--min-recall", type=float, default=None,
+                        help="Fail unless the largest nprobe reaches this recall.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = synthetic_vectors(args.size, args.dim, args.topics, rng)
+    queries = synthetic_vectors(args.queries, args.dim, args.topics, rng)
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = NumpyDb(directory)
+        db.initialize_collection("exact", vector_size=args.dim)
+        db.initialize_collection("ivf", vector_size=args.dim, ivf=IvfParams(n_lists=args.n_lists, min_train_size=1))
+
+        points = [{"id": index, "vector": vector} for index, vector in enumerate(vectors)]
+        db.store_vectors("exact", points)
+        started = time.perf_counter()
+        db.store_vectors("ivf", points)
+        build_seconds = time.perf_counter() - started
+
+        exact, exact_ms = timed_search(db, "exact", queries, args.top_k)
+        report = {"size": args.size, "dim": args.dim, "top_k": args.top_k, "build_s": round(build_seconds, 2),
+                  "exact_median_ms": round(exact_ms, 2), "ivf": []}
+
+        for nprobe in args.nprobe:
+            approximate, ivf_ms = timed_search(db, "ivf", queries, args.top_k, nprobe=nprobe)
+            recall = np.mean([len(found & truth) / len(truth) for found, truth in zip(approximate, exact)])
+            report["ivf"].append({"nprobe": nprobe, "recall": round(float(recall), 4),
+                                  "median_ms": round(ivf_ms, 2), "speedup": round(exact_ms / ivf_ms, 1)})
+
+    print(json.dumps(report, indent=2))
+
+    if args.min_recall is not None and report["ivf"][-1]["recall"] < args.min_recall:
+        print(f"FAIL: recall {report['ivf'][-1]['recall']} below {args.min_recall}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Load and latency benchmark for the s04e04 drone webhook.
+
+Drives the `/api` endpoint of s04e04/main.py in-process (ASGI, no sockets) with a recorded corpus
+of operator instructions. OpenAI is replaced by StubOpenAI with an injected per-request latency,
+so results reflect the service itself plus a simulated model round-trip.
+
+Reports throughput, p50/p95/p99 request latency and per-stage timings collected by the service
+metrics (normalize_instruction, split_instruction, transform_instructions_to_moves, get_terrain).
+With --budget-p95-ms the exit code is non-zero when the p95 latency exceeds the budget.
+
+Requires the same .env as the episode scripts, OPENAI_API_KEY may be a dummy value.
+
+Usage:
+    python -m benchmarks.s04e04_webhook --requests 500 --concurrency 32 --latency-ms 200
+"""
+import argparse
+import asyncio
+import json
+import re
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import httpx
+
+from benchmarks.stub_openai import StubOpenAI
+from lib.lru_cache import LRUCache
+
+DEFAULT_CORPUS = Path(__file__).resolve().parent / "data" / "s04e04_instructions.txt"
+
+
+def load_corpus(path: Path) -> List[str]:
+    lines = [line.strip() for line in path.read_text(encoding="utf-8").splitlines()]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def stub_responder(body: dict) -> str:
+    """
+    Plausible answers for the three kinds of calls made by the webhook.
+    """
+    from s04e04.move_parser import parse_move
+
+    prompt = body["messages"][-1]["content"]
+    if isinstance(prompt, list):
+        prompt = " ".join(part.get("text", "") for part in prompt)
+    schema = (body.get("response_format") or {}).get("json_schema", {}).get("name")
+
+    if schema == "InstructionLLMResponse":
+        steps = [step.strip() for step in re.split(r",|\.| i | a potem | potem ", prompt) if step.strip()]
+        return json.dumps({"instructions": steps or [prompt]})
+    if schema == "CoordinateShiftLLMResponse":
+        return json.dumps({"shift": parse_move(prompt) or [0, 0]})
+    return prompt
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run(corpus: List[str], requests: int, concurrency: int, latency: float, warm_cache: bool) -> dict:
+    import s04e04.main as webhook
+
+    stub = StubOpenAI(latency=latency, responder=stub_responder)
+    webhook.app.state.http_transport = stub.async_transport()
+    webhook.openai_client.disable_cache()
+    if not warm_cache:
+        # Caches would otherwise turn every repeated instruction into a memory lookup
+        for name in ("normalized_instructions", "split_instructions", "coordinate_shifts"):
+            setattr(webhook, name, LRUCache(0))
+    webhook.metrics.reset()
+
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with webhook.lifespan(webhook.app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=webhook.app),
+                                     base_url="http://s04e04") as client:
+
+            async def send(instruction: str):
+                nonlocal errors
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.post("/api", json={"instruction": instruction})
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        errors += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(send(corpus[index % len(corpus)]) for index in range(requests)))
+            elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    stages = {
+        stage: {"count": values["count"], "mean_ms": round(values["sum"] / values["count"] * 1000, 2)}
+        for stage, values in webhook.metrics.snapshot().items() if values["count"]
+    }
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "injected_latency_ms": latency * 1000,
+        "warm_cache": warm_cache,
+        "errors": errors,
+        "openai_calls": sum(stub.requests.values()),
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "stages": stages,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS, help="File with one instruction per line.")
+    parser.add_argument("--requests", type=int, default=200, help="Total number of /api requests.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Maximum number of requests in flight.")
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="Injected latency of every OpenAI call.")
+    parser.add_argument("--warm-cache", action="store_true",
+                        help="Keep the in-memory instruction caches enabled, as in a long-running service.")
+    parser.add_argument("--budget-p95-ms", type=float, default=None, help="Fail when p95 latency exceeds it.")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(load_corpus(args.corpus), args.requests, args.concurrency, args.latency_ms / 1000,
+                             args.warm_cache))
+    print(json.dumps(report, indent=2))
+
+    if report["errors"]:
+        print(f"FAIL: {report['errors']} requests failed", file=sys.stderr)
+        return 1
+    if args.budget_p95_ms is not None and report["p95_ms"] > args.budget_p95_ms:
+        print(f"FAIL: p95 {report['p95_ms']} ms exceeds the budget of {args.budget_p95_ms} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
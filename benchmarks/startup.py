@@ -0,0 +1,88 @@
+"""
+Startup benchmark for openai_client.
+
+Measures, in a fresh interpreter per run, the time of `import openai_client` and of constructing
+OpenAIClient plus the first `ask_question` answered by an in-process stub transport (no network).
+Fails with a non-zero exit code when the median exceeds the budget, so regressions such as
+eagerly importing heavy ML stacks are caught.
+
+Requires the same .env as the episode scripts, OPENAI_API_KEY may be a dummy value.
+
+Usage:
+    python -m benchmarks.startup --runs 5 --budget-ms 1500
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from statistics import median
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+CHILD_SCRIPT = """
+import json
+import resource
+import sys
+import time
+
+started = time.perf_counter()
+import openai_client
+imported = time.perf_counter()
+
+import httpx
+from benchmarks.stub_openai import StubOpenAI
+
+client = openai_client.OpenAIClient(http_client=httpx.Client(transport=StubOpenAI().transport()))
+client.ask_question("ping")
+answered = time.perf_counter()
+
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_call_ms": (answered - imported) * 1000,
+    "total_ms": (answered - started) * 1000,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "transformers_imported": "transformers" in sys.modules,
+}))
+"""
+
+
+def run_once() -> dict:
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    result = subprocess.run([sys.executable, "-c", CHILD_SCRIPT], cwd=REPO_ROOT, env=env, capture_output=True,
+                            text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh interpreter runs.")
+    parser.add_argument("--budget-ms", type=float, default=1500.0,
+                        help="Maximum allowed median of import + first ask_question.")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+
+    report = {
+        "runs": args.runs,
+        "median_import_ms": round(median(run["import_ms"] for run in runs), 1),
+        "median_first_call_ms": round(median(run["first_call_ms"] for run in runs), 1),
+        "median_total_ms": round(median(run["total_ms"] for run in runs), 1),
+        "max_rss_mb": round(max(run["max_rss_mb"] for run in runs), 1),
+        "budget_ms": args.budget_ms,
+    }
+    print(json.dumps(report, indent=2))
+
+    if any(run["transformers_imported"] for run in runs):
+        print("FAIL: transformers was imported before it was needed", file=sys.stderr)
+        return 1
+    if report["median_total_ms"] > args.budget_ms:
+        print(f"FAIL: startup took {report['median_total_ms']} ms, budget is {args.budget_ms} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Callable, Optional
+
+import httpx
+
+
+def chat_completion_response(content: str, model: str = "gpt-4o") -> dict:
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content},
+        }],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+
+
+def chat_completion_chunks(content: str, model: str = "gpt-4o", chunk_size: int = 16) -> bytes:
+    """
+    Server-sent events of a streamed chat completion, the content is split into `chunk_size` deltas.
+    """
+    created = int(time.time())
+
+    def event(delta: dict, finish_reason: Optional[str] = None) -> str:
+        chunk = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(chunk)}\n\n"
+
+    events = [event({"role": "assistant", "content": ""})]
+    events += [event({"content": content[start:start + chunk_size]}) for start in range(0, len(content), chunk_size)]
+    events += [event({}, "stop"), "data: [DONE]\n\n"]
+    return "".join(events).encode()
+
+
+def embedding_response(inputs: list, dimension: int) -> dict:
+    return {
+        "object": "list",
+        "model": "text-embedding-ada-002",
+        "data": [
+            {"object": "embedding", "index": index, "embedding": [1.0 / dimension] * dimension}
+            for index in range(len(inputs))
+        ],
+        "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+    }
+
+
+class StubOpenAI:
+    """
+    In-process stand-in for the OpenAI HTTP API used by benchmarks.
+
+    Plug `transport()` / `async_transport()` into the httpx client handed to OpenAIClient /
+    AsyncOpenAIClient. Every request waits `latency` seconds before answering, so real network
+    round-trips can be simulated without leaving the process.
+    """
+
+    def __init__(self, latency: float = 0.0, responder: Optional[Callable[[dict], str]] = None,
+                 embedding_dimension: int = 1536):
+        """
+        :param latency: Injected delay per request in seconds.
+        :param responder: Produces the completion text from the request body, defaults to "OK".
+        :param embedding_dimension: Length of the vectors returned by the embeddings endpoint.
+        """
+        self.latency = latency
+        self.responder = responder or (lambda body: "OK")
+        self.embedding_dimension = embedding_dimension
+        self.requests = Counter()
+
+    def _respond(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content or b"{}")
+        path = request.url.path
+        self.requests[path] += 1
+
+        if path.endswith("/chat/completions") and body.get("stream"):
+            return httpx.Response(200, headers={"content-type": "text/event-stream"},
+                                  content=chat_completion_chunks(self.responder(body), body.get("model", "")))
+        if path.endswith("/chat/completions"):
+            return httpx.Response(200, json=chat_completion_response(self.responder(body), body.get("model", "")))
+        if path.endswith("/embeddings"):
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            return httpx.Response(200, json=embedding_response(inputs, self.embedding_dimension))
+        return httpx.Response(404, json={"error": {"message": f"Stub does not serve {path}"}})
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(request)
+
+    async def handle_async(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(request)
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def async_transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle_async)
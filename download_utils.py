@@ -1,32 +1,215 @@
+import glob
+import hashlib
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Optional
 from urllib.parse import urlparse, ParseResult, urljoin
 from bs4 import BeautifulSoup
 
 import requests
 
+import http_transport
+from logger import logger
 
-def download_file(url: str, target_dir: str) -> str:
-    """Download zip file from URL to target directory"""
+
+# Large write buffers keep syscalls off the hot path, network reads stay smaller so an interrupted
+# transfer loses little of what was already received
+CHUNK_SIZE = 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_PARTS = 4
+# Smaller files are fetched with a single request, splitting them costs more than it saves
+MIN_PART_SIZE = 4 * 1024 * 1024
+
+
+@dataclass
+class RemoteFileInfo:
+    size: Optional[int]
+    etag: Optional[str]
+    accepts_ranges: bool
+    last_modified: Optional[str] = None
+
+    @property
+    def validator(self) -> Optional[str]:
+        # A weak ETag never matches If-Range (RFC 7233), the date is the next best validator
+        if self.etag and not self.etag.startswith("W/"):
+            return self.etag
+        return self.last_modified
+
+
+class _RangeIgnored(IOError):
+    pass
+
+
+def _remote_file_info(url: str) -> RemoteFileInfo:
+    try:
+        response = http_transport.head(url)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logger.warning(f"HEAD {url} failed, downloading without ranges: {e}")
+        return RemoteFileInfo(size=None, etag=None, accepts_ranges=False)
+
+    length = response.headers.get("Content-Length")
+    return RemoteFileInfo(
+        size=int(length) if length and length.isdigit() else None,
+        etag=response.headers.get("ETag"),
+        accepts_ranges=response.headers.get("Accept-Ranges", "").lower() == "bytes",
+        last_modified=response.headers.get("Last-Modified"),
+    )
+
+
+def _read_sidecar(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_sidecar(path: str, data: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def _download_range(url: str, part_path: str, start: int, end: Optional[int], validator: Optional[str]):
+    """
+    Fetch bytes [start, end] into part_path, continuing after whatever the part file already holds.
+
+    :param validator: Strong ETag or Last-Modified of the file, sent as If-Range.
+    :raises _RangeIgnored: If the server sent the whole file instead of a part of several.
+    """
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if end is not None and start + offset > end:
+        return
+
+    # Offsets count bytes of the file itself, a compressed body would be decoded into different lengths
+    headers = {"Accept-Encoding": "identity"}
+    if start + offset > 0 or end is not None:
+        headers["Range"] = f"bytes={start + offset}-{'' if end is None else end}"
+        if validator:
+            # The server answers with the whole file instead of the range if it changed meanwhile
+            headers["If-Range"] = validator
+
+    with http_transport.get(url, headers=headers, stream=True) as response:
+        if response.status_code == 416 and "Range" in headers:
+            # Nothing left after the offset, i.e. an interrupted download stopped after the last byte
+            total = response.headers.get("Content-Range", "").rpartition("/")[2]
+            if total.isdigit() and start + offset < int(total):
+                raise IOError(f"Server rejected the byte range of {url}, the file has {total} bytes")
+            return
+        response.raise_for_status()
+        mode = "ab"
+        if "Range" in headers and response.status_code != 206:
+            if start or end is not None:
+                raise _RangeIgnored(f"Server ignored the byte range of {url}, status {response.status_code}")
+            # The whole file came instead of its rest, e.g. it changed since the part was written
+            mode = "wb"
+        with open(part_path, mode, buffering=CHUNK_SIZE) as f:
+            for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+                f.write(chunk)
+
+
+def download_file(url: str, target_dir: str, parts: int = DOWNLOAD_PARTS, sha256: Optional[str] = None) -> str:
+    """
+    Download a file from URL to target directory.
+
+    Byte ranges are fetched in parallel into `<file>.part.N` files which survive interruptions, so the
+    next call resumes instead of starting over. The file only appears under its final name after its size,
+    ETag and optional checksum were verified. A `<file>.download.json` sidecar remembers the ETag, so files
+    that did not change on the server are not downloaded again.
+
+    :param url: URL of the file.
+    :param target_dir: Directory to store the file in, created if missing.
+    :param parts: Maximum number of parallel range requests.
+    :param sha256: Expected hex digest of the content, verified when given.
+    :return: Path of the downloaded file.
+    """
     if not os.path.exists(target_dir):
         os.makedirs(target_dir)
 
     parsed_url: ParseResult = urlparse(url)
     filename: str = os.path.basename(parsed_url.path)
-
     local_filename = os.path.join(target_dir, filename)
-    with requests.get(url, stream=True) as r:
-        r.raise_for_status()
-        with open(local_filename, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
+    sidecar_path = f"{local_filename}.download.json"
+
+    info = _remote_file_info(url)
+    sidecar = _read_sidecar(sidecar_path)
+
+    if (os.path.exists(local_filename) and info.etag and sidecar.get("etag") == info.etag
+            and sidecar.get("complete") and (sha256 is None or sidecar.get("sha256") == sha256)):
+        logger.info(f"{local_filename} is up to date (ETag {info.etag}), skipping download")
+        return local_filename
+
+    # Parts of another version of the file can't be resumed
+    if (sidecar.get("etag") != info.etag or sidecar.get("last_modified") != info.last_modified
+            or sidecar.get("size") != info.size or not info.validator):
+        for stale in Path(target_dir).glob(f"{glob.escape(filename)}.part.*"):
+            stale.unlink()
+    _write_sidecar(sidecar_path, {"url": url, "etag": info.etag, "last_modified": info.last_modified,
+                                  "size": info.size, "complete": False})
+
+    if info.accepts_ranges and info.size and info.size >= 2 * MIN_PART_SIZE and parts > 1:
+        part_size = max(MIN_PART_SIZE, -(-info.size // parts))
+        ranges = [(start, min(start + part_size, info.size) - 1) for start in range(0, info.size, part_size)]
+    else:
+        ranges = [(0, None)]
+    part_paths = [f"{local_filename}.part.{index}" for index in range(len(ranges))]
+
+    if len(ranges) == 1 and not (info.accepts_ranges and info.validator):
+        # Without ranges and a validator, a partial file can't be safely continued
+        if os.path.exists(part_paths[0]):
+            os.remove(part_paths[0])
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="download") as executor:
+            futures = [executor.submit(_download_range, url, part_path, start, end, info.validator)
+                       for part_path, (start, end) in zip(part_paths, ranges)]
+            for future in futures:
+                future.result()
+    except _RangeIgnored as e:
+        # The file changed under its parts or the server doesn't serve ranges after all, start over in one piece
+        logger.warning(f"{e}, downloading it again without ranges")
+        for part_path in part_paths:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        return download_file(url, target_dir, parts=1, sha256=sha256)
+
+    # Join the parts while hashing them, then publish the file atomically
+    digest = hashlib.sha256()
+    tmp_filename = f"{local_filename}.part"
+    with open(tmp_filename, "wb", buffering=CHUNK_SIZE) as target:
+        for part_path in part_paths:
+            with open(part_path, "rb") as part:
+                while chunk := part.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    target.write(chunk)
+
+    size = os.path.getsize(tmp_filename)
+    problem = None
+    if info.size is not None and size != info.size:
+        problem = f"expected {info.size} bytes, got {size}"
+    elif sha256 is not None and digest.hexdigest() != sha256.lower():
+        problem = f"expected sha256 {sha256}, got {digest.hexdigest()}"
+    if problem:
+        for path in [tmp_filename, *part_paths]:
+            os.remove(path)
+        raise IOError(f"Download of {url} is corrupted: {problem}")
+
+    os.replace(tmp_filename, local_filename)
+    for part_path in part_paths:
+        os.remove(part_path)
+    _write_sidecar(sidecar_path, {"url": url, "etag": info.etag, "last_modified": info.last_modified, "size": size,
+                                  "sha256": digest.hexdigest(), "complete": True})
+
+    logger.info(f"Downloaded {url} to {local_filename} ({size} bytes in {len(ranges)} parts)")
     return local_filename
 
 
 def download_text_file_to_variable(url: str) -> str:
     # Send a GET request to the URL
-    response = requests.get(url)
+    response = http_transport.get(url)
     # Raise an exception for any HTTP errors
     response.raise_for_status()
     # Return the content as a string (decoded from bytes)
@@ -35,55 +218,105 @@ def download_text_file_to_variable(url: str) -> str:
 
 def download_json_file_to_variable(url: str) -> dict:
     # Send a GET request to the URL
-    response = requests.get(url)
+    response = http_transport.get(url)
     # Raise an exception for any HTTP errors
     response.raise_for_status()
     # Parse and return the JSON content as a dictionary
     return json.loads(response.text)
 
 
-def download_website_with_resources(url: str, output_dir: Path):
+RESOURCE_TAGS = ["img", "link", "script", "audio", "source"]
+RESOURCE_WORKERS = 8
+
+
+def _download_resource(url: str, local_path: Path, cached: dict) -> dict:
+    """
+    Stream one resource to disk, skipped by the server with 304 when it did not change since `cached`.
+    :return: Manifest entry of the resource.
+    """
+    headers = {}
+    if cached and local_path.exists():
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    with http_transport.get(url, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            return cached
+        response.raise_for_status()
+
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = local_path.with_name(f"{local_path.name}.part")
+        with open(tmp_path, "wb", buffering=CHUNK_SIZE) as resource_file:
+            for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+                resource_file.write(chunk)
+        os.replace(tmp_path, local_path)
+
+        return {"path": str(local_path), "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified")}
+
+
+def download_website_with_resources(url: str, output_dir: Path, workers: int = RESOURCE_WORKERS):
+    """
+    Mirror a page with its images, styles, scripts and media, rewriting the HTML to the local copies.
+
+    Resources are fetched concurrently, each distinct local path once. `manifest.json` in output_dir keeps their
+    ETag / Last-Modified, so on later runs unchanged assets are answered with 304 and not transferred.
+
+    :param url: URL of the page.
+    :param output_dir: Directory for index.html and the resources.
+    :param workers: Maximum number of resources downloaded at the same time.
+    """
     # Create output directory
     os.makedirs(output_dir, exist_ok=True)
+    manifest_path = output_dir / "manifest.json"
+    manifest = _read_sidecar(str(manifest_path))
 
     # Download HTML
-    response = requests.get(url)
+    response = http_transport.get(url)
+    response.raise_for_status()
     html_content = response.text
     html_path = output_dir / "index.html"
 
-    with open(html_path, "w", encoding="utf-8") as file:
-        file.write(html_content)
-
-    # Parse and download resources
+    # Collect resources, the same asset is often referenced by several tags
     soup = BeautifulSoup(html_content, "html.parser")
-    for tag in soup.find_all(["img", "link", "script", "audio", "source"]):
-        # Check relevant attribute
-        resource_url = (
-                tag.get("src") or tag.get("href")
-        )  # For img, script, source, link
-
+    tags_by_url = {}
+    local_paths = {}
+    for tag in soup.find_all(RESOURCE_TAGS):
+        # For img, script, source, link
+        resource_url = tag.get("src") or tag.get("href")
         if resource_url:
             full_url = urljoin(url, resource_url)
-            parsed_url = urlparse(resource_url)
-            resource_local_path = output_dir / parsed_url.path.lstrip("/")
+            tags_by_url.setdefault(full_url, []).append(tag)
+            local_paths.setdefault(full_url, urlparse(resource_url).path)
 
-            # Ensure the directory structure exists
-            os.makedirs(resource_local_path.parent, exist_ok=True)
+    # URLs differing only in host or query share a local path, it is written once by the first of them
+    urls_by_path = {}
+    for full_url, local_path in local_paths.items():
+        urls_by_path.setdefault(local_path, []).append(full_url)
 
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="resource") as executor:
+        futures = {
+            executor.submit(_download_resource, full_urls[0], output_dir / local_path.lstrip("/"),
+                            manifest.get(full_urls[0])): local_path
+            for local_path, full_urls in urls_by_path.items()
+        }
+        for future in as_completed(futures):
+            local_path = futures[future]
+            full_url = urls_by_path[local_path][0]
             try:
-                # Download the resource
-                resource_response = requests.get(full_url)
-                with open(resource_local_path, "wb") as resource_file:
-                    resource_file.write(resource_response.content)
-
-                # Update the HTML tag to point to the local path
-                if tag.name in ["img", "audio", "source"]:
-                    tag["src"] = parsed_url.path
-                elif tag.name in ["link", "script"]:
-                    tag["href"] = parsed_url.path
+                manifest[full_url] = future.result()
             except Exception as e:
-                print(f"Failed to download {resource_url}: {e}")
+                logger.warning(f"Failed to download {full_url}: {e}")
+                continue
+
+            # Update the HTML tags to point to the local path, in the attribute they referenced it with
+            for tag in [tag for url in urls_by_path[local_path] for tag in tags_by_url[url]]:
+                tag["src" if tag.get("src") else "href"] = local_path
+
+    _write_sidecar(str(manifest_path), manifest)
 
-    # Save the modified HTML with updated resource paths
+    # Save the HTML with updated resource paths
     with open(html_path, "w", encoding="utf-8") as file:
         file.write(str(soup))
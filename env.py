@@ -10,6 +10,8 @@ OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 AIDEVS_API_KEY = os.getenv('AIDEVS_API_KEY')
 LLAMA2_CLOUDFLARE_API_URL = os.getenv('LLAMA2_CLOUDFLARE_API_URL')
 REPORT_ANSWER_URL = os.getenv('REPORT_ANSWER_URL')
+# Optional, enables the on-disk OpenAI response cache when set
+OPENAI_RESPONSE_CACHE_PATH = os.getenv('OPENAI_RESPONSE_CACHE_PATH')
 
 # lessons data
 # -
@@ -0,0 +1,228 @@
+"""
+Shared HTTP transport for the AI_devs APIs, downloads and scraping.
+
+Every call goes through one process-wide pooled requests.Session, so consecutive calls to the same host
+reuse keep-alive connections instead of paying a TCP+TLS handshake each time. Requests get default
+timeouts, exponential backoff with jitter on 429/5xx (honouring Retry-After) for idempotent methods and
+a per-host concurrency limit, which keeps thread pools from flooding a single server. A POST is only retried
+when its connection failed, so it is never sent twice.
+
+Async code gets the same behaviour from `get_async_client` / `create_async_client`, which speak HTTP/2 when
+`h2` is installed.
+"""
+import asyncio
+import random
+import threading
+import weakref
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from logger import logger
+
+# (connect, read) in seconds
+DEFAULT_TIMEOUT = (10.0, 60.0)
+MAX_RETRIES = 5
+BACKOFF_FACTOR = 0.5
+BACKOFF_MAX = 30.0
+BACKOFF_JITTER = 0.5
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Methods retried on the statuses above and on errors after the request was sent
+RETRY_METHODS = Retry.DEFAULT_ALLOWED_METHODS
+# Simultaneous requests per host, also the size of the keep-alive pool per host
+MAX_CONNECTIONS_PER_HOST = 16
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_host_slots: Dict[str, threading.BoundedSemaphore] = {}
+_host_slots_lock = threading.Lock()
+# Async connections belong to the event loop that opened them, so every loop gets its own shared client
+_async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _build_session() -> requests.Session:
+    retry = Retry(
+        total=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        backoff_max=BACKOFF_MAX,
+        backoff_jitter=BACKOFF_JITTER,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=RETRY_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=MAX_CONNECTIONS_PER_HOST, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    The shared pooled session, created on first use.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def _host_slot(url: str) -> threading.BoundedSemaphore:
+    host = urlparse(url).netloc
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(MAX_CONNECTIONS_PER_HOST)
+        return _host_slots[host]
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Same as requests.request, but through the shared session with a default timeout and a per-host limit.
+    A streamed response keeps its host slot until its body is read to the end, reading it fails or it is closed,
+    so use it as a context manager when it may not be read completely.
+    """
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    slot = _host_slot(url)
+    slot.acquire()
+    try:
+        response = get_session().request(method, url, **kwargs)
+    except BaseException:
+        slot.release()
+        raise
+
+    if not kwargs.get("stream"):
+        slot.release()
+        return response
+
+    lock = threading.Lock()
+    released = False
+
+    def release():
+        nonlocal released
+        with lock:
+            if released:
+                return
+            released = True
+        slot.release()
+
+    def wrap(function):
+        def wrapper(*args, **kwargs):
+            try:
+                return function(*args, **kwargs)
+            finally:
+                release()
+
+        return wrapper
+
+    # urllib3 returns the connection to the pool once the body is exhausted or reading it failed
+    response.raw.release_conn = wrap(response.raw.release_conn)
+    response.close = wrap(response.close)
+    # Last resort for responses dropped without being read or closed
+    weakref.finalize(response, release)
+    return response
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def head(url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault("allow_redirects", True)
+    return request("HEAD", url, **kwargs)
+
+
+class RetryingAsyncTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps an httpx transport with exponential backoff and jitter on 429/5xx and transport errors.
+
+    Other methods than RETRY_METHODS are retried only when connecting failed, e.g. the OpenAI SDK's
+    POSTs are left to its own retries instead of being multiplied by these.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_retries: int = MAX_RETRIES,
+                 methods: frozenset = RETRY_METHODS):
+        self._transport = transport
+        self._max_retries = max_retries
+        self._methods = methods
+
+    @staticmethod
+    def _delay(attempt: int, response: Optional[httpx.Response]) -> float:
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after and retry_after.replace(".", "", 1).isdigit():
+            return min(float(retry_after), BACKOFF_MAX)
+        return min(BACKOFF_FACTOR * 2 ** attempt, BACKOFF_MAX) + random.uniform(0, BACKOFF_JITTER)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        idempotent = request.method in self._methods
+        for attempt in range(self._max_retries + 1):
+            last_attempt = attempt == self._max_retries
+            try:
+                response = await self._transport.handle_async_request(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                # The request never left, any method is safe to send again
+                if last_attempt:
+                    raise
+                response = None
+            except httpx.TransportError:
+                if last_attempt or not idempotent:
+                    raise
+                response = None
+            else:
+                if response.status_code not in RETRY_STATUSES or last_attempt or not idempotent:
+                    return response
+                await response.aclose()
+
+            delay = self._delay(attempt, response)
+            logger.warning(f"Retrying {request.method} {request.url} in {delay:.2f}s (attempt {attempt + 1})")
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def create_async_client(max_connections: int = 64, keepalive_expiry: float = 30.0,
+                        timeout: httpx.Timeout = httpx.Timeout(60.0, connect=10.0),
+                        transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """
+    Pooled keep-alive async client with retries, over HTTP/2 when available. The caller owns and closes it.
+
+    :param max_connections: Size of the connection pool.
+    :param keepalive_expiry: Seconds an idle connection is kept open.
+    :param timeout: Default timeouts of the client.
+    :param transport: Inner transport, e.g. a stub in benchmarks, a pooled network transport by default.
+    """
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                          keepalive_expiry=keepalive_expiry)
+    inner = transport or httpx.AsyncHTTPTransport(http2=HTTP2_AVAILABLE, limits=limits)
+    return httpx.AsyncClient(transport=RetryingAsyncTransport(inner), limits=limits, timeout=timeout,
+                             http2=HTTP2_AVAILABLE)
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    The shared pooled async client of the running event loop, created on first use.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = _async_clients[loop] = create_async_client()
+    return client
@@ -1,4 +1,5 @@
 import requests
+import http_transport
 import html2text
 from urllib.parse import urlparse, urljoin
 import os
@@ -38,7 +39,7 @@ class MarkdownConverter:
                 return content
 
             # Fetch the website content
-            response = requests.get(url)
+            response = http_transport.get(url)
             response.raise_for_status()  # Raise an error for HTTP errors
 
             # Extract base URL
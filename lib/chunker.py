@@ -0,0 +1,180 @@
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Deque, Iterable, Iterator, Optional, Tuple, Union
+
+from lib.html_parser import ParsedHtml, Section
+from openai_client import EMBEDDING_MODEL
+from text_utils import count_tokens
+
+# A sentence ends after terminal punctuation (and closing quotes or brackets) followed by whitespace, or at a newline
+SENTENCE_BOUNDARY = re.compile(r"[.!?…]+[\"'”)\]]*\s+|\n\s*")
+WORD = re.compile(r"\S+\s*")
+# Characters read from a file at a time by split_file
+READ_BLOCK_SIZE = 64 * 1024
+
+
+@dataclass
+class Chunk:
+    """
+    A piece of a longer text. `start` and `end` are character offsets in the parent text.
+    """
+    text: str
+    parent: str
+    index: int
+    start: int
+    end: int
+    tokens: int
+    metadata: dict = field(default_factory=dict)
+
+
+def iter_sentences(blocks: Iterable[str]) -> Iterator[Tuple[int, str]]:
+    """
+    Split a stream of text blocks into sentences without holding more than the unfinished sentence.
+
+    :return: (offset, sentence) pairs; sentences keep their trailing whitespace, so they join back into the input.
+    """
+    buffer, offset = "", 0
+    for block in blocks:
+        buffer += block
+        position = 0
+        for match in SENTENCE_BOUNDARY.finditer(buffer):
+            # A boundary touching the end of the buffer may continue in the next block
+            if match.end() == len(buffer):
+                break
+            yield offset + position, buffer[position:match.end()]
+            position = match.end()
+        buffer = buffer[position:]
+        offset += position
+    if buffer:
+        yield offset, buffer
+
+
+def section_text(section: Section) -> str:
+    """
+    Plain text of a parsed HTML section: header, paragraphs, then images and audios with their
+    captions and descriptions where known.
+    """
+    parts = [section.header or ""]
+    parts.extend(section.content)
+    for image in section.images:
+        parts.append(f"Image {image.url}: {image.caption or 'No caption'}. {image.description or ''}".strip())
+    for audio in section.audios:
+        parts.append(f"Audio {audio.url}: {audio.caption or 'No caption'}. {audio.description or ''}".strip())
+    return "\n".join(part for part in parts if part)
+
+
+class Chunker:
+    """
+    Splits text into overlapping chunks of whole sentences under a token limit, so long documents
+    are embedded completely instead of being truncated at the model's input limit.
+
+    All split methods are generators and read their input incrementally.
+    """
+
+    def __init__(self, max_tokens: int = 512, overlap_tokens: int = 64, model_name: str = EMBEDDING_MODEL):
+        """
+        :param max_tokens: Upper bound of tokens per chunk. Only a sentence longer than that is split between words.
+        :param overlap_tokens: Trailing sentences of a chunk repeated at the start of the next one, up to that many tokens.
+        :param model_name: Model whose tokenizer counts the tokens.
+        """
+        if overlap_tokens >= max_tokens:
+            raise ValueError(f"overlap_tokens ({overlap_tokens}) must be smaller than max_tokens ({max_tokens})")
+        self._max_tokens = max_tokens
+        self._overlap_tokens = overlap_tokens
+        self._model_name = model_name
+
+    def _pieces(self, start: int, sentence: str) -> Iterator[Tuple[int, str, int]]:
+        tokens = count_tokens(sentence, self._model_name)
+        if tokens <= self._max_tokens:
+            yield start, sentence, tokens
+            return
+
+        # An overlong sentence (or a text without punctuation) is cut between words
+        piece_start, piece, piece_tokens = start, "", 0
+        for match in WORD.finditer(sentence):
+            word_tokens = count_tokens(match.group(), self._model_name)
+            if piece and piece_tokens + word_tokens > self._max_tokens:
+                yield piece_start, piece, piece_tokens
+                piece_start, piece, piece_tokens = start + match.start(), "", 0
+            piece += match.group()
+            piece_tokens += word_tokens
+        if piece:
+            yield piece_start, piece, piece_tokens
+
+    def split_stream(self, blocks: Iterable[str], parent: str, metadata: Optional[dict] = None) -> Iterator[Chunk]:
+        """
+        :param blocks: The text in consecutive blocks of any size, e.g. read from a file.
+        :param parent: Identifier of the text, e.g. a file name, copied to every chunk.
+        :param metadata: Copied to every chunk.
+        """
+        window: Deque[Tuple[int, str, int]] = deque()
+        window_tokens = 0
+        fresh = 0
+        index = 0
+
+        def emit() -> Optional[Chunk]:
+            text = "".join(piece for _, piece, _ in window)
+            if not text.strip():
+                return None
+            start = window[0][0] + len(text) - len(text.lstrip())
+            end = window[-1][0] + len(window[-1][1].rstrip())
+            return Chunk(text=text.strip(), parent=parent, index=index, start=start, end=end, tokens=window_tokens,
+                         metadata=dict(metadata or {}))
+
+        for sentence_start, sentence in iter_sentences(blocks):
+            for piece in self._pieces(sentence_start, sentence):
+                tokens = piece[2]
+                if fresh and window_tokens + tokens > self._max_tokens:
+                    chunk = emit()
+                    if chunk:
+                        yield chunk
+                        index += 1
+                    # Keep the tail as overlap, but always leave room for the next piece
+                    while window and (window_tokens > self._overlap_tokens
+                                      or window_tokens + tokens > self._max_tokens):
+                        window_tokens -= window.popleft()[2]
+                    fresh = 0
+
+                window.append(piece)
+                window_tokens += tokens
+                if piece[1].strip():
+                    fresh += 1
+
+        if fresh:
+            chunk = emit()
+            if chunk:
+                yield chunk
+
+    def split_text(self, text: str, parent: str, metadata: Optional[dict] = None) -> Iterator[Chunk]:
+        return self.split_stream([text], parent, metadata)
+
+    def split_file(self, path: Union[str, Path], parent: Optional[str] = None,
+                   metadata: Optional[dict] = None) -> Iterator[Chunk]:
+        """
+        Chunk a text file read in blocks, memory stays flat regardless of its size.
+
+        :param parent: The file name if missing.
+        """
+        path = Path(path)
+
+        def blocks() -> Iterator[str]:
+            with open(path, encoding="utf-8") as f:
+                while block := f.read(READ_BLOCK_SIZE):
+                    yield block
+
+        return self.split_stream(blocks(), parent or path.name, metadata)
+
+    def split_sections(self, parsed: Union[ParsedHtml, Iterable[Section]], source: str,
+                       render: Callable[[Section], str] = section_text) -> Iterator[Chunk]:
+        """
+        Chunk every section of a parsed HTML page on its own, chunks never span two sections.
+
+        :param source: Identifier of the page, section parents are `{source}#section-{i}`.
+        :param render: Turns a section into text, `section_text` by default.
+        """
+        sections = parsed.sections if isinstance(parsed, ParsedHtml) else parsed
+        for i, section in enumerate(sections):
+            yield from self.split_text(render(section), f"{source}#section-{i}",
+                                       {"section": i, "header": section.header or ""})
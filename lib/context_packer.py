@@ -0,0 +1,120 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Set, Union
+
+from lib.ingestion_manifest import content_hash
+from lib.lru_cache import LRUCache
+from logger import logger
+from text_utils import count_tokens, truncate_to_tokens
+
+# Words per shingle when comparing chunks for overlap
+SHINGLE_SIZE = 5
+TOKEN_COUNT_CACHE_SIZE = 65536
+
+
+def _shingles(text: str) -> Set[tuple]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+@dataclass
+class PackedContext:
+    """
+    Chunks chosen for a prompt, best first, and what they cost.
+    """
+    chunks: List[Dict[str, Any]] = field(default_factory=list)
+    tokens: int = 0
+    duplicates: int = 0
+    dropped: int = 0
+    separator: str = "\n\n"
+
+    @property
+    def contents(self) -> List[str]:
+        return [chunk["content"] for chunk in self.chunks]
+
+    @property
+    def text(self) -> str:
+        return self.separator.join(self.contents)
+
+
+class ContextPacker:
+    """
+    Fits retrieved chunks into a token budget for a RAG prompt.
+
+    Chunks are taken greedily by score; exact repeats and chunks mostly covered by already chosen ones
+    (e.g. overlapping windows of the same document) are skipped, and chunks that don't fit are passed
+    over in favour of smaller ones further down. Token counts are cached per chunk hash, so the same
+    chunks retrieved for many questions are tokenized once.
+    """
+
+    def __init__(self, max_tokens: int = 3000, model_name: str = "gpt-4o", separator: str = "\n\n",
+                 overlap_threshold: float = 0.8):
+        """
+        :param max_tokens: Budget of the packed context, separators included.
+        :param model_name: Model whose tokenizer counts the tokens.
+        :param separator: Joins the chunks in the packed text.
+        :param overlap_threshold: Share of a chunk's 5-word shingles already present in chosen chunks
+                                  above which it is skipped as a duplicate.
+        """
+        self._max_tokens = max_tokens
+        self._model_name = model_name
+        self._separator = separator
+        self._overlap_threshold = overlap_threshold
+        self.token_counts: LRUCache[str, int] = LRUCache(TOKEN_COUNT_CACHE_SIZE)
+
+    def count_tokens(self, text: str) -> int:
+        key = content_hash(text)
+        tokens = self.token_counts.get(key)
+        if tokens is None:
+            tokens = count_tokens(text, self._model_name)
+            self.token_counts.put(key, tokens)
+        return tokens
+
+    def pack(self, chunks: List[Union[str, Dict[str, Any]]], max_tokens: int = None) -> PackedContext:
+        """
+        :param chunks: Texts or dictionaries with 'content' and optionally 'score' (e.g. retrieve_contexts results).
+                       Chunks without a score keep their input order.
+        :param max_tokens: Overrides the packer's budget.
+        :return: The chosen chunks, best first.
+        """
+        budget = self._max_tokens if max_tokens is None else max_tokens
+        chunks = [{"content": chunk} if isinstance(chunk, str) else chunk for chunk in chunks]
+        ranked = sorted(chunks, key=lambda chunk: chunk.get("score", 0.0), reverse=True)
+
+        packed = PackedContext(separator=self._separator)
+        separator_tokens = self.count_tokens(self._separator)
+        seen_hashes: Set[str] = set()
+        seen_shingles: Set[tuple] = set()
+
+        for chunk in ranked:
+            content = chunk.get("content", "")
+            digest = content_hash(content)
+            shingles = _shingles(content)
+            if not content.strip() or digest in seen_hashes or (
+                    shingles and len(shingles & seen_shingles) >= self._overlap_threshold * len(shingles)):
+                packed.duplicates += 1
+                continue
+
+            cost = self.count_tokens(content) + (separator_tokens if packed.chunks else 0)
+            if packed.tokens + cost > budget:
+                packed.dropped += 1
+                continue
+
+            packed.chunks.append(chunk)
+            packed.tokens += cost
+            seen_hashes.add(digest)
+            seen_shingles |= shingles
+
+        # A single chunk larger than the whole budget is cut rather than leaving the prompt without context
+        if not packed.chunks and packed.dropped and budget > 0:
+            best = next((chunk for chunk in ranked if chunk.get("content", "").strip()), None)
+            if best is not None:
+                packed.chunks.append({**best, "content": truncate_to_tokens(best["content"], budget, self._model_name)})
+                packed.tokens = self.count_tokens(packed.chunks[0]["content"])
+                packed.dropped -= 1
+
+        logger.debug(f"Packed {len(packed.chunks)} of {len(chunks)} chunks into {packed.tokens}/{budget} tokens "
+                     f"({packed.duplicates} duplicates, {packed.dropped} over budget)")
+        return packed
@@ -5,6 +5,8 @@ import os
 import requests
 from bs4 import BeautifulSoup
 from tidylib import tidy_document
+
+import http_transport
 from logger import logger
 
 @dataclass
@@ -46,7 +48,7 @@ def is_valid_url(url: str) -> bool:
 def parse_html_from_url(url: str, user_agent: str = "Mozilla/5.0") -> ParsedHtml:
     headers = {"User-Agent": user_agent}
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = http_transport.get(url, headers=headers, timeout=10)
         response.raise_for_status()
     except requests.RequestException as e:
         logger.error(f"Failed to fetch URL {url}: {e}")
@@ -0,0 +1,205 @@
+import asyncio
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Union
+from urllib.parse import urlparse
+
+import http_transport
+from lib.html_parser import ParsedHtml, Section
+from logger import logger
+from openai_client import AsyncOpenAIClient
+
+TEXT = "text"
+AUDIO = "audio"
+IMAGE = "image"
+EMBED = "embed"
+
+MODALITY_BY_EXTENSION = {
+    ".txt": TEXT, ".md": TEXT, ".csv": TEXT, ".json": TEXT, ".html": TEXT,
+    ".mp3": AUDIO, ".wav": AUDIO, ".m4a": AUDIO, ".ogg": AUDIO,
+    ".png": IMAGE, ".jpg": IMAGE, ".jpeg": IMAGE, ".webp": IMAGE, ".gif": IMAGE,
+}
+
+# Maximum number of items processed at the same time per stage
+DEFAULT_LIMITS = {TEXT: 16, AUDIO: 4, IMAGE: 4, EMBED: 8}
+
+
+@dataclass
+class IngestionItem:
+    """
+    A file or URL to ingest. `content` lets callers pass text already held in memory, e.g. read from an archive.
+    """
+    source: str
+    modality: Optional[str] = None
+    content: Optional[bytes] = None
+    metadata: dict = field(default_factory=dict)
+
+
+@dataclass
+class IngestionRecord:
+    """
+    Normalized output of every stage: the text extracted from a source plus what is known about it.
+    """
+    source: str
+    text: str
+    metadata: dict = field(default_factory=dict)
+    vector: Optional[List[float]] = None
+
+
+def _is_url(source: str) -> bool:
+    return source.startswith("http://") or source.startswith("https://")
+
+
+def _detect_modality(source: str) -> Optional[str]:
+    path = urlparse(source).path if _is_url(source) else source
+    return MODALITY_BY_EXTENSION.get(Path(path).suffix.lower())
+
+
+def _read_text(source: str) -> str:
+    if _is_url(source):
+        response = http_transport.get(source)
+        response.raise_for_status()
+        return response.text
+    return Path(source).read_text(encoding="utf-8")
+
+
+class IngestionPipeline:
+    """
+    Routes files and URLs to a stage per modality (read text, transcribe audio, describe or OCR images)
+    and optionally embeds the resulting text.
+
+    Every stage has its own concurrency limit, so e.g. slow transcriptions don't hold back image
+    requests, and records are streamed out as soon as they are ready.
+    """
+
+    def __init__(self, openai_client: AsyncOpenAIClient = None, limits: Dict[str, int] = None,
+                 image_prompt: Optional[str] = None, embed: bool = False, raise_errors: bool = False):
+        """
+        :param openai_client: Client for transcription, vision and embeddings, the shared AsyncOpenAIClient by default.
+        :param limits: Concurrency per stage (text, audio, image, embed), merged into DEFAULT_LIMITS.
+        :param image_prompt: Question asked about every image, e.g. to OCR it. A generic description if missing.
+        :param embed: Attach an embedding of the text to every record.
+        :param raise_errors: Fail the whole ingest on the first item that fails, instead of logging and skipping it.
+        """
+        self._openai_client = openai_client or AsyncOpenAIClient()
+        self._limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self._image_prompt = image_prompt
+        self._embed = embed
+        self._raise_errors = raise_errors
+
+    async def _extract_text(self, item: IngestionItem, modality: str) -> str:
+        if modality == TEXT:
+            if item.content is not None:
+                return item.content.decode("utf-8")
+            return await asyncio.to_thread(_read_text, item.source)
+        if modality == AUDIO:
+            return await self._openai_client.transcribe_audio(item.source, save=False)
+        if modality == IMAGE:
+            if self._image_prompt is None:
+                return await self._openai_client.describe_image(item.source)
+            if _is_url(item.source):
+                return await self._openai_client.ask_with_image(self._image_prompt, image_file_url=item.source)
+            return await self._openai_client.ask_with_image(self._image_prompt, image_file_path=Path(item.source))
+        raise ValueError(f"Unsupported modality {modality} of {item.source}")
+
+    async def _process(self, item: IngestionItem, semaphores: Dict[str, asyncio.Semaphore]) -> IngestionRecord:
+        modality = item.modality or _detect_modality(item.source)
+        if modality not in (TEXT, AUDIO, IMAGE):
+            raise ValueError(f"Can't tell the modality of {item.source}")
+
+        async with semaphores[modality]:
+            text = await self._extract_text(item, modality)
+
+        record = IngestionRecord(source=item.source, text=text, metadata={
+            "modality": modality,
+            "name": Path(urlparse(item.source).path).name,
+            **item.metadata,
+        })
+
+        if self._embed and text:
+            async with semaphores[EMBED]:
+                record.vector = await self._openai_client.embed_text(text)
+
+        return record
+
+    async def _process_safely(self, item: IngestionItem, semaphores: Dict[str, asyncio.Semaphore],
+                              failed: Optional[List[IngestionItem]]) -> Optional[IngestionRecord]:
+        try:
+            return await self._process(item, semaphores)
+        except Exception as e:
+            logger.error(f"Failed to ingest {item.source}: {e}")
+            if self._raise_errors:
+                raise
+            if failed is not None:
+                failed.append(item)
+            return None
+
+    async def ingest(self, items: Iterable[Union[str, Path, IngestionItem]],
+                     failed: Optional[List[IngestionItem]] = None) -> AsyncIterator[IngestionRecord]:
+        """
+        Process all items concurrently and yield their records in completion order.
+        Unless the pipeline raises errors, items that fail are logged and skipped, so one broken file
+        doesn't stop a large ingest.
+
+        :param failed: Receives the items that failed, so the caller can report or retry them.
+        """
+        semaphores = {stage: asyncio.Semaphore(limit) for stage, limit in self._limits.items()}
+        items = [item if isinstance(item, IngestionItem) else IngestionItem(source=str(item)) for item in items]
+        tasks = [asyncio.create_task(self._process_safely(item, semaphores, failed)) for item in items]
+
+        try:
+            for completed in asyncio.as_completed(tasks):
+                record = await completed
+                if record is not None:
+                    yield record
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def ingest_all(self, items: Iterable[Union[str, Path, IngestionItem]],
+                         failed: Optional[List[IngestionItem]] = None) -> List[IngestionRecord]:
+        """
+        Same as ingest, but returns the records in input order once all of them are ready.
+        """
+        items = [item if isinstance(item, IngestionItem) else IngestionItem(source=str(item)) for item in items]
+        order = {item.source: index for index, item in enumerate(items)}
+        records = [record async for record in self.ingest(items, failed)]
+        return sorted(records, key=lambda record: order[record.source])
+
+
+async def enrich_media(parsed: ParsedHtml, sections: Optional[Iterable[Section]] = None,
+                       pipeline: Optional[IngestionPipeline] = None) -> List[str]:
+    """
+    Describe images and transcribe audios of a parsed page concurrently, each unique URL exactly once, and
+    fill `description` in place on `parsed.image_details`/`audio_details` and on every section referencing it.
+
+    :param parsed: Result of parse_html_from_url.
+    :param sections: Only enrich media of these sections, e.g. the changed ones. All sections if missing.
+    :param pipeline: Pipeline running the audio and image stages, a default IngestionPipeline if missing.
+                     A pipeline with raise_errors fails on the first medium that fails.
+    :return: URLs of the media that failed, their description stays unset so a later call retries them.
+    """
+    sections = list(parsed.sections if sections is None else sections)
+    wanted = {detail.url for section in sections for detail in [*section.images, *section.audios]}
+
+    # ParsedHtml lists every URL once, details already described (e.g. by an earlier call) are skipped
+    details = {detail.url: detail for detail in [*parsed.image_details, *parsed.audio_details]
+               if detail.url in wanted and detail.description is None}
+    image_urls = {detail.url for detail in parsed.image_details}
+    items = [IngestionItem(source=url, modality=IMAGE if url in image_urls else AUDIO) for url in details]
+    logger.info(f"Enriching {len(items)} unique media of {len(sections)} sections")
+
+    failed: List[IngestionItem] = []
+    async for record in (pipeline or IngestionPipeline()).ingest(items, failed):
+        details[record.source].description = record.text
+
+    # Sections hold their own copies of the details, share the results by URL
+    for section in parsed.sections:
+        for detail in [*section.images, *section.audios]:
+            unique = details.get(detail.url)
+            if unique is not None and detail.description is None:
+                detail.description = unique.description
+
+    if failed:
+        logger.warning(f"Failed to enrich {len(failed)} of {len(items)} media")
+    return [item.source for item in failed]
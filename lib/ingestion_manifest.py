@@ -0,0 +1,160 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from logger import logger
+
+# Fixed namespace, point ids must stay the same across runs and machines
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2a4e-8d4b-5b7e-9a3f-2c1d0e9b8a71")
+
+
+def point_id(collection_name: str, source: str, index: int = 0) -> str:
+    """
+    Deterministic id of the index-th vector of a source, so re-ingesting a source overwrites its points.
+    """
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{collection_name}\n{source}\n{index}"))
+
+
+def content_hash(content: Union[str, bytes]) -> str:
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+@dataclass
+class ManifestEntry:
+    source: str
+    content_hash: str
+    model: str
+    point_ids: List[str]
+    updated: float
+
+
+@dataclass
+class IngestionPlan:
+    """
+    Difference between the sources on hand and what the collection already holds.
+    """
+    pending: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    removed: List[ManifestEntry] = field(default_factory=list)
+
+
+class IngestionManifest:
+    """
+    Records per collection which sources were ingested, the hash of their content, the embedding model
+    and the resulting point ids, backed by SQLite.
+
+    Re-runs use `plan` to embed only new or changed sources and to find the points of removed sources.
+    """
+    DEFAULT_PATH = ".cache/ingestion_manifest.sqlite"
+
+    def __init__(self, collection_name: str, path: str = DEFAULT_PATH):
+        """
+        :param collection_name: Vector collection the manifest describes.
+        :param path: Location of the SQLite database file, shared by all collections.
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._collection_name = collection_name
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS sources ("
+            " collection TEXT NOT NULL,"
+            " source TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " point_ids TEXT NOT NULL,"
+            " updated REAL NOT NULL,"
+            " PRIMARY KEY (collection, source))"
+        )
+
+    def point_id(self, source: str, index: int = 0) -> str:
+        return point_id(self._collection_name, source, index)
+
+    def get(self, source: str) -> Optional[ManifestEntry]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT source, content_hash, model, point_ids, updated FROM sources"
+                " WHERE collection = ? AND source = ?", (self._collection_name, source)).fetchone()
+        return self._entry(row) if row else None
+
+    def entries(self) -> List[ManifestEntry]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT source, content_hash, model, point_ids, updated FROM sources WHERE collection = ?",
+                (self._collection_name,)).fetchall()
+        return [self._entry(row) for row in rows]
+
+    @staticmethod
+    def _entry(row) -> ManifestEntry:
+        source, digest, model, point_ids, updated = row
+        return ManifestEntry(source=source, content_hash=digest, model=model, point_ids=json.loads(point_ids),
+                             updated=updated)
+
+    def plan(self, content_hashes: Dict[str, str], model: str, scope: str = "") -> IngestionPlan:
+        """
+        Compare the current sources with the manifest.
+
+        :param content_hashes: Every source currently present mapped to the hash of its content.
+        :param model: Embedding model that would be used, a model change invalidates all entries.
+        :param scope: Only recorded sources starting with it can be reported as removed, e.g. one page's sections.
+        :return: Sources to (re)ingest, sources to skip and entries of sources that disappeared.
+        """
+        entries = {entry.source: entry for entry in self.entries()}
+        plan = IngestionPlan()
+
+        for source, digest in content_hashes.items():
+            entry = entries.get(source)
+            if entry and entry.content_hash == digest and entry.model == model:
+                plan.unchanged.append(source)
+            else:
+                plan.pending.append(source)
+
+        plan.removed = [entry for source, entry in entries.items()
+                        if source.startswith(scope) and source not in content_hashes]
+
+        logger.info(f"Ingestion plan for {self._collection_name}: {len(plan.pending)} new or changed, "
+                    f"{len(plan.unchanged)} unchanged, {len(plan.removed)} removed")
+        return plan
+
+    def record(self, source: str, content_hash: str, model: str, point_ids: List[str]) -> List[str]:
+        """
+        Remember a successfully stored source.
+
+        :return: Point ids of the previous version which are not used anymore and should be deleted.
+        """
+        previous = self.get(source)
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO sources (collection, source, content_hash, model, point_ids, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (self._collection_name, source, content_hash, model, json.dumps(point_ids), time.time()))
+        if not previous:
+            return []
+        current = set(point_ids)
+        return [stale for stale in previous.point_ids if stale not in current]
+
+    def remove(self, source: str) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM sources WHERE collection = ? AND source = ?",
+                                     (self._collection_name, source))
+
+    def clear(self) -> None:
+        """
+        Forget every source, e.g. after the collection was recreated.
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM sources WHERE collection = ?", (self._collection_name,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
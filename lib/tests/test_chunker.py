@@ -0,0 +1,79 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from lib.chunker import Chunker, iter_sentences
+
+TEXT = "".join(f"Zdanie numer {i} opisuje fabrykę w sektorze C{i % 7}. " + ("\n" if i % 5 == 4 else "")
+               for i in range(120))
+
+
+class TestChunker(unittest.TestCase):
+
+    def setUp(self):
+        self.chunker = Chunker(max_tokens=40, overlap_tokens=10)
+
+    def assert_chunks_of(self, text: str, chunks: list, max_tokens: int = 40):
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(list(range(len(chunks))), [chunk.index for chunk in chunks])
+        for chunk in chunks:
+            self.assertEqual(chunk.text, text[chunk.start:chunk.end])
+            self.assertLessEqual(chunk.tokens, max_tokens)
+        self.assertEqual(0, chunks[0].start)
+        self.assertEqual(len(text.rstrip()), chunks[-1].end)
+
+    def test_split_text__offsets_and_token_bound(self):
+        self.assert_chunks_of(TEXT, list(self.chunker.split_text(TEXT, "facts.txt")))
+
+    def test_split_text__consecutive_chunks_overlap_without_gaps(self):
+        chunks = list(self.chunker.split_text(TEXT, "facts.txt"))
+
+        for previous, chunk in zip(chunks, chunks[1:]):
+            self.assertLess(chunk.start, previous.end)
+            self.assertGreater(chunk.start, previous.start)
+
+    def test_split_text__no_overlap(self):
+        chunks = list(Chunker(max_tokens=40, overlap_tokens=0).split_text(TEXT, "facts.txt"))
+
+        for previous, chunk in zip(chunks, chunks[1:]):
+            self.assertGreaterEqual(chunk.start, previous.end)
+            self.assertEqual("", TEXT[previous.end:chunk.start].strip())
+
+    def test_split_text__long_sentence_cut_between_words(self):
+        text = " ".join(f"słowo{i}" for i in range(300))
+
+        self.assert_chunks_of(text, list(Chunker(max_tokens=20, overlap_tokens=5).split_text(text, "words.txt")))
+
+    def test_split_text__parent_and_metadata_copied(self):
+        chunk = next(self.chunker.split_text(TEXT, "facts.txt", {"kind": "fact"}))
+
+        self.assertEqual(("facts.txt", {"kind": "fact"}), (chunk.parent, chunk.metadata))
+
+    def test_split_file__same_chunks_as_split_text(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "facts.txt"
+            path.write_text(TEXT, encoding="utf-8")
+
+            # Blocks ending inside sentences and words
+            with mock.patch("lib.chunker.READ_BLOCK_SIZE", 7):
+                from_file = list(self.chunker.split_file(path))
+
+        self.assertEqual(list(self.chunker.split_text(TEXT, "facts.txt")), from_file)
+
+    def test_iter_sentences__join_back_into_input(self):
+        blocks = [TEXT[i:i + 13] for i in range(0, len(TEXT), 13)]
+
+        sentences = list(iter_sentences(blocks))
+
+        self.assertEqual(TEXT, "".join(sentence for _, sentence in sentences))
+        for offset, sentence in sentences:
+            self.assertEqual(sentence, TEXT[offset:offset + len(sentence)])
+
+    def test_init__overlap_not_smaller_than_max_tokens(self):
+        with self.assertRaises(ValueError):
+            Chunker(max_tokens=10, overlap_tokens=10)
+
+
+if __name__ == '__main__':
+    unittest.main()
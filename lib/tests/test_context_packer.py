@@ -0,0 +1,62 @@
+import unittest
+
+from lib.context_packer import ContextPacker
+
+
+def sentence(*words: str) -> str:
+    return " ".join(words)
+
+
+class TestContextPacker(unittest.TestCase):
+
+    def setUp(self):
+        self.packer = ContextPacker(max_tokens=1000)
+        self.fact = sentence("Adam", "pracuje", "w", "fabryce", "w", "sektorze", "C4", "od", "roku", "2020")
+        self.other = sentence("Barbara", "uczy", "informatyki", "w", "szkole", "w", "Grudziądzu", "od", "lat")
+
+    def test_pack__exact_duplicates_skipped(self):
+        packed = self.packer.pack([self.fact, self.fact, self.other])
+
+        self.assertEqual([self.fact, self.other], packed.contents)
+        self.assertEqual(1, packed.duplicates)
+
+    def test_pack__mostly_overlapping_chunk_skipped(self):
+        # 6 of its 7 shingles are in the first chunk
+        overlapping = self.fact + " nadal"
+
+        packed = self.packer.pack([{"content": self.fact, "score": 0.9}, {"content": overlapping, "score": 0.8}])
+
+        self.assertEqual([self.fact], packed.contents)
+        self.assertEqual(1, packed.duplicates)
+
+    def test_pack__ordered_by_score(self):
+        packed = self.packer.pack([{"content": self.fact, "score": 0.1}, {"content": self.other, "score": 0.7}])
+
+        self.assertEqual([self.other, self.fact], packed.contents)
+
+    def test_pack__budget_respected_and_smaller_chunks_fill_up(self):
+        large = sentence(*[f"słowo{index}" for index in range(50)])
+        budget = self.packer.count_tokens(self.fact) + self.packer.count_tokens("\n\n") + self.packer.count_tokens(
+            self.other)
+
+        packed = self.packer.pack([{"content": self.fact, "score": 0.9}, {"content": large, "score": 0.8},
+                                   {"content": self.other, "score": 0.7}], max_tokens=budget)
+
+        self.assertEqual([self.fact, self.other], packed.contents)
+        self.assertEqual(1, packed.dropped)
+        self.assertEqual(budget, packed.tokens)
+        self.assertEqual(self.packer.count_tokens(packed.text), packed.tokens)
+
+    def test_pack__oversized_single_chunk_truncated(self):
+        budget = self.packer.count_tokens(self.fact) - 2
+
+        packed = self.packer.pack([self.fact], max_tokens=budget)
+
+        self.assertEqual(1, len(packed.chunks))
+        self.assertTrue(self.fact.startswith(packed.contents[0]))
+        self.assertLessEqual(packed.tokens, budget)
+        self.assertEqual(0, packed.dropped)
+
+
+if __name__ == '__main__':
+    unittest.main()
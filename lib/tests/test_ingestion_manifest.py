@@ -0,0 +1,80 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from lib.ingestion_manifest import IngestionManifest, content_hash, point_id
+
+
+class TestIngestionManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = str(Path(self.directory.name) / "manifest.sqlite")
+
+    def manifest(self, collection_name: str = "facts") -> IngestionManifest:
+        manifest = IngestionManifest(collection_name, self.path)
+        self.addCleanup(manifest.close)
+        return manifest
+
+    def test_plan__new_changed_unchanged_and_removed_sources(self):
+        manifest = self.manifest()
+        manifest.record("a", content_hash("a"), "model", [manifest.point_id("a")])
+        manifest.record("b", content_hash("b"), "model", [manifest.point_id("b")])
+        manifest.record("c", content_hash("c"), "model", [manifest.point_id("c")])
+
+        plan = manifest.plan({"a": content_hash("a"), "b": content_hash("b2"), "d": content_hash("d")}, "model")
+
+        self.assertEqual(["a"], plan.unchanged)
+        self.assertEqual(["b", "d"], sorted(plan.pending))
+        self.assertEqual(["c"], [entry.source for entry in plan.removed])
+
+    def test_plan__model_change_makes_every_source_pending(self):
+        manifest = self.manifest()
+        manifest.record("a", content_hash("a"), "model", [manifest.point_id("a")])
+
+        plan = manifest.plan({"a": content_hash("a")}, "other-model")
+
+        self.assertEqual(["a"], plan.pending)
+        self.assertEqual([], plan.unchanged)
+
+    def test_plan__removed_sources_limited_to_scope(self):
+        manifest = self.manifest()
+        manifest.record("page1#intro", content_hash("x"), "model", [])
+        manifest.record("page2#intro", content_hash("y"), "model", [])
+
+        plan = manifest.plan({}, "model", scope="page1#")
+
+        self.assertEqual(["page1#intro"], [entry.source for entry in plan.removed])
+
+    def test_plan__collections_do_not_share_entries(self):
+        self.manifest("facts").record("a", content_hash("a"), "model", [])
+
+        plan = self.manifest("reports").plan({"a": content_hash("a")}, "model")
+
+        self.assertEqual(["a"], plan.pending)
+        self.assertEqual([], plan.removed)
+
+    def test_record__returns_point_ids_no_longer_used(self):
+        manifest = self.manifest()
+        ids = [manifest.point_id("a", index) for index in range(3)]
+        manifest.record("a", content_hash("a"), "model", ids)
+
+        stale = manifest.record("a", content_hash("a2"), "model", ids[:1])
+
+        self.assertEqual(ids[1:], stale)
+        self.assertEqual(ids[:1], manifest.get("a").point_ids)
+
+    def test_record__survives_reopening(self):
+        self.manifest().record("a", content_hash("a"), "model", ["id"])
+
+        self.assertEqual(["a"], self.manifest().plan({"a": content_hash("a")}, "model").unchanged)
+
+    def test_point_id__deterministic_per_collection_source_and_index(self):
+        self.assertEqual(point_id("facts", "a", 1), point_id("facts", "a", 1))
+        self.assertNotEqual(point_id("facts", "a", 1), point_id("facts", "a", 2))
+        self.assertNotEqual(point_id("facts", "a"), point_id("reports", "a"))
+
+
+if __name__ == '__main__':
+    unittest.main()
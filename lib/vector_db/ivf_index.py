@@ -0,0 +1,139 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+from logger import logger
+
+# Rows scored per matrix product while assigning, bounds the temporary score matrix
+ASSIGN_BATCH = 65536
+TRAIN_POINTS_PER_LIST = 64
+
+
+@dataclass
+class IvfParams:
+    """
+    :param n_lists: Number of clusters, 4 * sqrt(collection size) at training time if missing.
+    :param nprobe: Clusters scanned per query, higher is slower with better recall.
+    :param train_iterations: k-means iterations.
+    :param min_train_size: The index is built once the collection holds that many vectors,
+                           smaller collections are searched exactly.
+    """
+    n_lists: Optional[int] = None
+    nprobe: int = 16
+    train_iterations: int = 10
+    min_train_size: int = 10_000
+
+
+class IvfIndex:
+    """
+    Inverted-file (IVF-flat) approximate nearest neighbour index over the rows of a vector matrix.
+
+    Rows are clustered by spherical k-means; a query scores only the rows of the `nprobe` clusters
+    whose centroids are closest to it. The index stores one cluster id per row, new rows are assigned
+    incrementally and the per-cluster row lists are rebuilt lazily.
+    """
+
+    def __init__(self, params: IvfParams, centroids: Optional[np.ndarray] = None,
+                 assignments: Optional[np.ndarray] = None):
+        self.params = params
+        self.centroids = centroids
+        self.assignments = assignments if assignments is not None else np.empty(0, dtype=np.int32)
+        self._order: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), ASSIGN_BATCH):
+            batch = np.asarray(vectors[start:start + ASSIGN_BATCH], dtype=np.float32)
+            assignments[start:start + len(batch)] = np.argmax(batch @ self.centroids.T, axis=1)
+        return assignments
+
+    def train(self, vectors: np.ndarray, seed: int = 0) -> None:
+        """
+        Cluster a sample of the rows and assign all of them.
+        """
+        n_lists = self.params.n_lists or max(1, int(4 * np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        rng = np.random.default_rng(seed)
+
+        # k-means needs a few dozen points per cluster, more only slows training down
+        sample_size = min(len(vectors), TRAIN_POINTS_PER_LIST * n_lists)
+        sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))], dtype=np.float32)
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+        for _ in range(self.params.train_iterations):
+            self.centroids = centroids
+            labels = self._assign(sample)
+            counts = np.bincount(labels, minlength=n_lists)
+
+            # Sum rows per cluster in one pass over the sample sorted by cluster, np.add.at is much slower
+            order = np.argsort(labels, kind="stable")
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            filled = np.flatnonzero(counts)
+            sums = np.zeros_like(centroids)
+            sums[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+
+            # Re-seed empty clusters with random sample rows
+            empty = np.flatnonzero(counts == 0)
+            sums[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.where(norms == 0, 1, norms)
+
+        self.centroids = centroids.astype(np.float32)
+        self.assignments = self._assign(vectors)
+        self._order = None
+        logger.info(f"Trained IVF index with {n_lists} lists on {sample_size} of {len(vectors)} vectors")
+
+    def add(self, vectors: np.ndarray) -> None:
+        """
+        Assign rows appended to the end of the matrix.
+        """
+        self.assignments = np.concatenate([self.assignments, self._assign(vectors)])
+        self._order = None
+
+    def update(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        """
+        Re-assign rows overwritten in place.
+        """
+        self.assignments[rows] = self._assign(vectors)
+        self._order = None
+
+    def keep(self, rows) -> None:
+        """
+        Follow a compaction of the matrix to the given rows.
+        """
+        self.assignments = self.assignments[rows]
+        self._order = None
+
+    def _lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._order is None:
+            self._order = np.argsort(self.assignments, kind="stable")
+            counts = np.bincount(self.assignments, minlength=len(self.centroids))
+            self._offsets = np.concatenate([[0], np.cumsum(counts)])
+        return self._order, self._offsets
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """
+        Rows of the clusters closest to the query.
+        """
+        nprobe = min(nprobe or self.params.nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ query
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        order, offsets = self._lists()
+        return np.concatenate([order[offsets[probe]:offsets[probe + 1]] for probe in probes])
+
+    def save(self, path: Path) -> None:
+        with open(path, "wb") as f:
+            np.savez(f, centroids=self.centroids, assignments=self.assignments)
+
+    @classmethod
+    def load(cls, path: Path, params: IvfParams) -> "IvfIndex":
+        data = np.load(path)
+        return cls(params, centroids=data["centroids"], assignments=data["assignments"])
@@ -0,0 +1,168 @@
+import json
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from logger import logger
+from text_utils import remove_diacritics
+
+# Words, plus compounds of them joined by -_./: such as dates, sector codes and file names
+TOKEN_PATTERN = re.compile(r"[0-9a-z]+(?:[-_./:][0-9a-z]+)*")
+
+# Longer words also match by their first letters, a crude stemmer for Polish inflection (kradzież, kradzieży)
+STEM_LENGTH = 6
+
+# BM25 term frequency saturation and document length normalization
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase, diacritic-free tokens. A compound like 2024-01-29 yields itself and its parts,
+    so exact codes rank highest while partial mentions still match. Long words add their stem prefix.
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(remove_diacritics(text).lower()):
+        token = match.group()
+        parts = re.split(r"[-_./:]", token)
+        if len(parts) > 1:
+            tokens.append(token)
+        for part in parts:
+            tokens.append(part)
+            if len(part) > STEM_LENGTH and part.isalpha():
+                tokens.append(part[:STEM_LENGTH] + "*")
+    return tokens
+
+
+class KeywordIndex:
+    """
+    BM25 inverted index over the text of a vector collection, kept next to it so exact terms
+    (dates, codes, names) can be matched where dense vectors rank them badly.
+
+    Term counts per document are stored in SQLite and loaded into in-memory postings on first use.
+    """
+
+    def __init__(self, collection_name: str, path: str):
+        """
+        :param collection_name: Vector collection the index belongs to.
+        :param path: Location of the SQLite database file, ":memory:" for a temporary index.
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._collection_name = collection_name
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " collection TEXT NOT NULL,"
+            " id TEXT NOT NULL,"
+            " terms TEXT NOT NULL,"
+            " PRIMARY KEY (collection, id))"
+        )
+        self._postings: Optional[Dict[str, Dict[str, int]]] = None
+        self._terms: Dict[str, List[str]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._total_length = 0
+
+    def _load(self) -> Dict[str, Dict[str, int]]:
+        if self._postings is None:
+            self._postings = defaultdict(dict)
+            rows = self._connection.execute("SELECT id, terms FROM documents WHERE collection = ?",
+                                            (self._collection_name,)).fetchall()
+            for key, terms in rows:
+                self._index(key, json.loads(terms))
+            logger.info(f"Loaded keyword index of '{self._collection_name}' with {len(rows)} documents")
+        return self._postings
+
+    def _index(self, key: str, terms: Dict[str, int]) -> None:
+        for term, frequency in terms.items():
+            self._postings[term][key] = frequency
+        length = sum(terms.values())
+        self._terms[key] = list(terms)
+        self._lengths[key] = length
+        self._total_length += length
+
+    def _unindex(self, key: str) -> None:
+        if key not in self._lengths:
+            return
+        for term in self._terms.pop(key):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(key)
+
+    def add(self, documents: Iterable[Tuple[Any, str]]) -> None:
+        """
+        Index or re-index documents.
+
+        :param documents: (point id, text) pairs.
+        """
+        with self._lock:
+            self._load()
+            # Ids are stored as JSON to tell integer ids from string ones, the last text of an id wins
+            texts = {json.dumps(point_id): text for point_id, text in documents}
+            rows = []
+            for key, text in texts.items():
+                terms = dict(Counter(tokenize(text)))
+                self._unindex(key)
+                self._index(key, terms)
+                rows.append((self._collection_name, key, json.dumps(terms)))
+            self._connection.executemany("INSERT OR REPLACE INTO documents (collection, id, terms) VALUES (?, ?, ?)",
+                                         rows)
+
+    def remove(self, point_ids: Iterable[Any]) -> None:
+        with self._lock:
+            self._load()
+            keys = [json.dumps(point_id) for point_id in point_ids]
+            for key in keys:
+                self._unindex(key)
+            self._connection.executemany("DELETE FROM documents WHERE collection = ? AND id = ?",
+                                         [(self._collection_name, key) for key in keys])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM documents WHERE collection = ?", (self._collection_name,))
+            self._postings, self._terms, self._lengths, self._total_length = None, {}, {}, 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._lengths)
+
+    def search(self, query: str, top_k: int) -> List[Dict[str, Any]]:
+        """
+        Rank documents by BM25.
+
+        :return: Up to top_k dictionaries with 'id' and 'score', best first. Documents sharing no term are left out.
+        """
+        with self._lock:
+            postings = self._load()
+            documents = len(self._lengths)
+            if not documents or top_k <= 0:
+                return []
+
+            average_length = self._total_length / documents
+            scores: Dict[str, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                matches = postings.get(term)
+                if not matches:
+                    continue
+                idf = math.log(1 + (documents - len(matches) + 0.5) / (len(matches) + 0.5))
+                for key, frequency in matches.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[key] / average_length)
+                    scores[key] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [{"id": json.loads(key), "score": score} for key, score in best]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,354 @@
+import itertools
+import json
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import List, Dict, Any, Iterable, Optional
+
+import numpy as np
+
+from logger import logger
+from .ivf_index import IvfIndex, IvfParams
+from .vector_db import VectorDb, BulkUploadStats, query_embeddings
+
+SUPPORTED_METRICS = ("cosine", "dot")
+
+
+@dataclass
+class _Collection:
+    distance: str
+    vector_size: int
+    # Read-only memory map right after loading, replaced by an in-memory copy on the first write
+    vectors: np.ndarray
+    ids: List[Any] = field(default_factory=list)
+    payloads: List[dict] = field(default_factory=list)
+    rows: Dict[Any, int] = field(default_factory=dict)
+    ivf_params: Optional[IvfParams] = None
+    index: Optional[IvfIndex] = None
+    # Names the vector and index files that belong to the current payloads.json
+    generation: int = 0
+
+
+def _generation_file(directory: Path, stem: str, suffix: str, generation: int) -> Path:
+    # Generation 0 are the files of collections saved before generations existed
+    return directory / (f"{stem}.{generation}{suffix}" if generation else f"{stem}{suffix}")
+
+
+def _matches(payload: dict, payload_filter: Dict[str, Any]) -> bool:
+    # A list value matches any of its elements
+    for key, expected in payload_filter.items():
+        value = payload.get(key)
+        if isinstance(expected, (list, tuple, set)):
+            if value not in expected:
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+class NumpyDb(VectorDb):
+    """
+    Embedded vector store for small collections, no server needed.
+
+    Every collection is a contiguous float32 matrix (rows normalized for cosine) searched with one
+    matrix-vector product and argpartition. It is persisted as `vectors.<generation>.npy` plus a
+    `payloads.json` sidecar naming the generation and memory-mapped on load, so opening a collection costs
+    milliseconds and no copy.
+
+    Collections created with IvfParams get an IVF approximate index once they are large enough,
+    queries then score only the rows of the closest clusters (see `nprobe`).
+    """
+
+    def __init__(self, path: str = ".cache/vector_db"):
+        """
+        :param path: Directory holding one subdirectory per collection.
+        """
+        super().__init__()
+        self._path = Path(path)
+        self._collections: Dict[str, _Collection] = {}
+        self._lock = threading.RLock()
+
+    def _collection_dir(self, collection_name: str) -> Path:
+        return self._path / collection_name
+
+    def _keyword_index_path(self, collection_name: str) -> Path:
+        return self._collection_dir(collection_name) / "keywords.sqlite"
+
+    def _load(self, collection_name: str) -> Optional[_Collection]:
+        if collection_name in self._collections:
+            return self._collections[collection_name]
+
+        directory = self._collection_dir(collection_name)
+        if not (directory / "payloads.json").exists():
+            return None
+
+        with open(directory / "payloads.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        generation = meta.get("generation", 0)
+        vectors = np.load(_generation_file(directory, "vectors", ".npy", generation), mmap_mode="r")
+        collection = _Collection(distance=meta["distance"], vector_size=meta["vector_size"], vectors=vectors,
+                                 ids=meta["ids"], payloads=meta["payloads"], generation=generation)
+        collection.rows = {point_id: row for row, point_id in enumerate(collection.ids)}
+        if meta.get("ivf"):
+            collection.ivf_params = IvfParams(**meta["ivf"])
+            index_path = _generation_file(directory, "ivf", ".npz", generation)
+            if index_path.exists():
+                collection.index = IvfIndex.load(index_path, collection.ivf_params)
+        self._collections[collection_name] = collection
+        logger.info(f"Loaded collection '{collection_name}' with {len(collection.ids)} vectors")
+        return collection
+
+    def _get(self, collection_name: str) -> _Collection:
+        collection = self._load(collection_name)
+        if collection is None:
+            raise ValueError(f"Collection '{collection_name}' does not exist")
+        return collection
+
+    def _save(self, collection_name: str, collection: _Collection) -> None:
+        directory = self._collection_dir(collection_name)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        # The vectors and index go to files of a new generation, replacing payloads.json then switches
+        # all of them at once, so a crash leaves either the old or the new collection, never a mix
+        generation = collection.generation + 1
+        current = {_generation_file(directory, "vectors", ".npy", generation)}
+        with open(_generation_file(directory, "vectors", ".npy", generation), "wb") as f:
+            np.save(f, collection.vectors)
+        if collection.index:
+            current.add(_generation_file(directory, "ivf", ".npz", generation))
+            collection.index.save(_generation_file(directory, "ivf", ".npz", generation))
+        with open(directory / "payloads.json.tmp", "w", encoding="utf-8") as f:
+            json.dump({"distance": collection.distance, "vector_size": collection.vector_size,
+                       "ivf": asdict(collection.ivf_params) if collection.ivf_params else None,
+                       "generation": generation, "ids": collection.ids, "payloads": collection.payloads},
+                      f, ensure_ascii=False)
+        os.replace(directory / "payloads.json.tmp", directory / "payloads.json")
+        collection.generation = generation
+
+        for stale in [*directory.glob("vectors*.npy"), *directory.glob("ivf*.npz")]:
+            if stale not in current:
+                try:
+                    stale.unlink()
+                except OSError as e:
+                    # e.g. still memory-mapped on Windows, the next save retries
+                    logger.debug(f"Could not remove {stale}: {e}")
+
+    def _prepare(self, collection: _Collection, vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(-1, collection.vector_size)
+        if collection.distance == "cosine":
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms == 0, 1, norms)
+        return matrix
+
+    def initialize_collection(self, collection_name: str, vector_size: int = 1536, distance_metric: str = "cosine",
+                              recreate=False, ivf: Optional[IvfParams] = None, keywords: bool = False) -> None:
+        """
+        Load the collection from disk or create it.
+
+        :param ivf: Parameters of an approximate IVF index for large collections, exact search if missing.
+        :param keywords: Keep a keyword index for `hybrid_retrieve`. Added to an existing collection empty,
+                         only vectors stored from then on are indexed.
+        """
+        distance = distance_metric.lower()
+        if distance not in SUPPORTED_METRICS:
+            raise ValueError(f"Unsupported distance metric {distance_metric}, use one of {SUPPORTED_METRICS}")
+
+        with self._lock:
+            if self.collection_exists(collection_name) and recreate:
+                self.delete_collection(collection_name)
+            if not self.collection_exists(collection_name):
+                collection = _Collection(distance=distance, vector_size=vector_size,
+                                         vectors=np.empty((0, vector_size), dtype=np.float32), ivf_params=ivf)
+                self._collections[collection_name] = collection
+                self._save(collection_name, collection)
+
+            if keywords:
+                self._create_keyword_index(collection_name)
+
+    def collection_exists(self, collection_name: str) -> bool:
+        with self._lock:
+            return self._load(collection_name) is not None
+
+    def is_collection_empty(self, collection_name: str) -> bool:
+        with self._lock:
+            collection = self._load(collection_name)
+            return collection is None or not collection.ids
+
+    def store_vectors(self, collection_name: str, vectors: List[Dict[str, Any]]) -> None:
+        """
+        Upsert vectors, existing ids are overwritten in place.
+        """
+        if not vectors:
+            return
+
+        with self._lock:
+            collection = self._get(collection_name)
+            self._upsert(collection, vectors, self._prepare(collection, [vector["vector"] for vector in vectors]))
+            self._save(collection_name, collection)
+            self._index_keywords(collection_name, vectors)
+
+    def store_vectors_bulk(self, collection_name: str, vectors: Iterable[Dict[str, Any]],
+                           batch_size: int = 256) -> BulkUploadStats:
+        """
+        Store a stream of vectors with one write of the collection, instead of one per batch.
+        Batches bound the vector dictionaries held at a time, the matrix is kept in memory anyway.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            collection = self._get(collection_name)
+            points, matrices = [], []
+            iterator = iter(vectors)
+            while batch := list(itertools.islice(iterator, batch_size)):
+                matrices.append(self._prepare(collection, [vector["vector"] for vector in batch]))
+                points.extend({"id": vector["id"], "payload": vector.get("payload", {})} for vector in batch)
+
+            if points:
+                self._upsert(collection, points, np.concatenate(matrices))
+                self._save(collection_name, collection)
+                self._index_keywords(collection_name, points)
+
+        stats = BulkUploadStats(points=len(points), seconds=time.perf_counter() - start)
+        logger.info(f"Stored {stats.points} vectors in '{collection_name}' in {stats.seconds:.2f}s "
+                    f"({stats.points_per_second:.0f} points/s)")
+        return stats
+
+    def _upsert(self, collection: _Collection, vectors: List[Dict[str, Any]], matrix: np.ndarray) -> None:
+        # The last vector of an id repeated within the batch wins
+        last_rows = {vector["id"]: row for row, vector in enumerate(vectors)}
+        if len(last_rows) < len(vectors):
+            keep = sorted(last_rows.values())
+            vectors, matrix = [vectors[row] for row in keep], matrix[keep]
+
+        # The memory map is read-only, copy once and append all new rows in one go
+        updated = np.array(collection.vectors, dtype=np.float32)
+        new_rows, overwritten_rows, overwritten = [], [], []
+        for vector, row_vector in zip(vectors, matrix):
+            row = collection.rows.get(vector["id"])
+            if row is None:
+                collection.rows[vector["id"]] = len(collection.ids)
+                collection.ids.append(vector["id"])
+                collection.payloads.append(vector.get("payload", {}))
+                new_rows.append(row_vector)
+            else:
+                updated[row] = row_vector
+                collection.payloads[row] = vector.get("payload", {})
+                overwritten_rows.append(row)
+                overwritten.append(row_vector)
+
+        if new_rows:
+            updated = np.concatenate([updated, np.stack(new_rows)])
+        collection.vectors = np.ascontiguousarray(updated)
+
+        if collection.index:
+            if overwritten_rows:
+                collection.index.update(np.array(overwritten_rows), np.stack(overwritten))
+            if new_rows:
+                collection.index.add(np.stack(new_rows))
+        elif collection.ivf_params and len(collection.ids) >= collection.ivf_params.min_train_size:
+            self._build_index(collection)
+
+    @staticmethod
+    def _build_index(collection: _Collection) -> None:
+        collection.index = IvfIndex(collection.ivf_params)
+        collection.index.train(collection.vectors)
+
+    def rebuild_index(self, collection_name: str) -> None:
+        """
+        Re-cluster the IVF index, worth it after the collection grew several times since it was built.
+        """
+        with self._lock:
+            collection = self._get(collection_name)
+            if not collection.ivf_params:
+                raise ValueError(f"Collection '{collection_name}' was created without an IVF index")
+            if collection.ids:
+                self._build_index(collection)
+                self._save(collection_name, collection)
+
+    def delete_vectors(self, collection_name: str, ids: List[Any]) -> None:
+        with self._lock:
+            collection = self._get(collection_name)
+            doomed = {collection.rows[point_id] for point_id in ids if point_id in collection.rows}
+            if not doomed:
+                return
+
+            keep = [row for row in range(len(collection.ids)) if row not in doomed]
+            collection.vectors = np.ascontiguousarray(collection.vectors[keep], dtype=np.float32)
+            collection.ids = [collection.ids[row] for row in keep]
+            collection.payloads = [collection.payloads[row] for row in keep]
+            collection.rows = {point_id: row for row, point_id in enumerate(collection.ids)}
+            if collection.index:
+                collection.index.keep(keep)
+            self._save(collection_name, collection)
+            self._unindex_keywords(collection_name, ids)
+
+    def retrieve_payloads(self, collection_name: str, ids: List[Any]) -> Dict[Any, dict]:
+        with self._lock:
+            collection = self._get(collection_name)
+            return {point_id: collection.payloads[collection.rows[point_id]]
+                    for point_id in ids if point_id in collection.rows}
+
+    def search_vectors(self, collection_name: str, query_vector: List[float], top_k: int,
+                       payload_filter: Optional[Dict[str, Any]] = None,
+                       nprobe: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Top-k search, exact unless the collection has a trained IVF index.
+
+        :param payload_filter: Only points whose payload has all the given values, a list value matches any element.
+                               With an IVF index it is applied within the probed clusters.
+        :param nprobe: Clusters scanned with an IVF index, overrides the collection's default.
+        """
+        with self._lock:
+            collection = self._get(collection_name)
+            vectors, ids, payloads, index = collection.vectors, collection.ids, collection.payloads, collection.index
+            query = self._prepare(collection, query_vector)[0]
+            # Sorted rows keep the gather from the memory map sequential
+            rows = np.sort(index.candidates(query, nprobe)) if index and ids else None
+
+        if not ids or top_k <= 0:
+            return []
+
+        if rows is None:
+            scores = vectors @ query
+            rows = np.arange(len(ids))
+        else:
+            scores = vectors[rows] @ query
+
+        if payload_filter:
+            mask = np.fromiter((_matches(payloads[row], payload_filter) for row in rows), dtype=bool, count=len(rows))
+            scores, rows = scores[mask], rows[mask]
+
+        top_k = min(top_k, len(rows))
+        if top_k == 0:
+            return []
+
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [{"id": ids[rows[i]], "score": float(scores[i]), "payload": payloads[rows[i]]} for i in best]
+
+    def delete_collection(self, collection_name: str) -> None:
+        with self._lock:
+            self._collections.pop(collection_name, None)
+            self._drop_keyword_index(collection_name)
+            shutil.rmtree(self._collection_dir(collection_name), ignore_errors=True)
+
+    def retrieve_contexts(self, collection_name: str, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Embed the query and retrieve relevant contexts from the collection.
+        """
+        return self.retrieve_contexts_batch(collection_name, [query], top_k)[0]
+
+    def retrieve_contexts_batch(self, collection_name: str, queries: List[str],
+                                top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        Embed all queries in one request, recently seen queries come from memory, and search each of them.
+        """
+        query_vectors = query_embeddings.embed(queries)
+        return [
+            [{"content": result["payload"].get("content", ""), "filename": result["payload"].get("filename", ""),
+              "score": result["score"]}
+             for result in self.search_vectors(collection_name, query_vector, top_k)]
+            for query_vector in query_vectors
+        ]
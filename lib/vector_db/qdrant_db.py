@@ -1,51 +1,155 @@
-from typing import List, Dict, Any
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+from urllib.parse import urlparse
 
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import VectorParams, PointStruct
+from qdrant_client.http.models import VectorParams, PointStruct, PointIdsList, QueryRequest, HnswConfigDiff, \
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType, BinaryQuantization, BinaryQuantizationConfig, \
+    SearchParams, QuantizationSearchParams, Filter, FieldCondition, MatchValue, MatchAny
 
-from openai_client import OpenAIClient
-from .vector_db import VectorDb
+from logger import logger
+from .vector_db import VectorDb, BulkUploadStats, query_embeddings
 
-openai_client = OpenAIClient()
+# Points per upload request and a reasonable number of uploading worker processes for store_vectors_bulk
+UPLOAD_BATCH_SIZE = 256
+UPLOAD_PARALLEL = 4
+
+QUANTIZATIONS = ("scalar", "binary")
+
+# Keyword indexes of Qdrant collections live locally, one directory per Qdrant instance
+KEYWORD_INDEX_DIR = ".cache/qdrant_keyword_index"
+
+
+@dataclass
+class QdrantParams:
+    """
+    Storage and index settings of a collection, Qdrant's defaults where missing.
+
+    Scalar quantization keeps an int8 copy of every vector in RAM (4x smaller than float32) and binary
+    quantization a 1-bit copy (32x smaller, meant for high-dimensional embeddings like ada's). Searches
+    run on the quantized copy and rescore the best `oversampling * top_k` candidates with the original
+    vectors, which can live on disk.
+
+    :param quantization: "scalar", "binary" or None.
+    :param oversampling: Candidates rescored per requested result on a quantized collection.
+    :param on_disk: Keep original vectors and payloads on disk, only the quantized vectors and the HNSW graph stay in RAM.
+    :param hnsw_m: Edges per node of the HNSW graph, more is better recall and more memory.
+    :param hnsw_ef_construct: Neighbours considered while building the graph, more is better recall and slower indexing.
+    :param payload_indexes: Payload field to index mapped to its schema ("keyword", "integer", "text", ...),
+                            needed for fast filtered searches.
+    """
+    quantization: Optional[str] = None
+    oversampling: float = 2.0
+    on_disk: bool = False
+    hnsw_m: Optional[int] = None
+    hnsw_ef_construct: Optional[int] = None
+    payload_indexes: Dict[str, str] = field(default_factory=dict)
+
+
+def _payload_filter(payload_filter: Optional[Dict[str, Any]]) -> Optional[Filter]:
+    # A list value matches any of its elements, like in NumpyDb
+    if not payload_filter:
+        return None
+    return Filter(must=[
+        FieldCondition(key=key, match=MatchAny(any=list(value)) if isinstance(value, (list, tuple, set))
+                       else MatchValue(value=value))
+        for key, value in payload_filter.items()
+    ])
 
 
 class QdrantDb(VectorDb):
-    def __init__(self, url: str = "http://localhost:6333"):
+    def __init__(self, url: str = "http://localhost:6333", keyword_index_dir: str = KEYWORD_INDEX_DIR):
         """
         Initialize the Qdrant client.
 
         :param url: URL of the Qdrant instance.
+        :param keyword_index_dir: Directory of the keyword indexes, kept apart per Qdrant instance.
         """
+        super().__init__()
         self.client = QdrantClient(url=url)
+        self._search_params: Dict[str, Optional[SearchParams]] = {}
+        self._keyword_index_dir = Path(keyword_index_dir) / re.sub(r"\W", "_", urlparse(url).netloc or url)
+
+    def _keyword_index_path(self, collection_name: str) -> Path:
+        return self._keyword_index_dir / f"{collection_name}.sqlite"
 
     def initialize_collection(self, collection_name: str, vector_size: int = 1536, distance_metric: str = "cosine",
-                              recreate=False) -> None:
+                              recreate=False, params: Optional[QdrantParams] = None, keywords: bool = False) -> None:
         """
         Initialize a collection in Qdrant.
+
+        :param params: Quantization, on-disk storage, HNSW and payload index settings, used when the collection
+                       is created. Payload indexes are also added to an existing collection.
+        :param keywords: Keep a local keyword index for `hybrid_retrieve`. Added to an existing collection empty,
+                         only vectors stored from then on are indexed.
         """
+        params = params or QdrantParams()
+        if params.quantization not in (None, *QUANTIZATIONS):
+            raise ValueError(f"Unsupported quantization {params.quantization}, use one of {QUANTIZATIONS}")
 
         if self.collection_exists(collection_name=collection_name):
             if recreate:
                 self.delete_collection(collection_name=collection_name)
-                self.client.create_collection(
-                    collection_name=collection_name,
-                    vectors_config=VectorParams(size=vector_size, distance=distance_metric.capitalize())
-                )
+                self._create_collection(collection_name, vector_size, distance_metric, params)
         else:
-            self.client.create_collection(
-                collection_name=collection_name,
-                vectors_config=VectorParams(size=vector_size, distance=distance_metric.capitalize())
-            )
+            self._create_collection(collection_name, vector_size, distance_metric, params)
+
+        for field_name, field_schema in params.payload_indexes.items():
+            self.client.create_payload_index(collection_name=collection_name, field_name=field_name,
+                                             field_schema=field_schema)
+
+        if keywords:
+            self._create_keyword_index(collection_name)
+
+    def _create_collection(self, collection_name: str, vector_size: int, distance_metric: str,
+                           params: QdrantParams) -> None:
+        quantization_config = None
+        if params.quantization == "scalar":
+            quantization_config = ScalarQuantization(
+                scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+        elif params.quantization == "binary":
+            quantization_config = BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+
+        hnsw_config = None
+        if params.hnsw_m is not None or params.hnsw_ef_construct is not None:
+            hnsw_config = HnswConfigDiff(m=params.hnsw_m, ef_construct=params.hnsw_ef_construct)
+
+        self.client.create_collection(
+            collection_name=collection_name,
+            vectors_config=VectorParams(size=vector_size, distance=distance_metric.capitalize(),
+                                        on_disk=params.on_disk or None),
+            on_disk_payload=params.on_disk or None,
+            hnsw_config=hnsw_config,
+            quantization_config=quantization_config
+        )
+        self._search_params[collection_name] = self._quantized_search(params.oversampling) \
+            if quantization_config else None
+        logger.info(f"Created Qdrant collection '{collection_name}' ({params.quantization or 'no'} quantization, "
+                    f"on_disk={params.on_disk})")
+
+    @staticmethod
+    def _quantized_search(oversampling: float) -> SearchParams:
+        return SearchParams(quantization=QuantizationSearchParams(rescore=True, oversampling=oversampling))
+
+    def _collection_search_params(self, collection_name: str) -> Optional[SearchParams]:
+        # Collections created by an earlier run are looked up once
+        if collection_name not in self._search_params:
+            config = self.client.get_collection(collection_name).config
+            self._search_params[collection_name] = self._quantized_search(QdrantParams.oversampling) \
+                if config.quantization_config else None
+        return self._search_params[collection_name]
 
     def collection_exists(self, collection_name: str) -> bool:
         """
         Check if a collection exists in Qdrant.
         """
         try:
-            collections = self.client.get_collections().collections
-            return any(collection.name == collection_name for collection in collections)
+            return self.client.collection_exists(collection_name)
         except Exception as e:
-            print(f"Error checking collection existence: {e}")
+            logger.error(f"Error checking collection existence: {e}")
             return False
 
     def is_collection_empty(self, collection_name: str) -> bool:
@@ -64,25 +168,87 @@ class QdrantDb(VectorDb):
 
     def store_vectors(self, collection_name: str, vectors: List[Dict[str, Any]]) -> None:
         """
-        Store vectors in Qdrant.
+        Store vectors in Qdrant, in batches once there are more than fit in one request.
+        Uploads from this process only, see store_vectors_bulk for parallel workers.
         """
-        points = [
-            PointStruct(
-                id=vector["id"],
-                vector=vector["vector"],
-                payload=vector.get("payload", {})
-            )
-            for vector in vectors
-        ]
-        self.client.upsert(collection_name=collection_name, points=points)
+        if vectors:
+            self.store_vectors_bulk(collection_name, vectors, parallel=1)
+
+    def store_vectors_bulk(self, collection_name: str, vectors: Iterable[Dict[str, Any]],
+                           batch_size: int = UPLOAD_BATCH_SIZE, parallel: int = 1) -> BulkUploadStats:
+        """
+        Stream vectors to Qdrant in batches, optionally uploaded by parallel worker processes.
+
+        Batches are sent without waiting for them to be applied; a final upsert with wait=True acts as a
+        barrier, since Qdrant applies the updates of a collection in order.
+
+        Worker processes are started with spawn/forkserver and re-import the main module, so with parallel > 1
+        the calling script must keep its work under `if __name__ == "__main__":`, otherwise every worker runs
+        the whole script again.
 
-    def search_vectors(self, collection_name: str, query_vector: List[float], top_k: int) -> List[Dict[str, Any]]:
+        :param batch_size: Points per upload request.
+        :param parallel: Number of worker processes uploading batches at the same time, e.g. UPLOAD_PARALLEL.
+        :return: Number of stored points and the time it took.
+        """
+        start = time.perf_counter()
+        uploaded = 0
+        last_point = None
+        index_keywords = self.has_keyword_index(collection_name)
+
+        def points() -> Iterator[PointStruct]:
+            # Consumed lazily by upload_points, only a few batches are held in memory at a time
+            nonlocal uploaded, last_point
+            keywords = []
+            for vector in vectors:
+                last_point = PointStruct(id=vector["id"], vector=vector["vector"], payload=vector.get("payload", {}))
+                uploaded += 1
+                if index_keywords:
+                    keywords.append(vector)
+                    if len(keywords) == batch_size:
+                        self._index_keywords(collection_name, keywords)
+                        keywords = []
+                yield last_point
+            self._index_keywords(collection_name, keywords)
+
+        self.client.upload_points(collection_name=collection_name, points=points(), batch_size=batch_size,
+                                  parallel=parallel, wait=False)
+        if last_point is not None:
+            self.client.upsert(collection_name=collection_name, points=[last_point], wait=True)
+
+        stats = BulkUploadStats(points=uploaded, seconds=time.perf_counter() - start)
+        logger.info(f"Uploaded {stats.points} points to '{collection_name}' in {stats.seconds:.2f}s "
+                    f"({stats.points_per_second:.0f} points/s)")
+        return stats
+
+    def delete_vectors(self, collection_name: str, ids: List[Any]) -> None:
+        """
+        Delete vectors by id in Qdrant.
+        """
+        if ids:
+            self.client.delete(collection_name=collection_name, points_selector=PointIdsList(points=list(ids)))
+            self._unindex_keywords(collection_name, ids)
+
+    def retrieve_payloads(self, collection_name: str, ids: List[Any]) -> Dict[Any, dict]:
+        """
+        Fetch payloads by id in one request to Qdrant.
+        """
+        if not ids:
+            return {}
+        points = self.client.retrieve(collection_name=collection_name, ids=list(ids), with_payload=True)
+        return {point.id: point.payload for point in points}
+
+    def search_vectors(self, collection_name: str, query_vector: List[float], top_k: int,
+                       payload_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
         Search vectors in Qdrant.
+
+        :param payload_filter: Only points whose payload has all the given values, a list value matches any element.
         """
         results = self.client.search(
             collection_name=collection_name,
             query_vector=query_vector,
+            query_filter=_payload_filter(payload_filter),
+            search_params=self._collection_search_params(collection_name),
             limit=top_k
         )
         return [
@@ -90,25 +256,55 @@ class QdrantDb(VectorDb):
             for result in results
         ]
 
+    def search_vectors_batch(self, collection_name: str, query_vectors: List[List[float]],
+                             top_k: int) -> List[List[Dict[str, Any]]]:
+        """
+        Search all query vectors in one request to Qdrant.
+        """
+        if not query_vectors:
+            return []
+
+        search_params = self._collection_search_params(collection_name)
+        responses = self.client.query_batch_points(
+            collection_name=collection_name,
+            requests=[QueryRequest(query=query_vector, limit=top_k, params=search_params, with_payload=True)
+                      for query_vector in query_vectors]
+        )
+        return [
+            [{"id": point.id, "score": point.score, "payload": point.payload} for point in response.points]
+            for response in responses
+        ]
+
     def delete_collection(self, collection_name: str) -> None:
         """
         Delete a collection in Qdrant.
         """
         self.client.delete_collection(collection_name=collection_name)
+        self._search_params.pop(collection_name, None)
+        self._drop_keyword_index(collection_name)
 
     def retrieve_contexts(self, collection_name: str, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """
         Embed the query and retrieve relevant contexts (text, images, or audio) from Qdrant.
         """
-        # Generate the query embedding
-        query_vector = openai_client.embed_text(query)
+        return self.retrieve_contexts_batch(collection_name, [query], top_k)[0]
+
+    def retrieve_contexts_batch(self, collection_name: str, queries: List[str],
+                                top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        Embed all queries in one request (recently seen queries come from memory) and retrieve
+        the contexts of every query in one round-trip to Qdrant.
+        """
+        # Generate the query embeddings
+        query_vectors = query_embeddings.embed(queries)
 
-        # Retrieve the top-k most relevant vectors from Qdrant
-        results = self.search_vectors(collection_name, query_vector, top_k)
+        # Retrieve the top-k most relevant vectors per query from Qdrant
+        results = self.search_vectors_batch(collection_name, query_vectors, top_k)
 
         # Format the results to include content and relevance score
         return [
-            {"content": result["payload"].get("content", ""), "filename": result["payload"].get("filename", ""),
-             "score": result["score"]}
-            for result in results
+            [{"content": result["payload"].get("content", ""), "filename": result["payload"].get("filename", ""),
+              "score": result["score"]}
+             for result in query_results]
+            for query_results in results
         ]
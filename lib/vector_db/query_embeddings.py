@@ -0,0 +1,34 @@
+from typing import List
+
+from lib.lru_cache import LRUCache
+from openai_client import OpenAIClient, EMBEDDING_MODEL
+
+# Distinct query strings kept in memory, 1536 floats each
+QUERY_CACHE_SIZE = 1024
+
+
+class QueryEmbeddings:
+    """
+    Embeds search queries, all cache misses in one request, and keeps the vectors of recent queries
+    in a bounded LRU so repeated questions skip the embedding call entirely.
+    """
+
+    def __init__(self, openai_client: OpenAIClient = None, maxsize: int = QUERY_CACHE_SIZE,
+                 model_name: str = EMBEDDING_MODEL):
+        self._openai_client = openai_client or OpenAIClient()
+        self._model_name = model_name
+        self.cache: LRUCache[str, List[float]] = LRUCache(maxsize)
+
+    def embed(self, queries: List[str]) -> List[List[float]]:
+        """
+        :return: One vector per query, in input order.
+        """
+        vectors = {query: self.cache.get(query) for query in dict.fromkeys(queries)}
+        missing = [query for query, vector in vectors.items() if vector is None]
+
+        if missing:
+            for query, vector in zip(missing, self._openai_client.embed_texts(missing, model_name=self._model_name)):
+                vectors[query] = vector.tolist()
+                self.cache.put(query, vectors[query])
+
+        return [vectors[query] for query in queries]
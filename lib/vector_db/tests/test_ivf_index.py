@@ -0,0 +1,90 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from lib.vector_db.ivf_index import IvfIndex, IvfParams
+from lib.vector_db.numpy_db import NumpyDb
+
+
+def clustered_vectors(count: int, dimensions: int = 16, clusters: int = 20, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions))
+    vectors = centers[rng.integers(clusters, size=count)] + 0.1 * rng.normal(size=(count, dimensions))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+class TestIvfIndex(unittest.TestCase):
+
+    def test_candidates__cover_every_row_when_probing_all_lists(self):
+        vectors = clustered_vectors(500)
+        index = IvfIndex(IvfParams(n_lists=8))
+        index.train(vectors)
+
+        self.assertEqual(list(range(500)), sorted(index.candidates(vectors[0], nprobe=8)))
+
+    def test_keep__follows_compaction(self):
+        vectors = clustered_vectors(100)
+        index = IvfIndex(IvfParams(n_lists=4))
+        index.train(vectors)
+        assignments = index.assignments.copy()
+
+        index.keep([1, 5, 7])
+
+        self.assertEqual(list(assignments[[1, 5, 7]]), list(index.assignments))
+
+    def test_save__loads_same_index(self):
+        vectors = clustered_vectors(200)
+        index = IvfIndex(IvfParams(n_lists=6))
+        index.train(vectors)
+
+        with tempfile.TemporaryDirectory() as directory:
+            index.save(Path(directory) / "ivf.npz")
+            loaded = IvfIndex.load(Path(directory) / "ivf.npz", index.params)
+
+        np.testing.assert_array_equal(index.centroids, loaded.centroids)
+        np.testing.assert_array_equal(index.assignments, loaded.assignments)
+
+
+class TestNumpyDbIvf(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = self.directory.name
+        self.vectors = clustered_vectors(2000)
+        self.db = NumpyDb(self.path)
+        self.db.initialize_collection("facts", vector_size=16, ivf=IvfParams(nprobe=8, min_train_size=1000))
+        self.db.store_vectors_bulk("facts", ({"id": row, "vector": vector, "payload": {}}
+                                             for row, vector in enumerate(self.vectors)))
+
+    def recall(self, db: NumpyDb, top_k: int = 10) -> float:
+        queries = clustered_vectors(50, seed=1)
+        found = 0
+        for query in queries:
+            exact = set(np.argsort(-(self.vectors @ query))[:top_k])
+            approximate = {result["id"] for result in db.search_vectors("facts", query, top_k)}
+            found += len(exact & approximate)
+        return found / (len(queries) * top_k)
+
+    def test_search_vectors__recall_close_to_exact_search(self):
+        self.assertIsNotNone(self.db._get("facts").index)
+        self.assertGreaterEqual(self.recall(self.db), 0.9)
+
+    def test_search_vectors__index_reloaded_from_disk(self):
+        db = NumpyDb(self.path)
+
+        self.assertIsNotNone(db._get("facts").index)
+        self.assertGreaterEqual(self.recall(db), 0.9)
+
+    def test_search_vectors__small_collection_searched_exactly(self):
+        self.db.initialize_collection("small", vector_size=16, ivf=IvfParams(min_train_size=1000))
+        self.db.store_vectors("small", [{"id": 0, "vector": self.vectors[0]}])
+
+        self.assertIsNone(self.db._get("small").index)
+        self.assertEqual(0, self.db.search_vectors("small", self.vectors[0], 1)[0]["id"])
+
+
+if __name__ == '__main__':
+    unittest.main()
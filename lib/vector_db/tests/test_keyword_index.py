@@ -0,0 +1,135 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from lib.vector_db.keyword_index import KeywordIndex, tokenize
+from lib.vector_db.numpy_db import NumpyDb
+from lib.vector_db.vector_db import query_embeddings, reciprocal_rank_fusion
+
+
+class TestTokenize(unittest.TestCase):
+
+    def test_tokenize__compound_yields_itself_and_parts(self):
+        self.assertEqual(["2024-01-29", "2024", "01", "29"], tokenize("2024-01-29"))
+
+    def test_tokenize__diacritics_removed_and_long_words_stemmed(self):
+        self.assertEqual(["kradziez", "kradzi*", "auta"], tokenize("Kradzież auta"))
+
+
+class TestKeywordIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = str(Path(self.directory.name) / "keywords.sqlite")
+
+    def index(self, collection_name: str = "facts") -> KeywordIndex:
+        index = KeywordIndex(collection_name, self.path)
+        self.addCleanup(index.close)
+        return index
+
+    def ids(self, index: KeywordIndex, query: str) -> list:
+        return [result["id"] for result in index.search(query, 5)]
+
+    def test_search__ranks_rarer_and_more_frequent_terms_higher(self):
+        index = self.index()
+        index.add([(1, "raport z sektora C4"), (2, "raport raport"), (3, "sektor C4 sektor C4, raport")])
+
+        self.assertEqual([3, 1], self.ids(index, "C4"))
+        self.assertEqual(2, self.ids(index, "raport")[0])
+
+    def test_search__inflected_forms_match_by_stem(self):
+        index = self.index()
+        index.add([("a", "zgłoszenie kradzieży auta"), ("b", "pogoda")])
+
+        self.assertEqual(["a"], self.ids(index, "kradzież"))
+
+    def test_add__reindexing_replaces_old_text(self):
+        index = self.index()
+        index.add([(1, "stary tekst")])
+        index.add([(1, "nowy tekst")])
+
+        self.assertEqual([], self.ids(index, "stary"))
+        self.assertEqual(1, len(index))
+
+    def test_remove__and_clear(self):
+        index = self.index()
+        index.add([(1, "jeden"), (2, "jeden dwa")])
+
+        index.remove([1])
+        self.assertEqual([2], self.ids(index, "jeden"))
+
+        index.clear()
+        self.assertEqual(0, len(index))
+
+    def test_add__persisted_per_collection(self):
+        self.index("facts").add([(1, "fabryka")])
+
+        self.assertEqual([1], self.ids(self.index("facts"), "fabryka"))
+        self.assertEqual([], self.ids(self.index("reports"), "fabryka"))
+
+
+class TestReciprocalRankFusion(unittest.TestCase):
+
+    def test_reciprocal_rank_fusion__ids_in_both_rankings_win(self):
+        fused = reciprocal_rank_fusion([["a", "b"], ["b", "c"]], k=60)
+
+        self.assertEqual(["b", "a", "c"], [point_id for point_id, _ in fused])
+        self.assertAlmostEqual(1 / 62 + 1 / 61, fused[0][1])
+
+
+class TestHybridRetrieve(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.root = Path(self.directory.name)
+
+        patcher = mock.patch.object(query_embeddings, "embed", return_value=[[1, 0, 0]])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def db(self, name: str = "db", keywords: bool = True) -> NumpyDb:
+        db = NumpyDb(str(self.root / name))
+        db.initialize_collection("facts", vector_size=3, keywords=keywords)
+        db.store_vectors("facts", [
+            {"id": "a", "vector": [1, 0, 0], "payload": {"content": "ogólny raport"}},
+            {"id": "b", "vector": [0, 1, 0], "payload": {"content": "sektor C4 dnia 2024-01-29"}},
+            {"id": "c", "vector": [0, 0, 1], "payload": {"content": "inne"}},
+        ])
+        return db
+
+    def test_hybrid_retrieve__exact_term_ranked_first(self):
+        results = self.db().hybrid_retrieve("facts", "2024-01-29", top_k=2)
+
+        self.assertEqual(["sektor C4 dnia 2024-01-29", "ogólny raport"], [result["content"] for result in results])
+
+    def test_hybrid_retrieve__deleted_vectors_leave_keyword_index(self):
+        db = self.db()
+        db.delete_vectors("facts", ["b"])
+
+        self.assertEqual([], db.keyword_index("facts").search("2024-01-29", 5))
+
+    def test_hybrid_retrieve__requires_keyword_index(self):
+        db = self.db(keywords=False)
+
+        with self.assertRaises(ValueError):
+            db.hybrid_retrieve("facts", "2024-01-29")
+
+    def test_keyword_index__stores_with_same_collection_name_are_isolated(self):
+        self.db("first")
+        other = NumpyDb(str(self.root / "second"))
+        other.initialize_collection("facts", vector_size=3, keywords=True)
+
+        self.assertEqual(0, len(other.keyword_index("facts")))
+
+    def test_delete_collection__removes_keyword_index(self):
+        db = self.db()
+        db.delete_collection("facts")
+
+        self.assertFalse(db.has_keyword_index("facts"))
+
+
+if __name__ == '__main__':
+    unittest.main()
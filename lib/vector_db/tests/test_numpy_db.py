@@ -0,0 +1,114 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+from lib.vector_db.numpy_db import NumpyDb
+
+
+class TestNumpyDb(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = Path(self.directory.name)
+        self.db = NumpyDb(str(self.path))
+        self.db.initialize_collection("facts", vector_size=3)
+
+    def point(self, point_id: str, vector: list, **payload) -> dict:
+        return {"id": point_id, "vector": vector, "payload": payload}
+
+    def search(self, db: NumpyDb, vector: list, top_k: int = 3) -> list:
+        return [result["id"] for result in db.search_vectors("facts", vector, top_k)]
+
+    def test_store_vectors__reloaded_by_new_instance(self):
+        self.db.store_vectors("facts", [self.point("a", [1, 0, 0], content="a"),
+                                        self.point("b", [0, 1, 0], content="b")])
+
+        db = NumpyDb(str(self.path))
+
+        self.assertEqual(["b", "a"], self.search(db, [0.1, 1, 0]))
+        self.assertEqual({"a": {"content": "a"}}, db.retrieve_payloads("facts", ["a"]))
+
+    def test_store_vectors__keeps_only_current_generation(self):
+        self.db.store_vectors("facts", [self.point("a", [1, 0, 0])])
+        self.db.store_vectors("facts", [self.point("b", [0, 1, 0])])
+
+        generation = json.loads((self.path / "facts" / "payloads.json").read_text())["generation"]
+        self.assertEqual([f"vectors.{generation}.npy"], [file.name for file in (self.path / "facts").glob("*.npy")])
+
+    def test_store_vectors__existing_id_overwritten_in_place(self):
+        self.db.store_vectors("facts", [self.point("a", [1, 0, 0], content="old")])
+        self.db.store_vectors("facts", [self.point("a", [0, 1, 0], content="new")])
+
+        results = self.db.search_vectors("facts", [0, 1, 0], 3)
+
+        self.assertEqual([("a", "new")], [(result["id"], result["payload"]["content"]) for result in results])
+        self.assertAlmostEqual(1.0, results[0]["score"], places=5)
+
+    def test_store_vectors__duplicate_ids_in_one_batch_last_wins(self):
+        self.db.store_vectors("facts", [self.point("a", [1, 0, 0], content="first"),
+                                        self.point("a", [0, 1, 0], content="second")])
+
+        results = NumpyDb(str(self.path)).search_vectors("facts", [0, 1, 0], 3)
+
+        self.assertEqual([("a", "second")], [(result["id"], result["payload"]["content"]) for result in results])
+
+    def test_store_vectors_bulk__saves_once(self):
+        points = (self.point(str(index), [1, index, 0]) for index in range(10))
+
+        with mock.patch.object(self.db, "_save", wraps=self.db._save) as save:
+            stats = self.db.store_vectors_bulk("facts", points, batch_size=3)
+
+        self.assertEqual(1, save.call_count)
+        self.assertEqual(10, stats.points)
+        self.assertEqual(10, len(NumpyDb(str(self.path)).search_vectors("facts", [1, 0, 0], 20)))
+
+    def test_delete_vectors__removed_from_search_and_disk(self):
+        self.db.store_vectors("facts", [self.point("a", [1, 0, 0]), self.point("b", [0, 1, 0]),
+                                        self.point("c", [0, 0, 1])])
+
+        self.db.delete_vectors("facts", ["b", "missing"])
+
+        self.assertEqual(["a", "c"], sorted(self.search(NumpyDb(str(self.path)), [0, 1, 0])))
+
+    def test_search_vectors__payload_filter(self):
+        self.db.store_vectors("facts", [self.point("a", [1, 0, 0], kind="x"), self.point("b", [1, 0.1, 0], kind="y"),
+                                        self.point("c", [1, 0.2, 0], kind="z")])
+
+        results = self.db.search_vectors("facts", [1, 0, 0], 3, payload_filter={"kind": ["y", "z"]})
+
+        self.assertEqual(["b", "c"], [result["id"] for result in results])
+
+    def test_load__collection_saved_before_generations(self):
+        directory = self.path / "legacy"
+        directory.mkdir()
+        np.save(directory / "vectors.npy", np.array([[1, 0, 0], [0, 1, 0]], dtype=np.float32))
+        (directory / "payloads.json").write_text(json.dumps({
+            "distance": "cosine", "vector_size": 3, "ids": ["a", "b"], "payloads": [{}, {}]}))
+
+        results = self.db.search_vectors("legacy", [0, 1, 0], 1)
+
+        self.assertEqual("b", results[0]["id"])
+
+    def test_save__crash_before_switch_keeps_previous_collection(self):
+        self.db.store_vectors("facts", [self.point("a", [1, 0, 0])])
+
+        with mock.patch("lib.vector_db.numpy_db.os.replace", side_effect=OSError("crash")):
+            with self.assertRaises(OSError):
+                self.db.store_vectors("facts", [self.point("b", [0, 1, 0])])
+
+        self.assertEqual(["a"], self.search(NumpyDb(str(self.path)), [0, 1, 0]))
+
+    def test_delete_collection__removes_directory(self):
+        self.db.delete_collection("facts")
+
+        self.assertFalse(self.db.collection_exists("facts"))
+        self.assertFalse((self.path / "facts").exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,98 @@
+import itertools
+import time
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Dict, Any, Iterable, Sequence, Tuple
+
+from logger import logger
+from .keyword_index import KeywordIndex
+from .query_embeddings import QueryEmbeddings
+
+# Shared by all databases, a repeated query is embedded once per process
+query_embeddings = QueryEmbeddings()
+
+# Damping constant of reciprocal-rank fusion, the value from the original paper
+RRF_K = 60
+
+
+@dataclass
+class BulkUploadStats:
+    points: int
+    seconds: float
+
+    @property
+    def points_per_second(self) -> float:
+        return self.points / self.seconds if self.seconds else 0.0
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Any]], k: int = RRF_K) -> List[Tuple[Any, float]]:
+    """
+    Merge rankings of ids by summing 1 / (k + rank) over the rankings each id appears in.
+
+    :return: (id, fused score) pairs, best first.
+    """
+    scores: Dict[Any, float] = {}
+    for ranking in rankings:
+        for rank, point_id in enumerate(ranking, start=1):
+            scores[point_id] = scores.get(point_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
 
 
 class VectorDb(ABC):
     """
     Abstract base class for a Vector Database.
     This allows swapping the underlying vector database implementation.
+
+    Collections initialized with `keywords=True` also get a BM25 keyword index over the 'content' of their
+    payloads, stored with the collection and used together with the vectors by `hybrid_retrieve`.
     """
 
+    def __init__(self):
+        self._keyword_indexes: Dict[str, KeywordIndex] = {}
+
+    @abstractmethod
+    def _keyword_index_path(self, collection_name: str) -> Path:
+        """
+        Location of the keyword index of a collection, it exists only for collections with keywords.
+        """
+        pass
+
+    def has_keyword_index(self, collection_name: str) -> bool:
+        return collection_name in self._keyword_indexes or self._keyword_index_path(collection_name).exists()
+
+    def keyword_index(self, collection_name: str) -> KeywordIndex:
+        if not self.has_keyword_index(collection_name):
+            raise ValueError(f"Collection '{collection_name}' has no keyword index, initialize it with keywords=True")
+        return self._create_keyword_index(collection_name)
+
+    def _create_keyword_index(self, collection_name: str) -> KeywordIndex:
+        # Called by implementations when a collection is initialized with keywords
+        if collection_name not in self._keyword_indexes:
+            self._keyword_indexes[collection_name] = KeywordIndex(
+                collection_name, str(self._keyword_index_path(collection_name)))
+        return self._keyword_indexes[collection_name]
+
+    def _drop_keyword_index(self, collection_name: str) -> None:
+        # Called by implementations when a collection is deleted
+        index = self._keyword_indexes.pop(collection_name, None)
+        if index is not None:
+            index.close()
+        path = self._keyword_index_path(collection_name)
+        for file in [path, path.with_name(f"{path.name}-wal"), path.with_name(f"{path.name}-shm")]:
+            file.unlink(missing_ok=True)
+
+    def _index_keywords(self, collection_name: str, vectors: List[Dict[str, Any]]) -> None:
+        # Called by implementations after storing vectors
+        if vectors and self.has_keyword_index(collection_name):
+            self.keyword_index(collection_name).add(
+                (vector["id"], vector.get("payload", {}).get("content", "")) for vector in vectors)
+
+    def _unindex_keywords(self, collection_name: str, ids: List[Any]) -> None:
+        # Called by implementations after deleting vectors
+        if ids and self.has_keyword_index(collection_name):
+            self.keyword_index(collection_name).remove(ids)
+
     @abstractmethod
     def initialize_collection(self, collection_name: str, vector_size: int, distance_metric: str = "cosine") -> None:
         """
@@ -32,6 +117,39 @@ class VectorDb(ABC):
         """
         pass
 
+    def store_vectors_bulk(self, collection_name: str, vectors: Iterable[Dict[str, Any]],
+                           batch_size: int = 256) -> BulkUploadStats:
+        """
+        Store a stream of vectors in batches, so memory stays flat regardless of the number of vectors.
+        Implementations override it to overlap the batches.
+
+        :param collection_name: Name of the collection to store vectors.
+        :param vectors: Any iterable of vector dictionaries (as in store_vectors), e.g. a generator.
+        :param batch_size: Number of vectors stored per call.
+        :return: Number of stored vectors and the time it took.
+        """
+        start = time.perf_counter()
+        points = 0
+        iterator = iter(vectors)
+        while batch := list(itertools.islice(iterator, batch_size)):
+            self.store_vectors(collection_name, batch)
+            points += len(batch)
+
+        stats = BulkUploadStats(points=points, seconds=time.perf_counter() - start)
+        logger.info(f"Stored {stats.points} vectors in '{collection_name}' in {stats.seconds:.2f}s "
+                    f"({stats.points_per_second:.0f} points/s)")
+        return stats
+
+    @abstractmethod
+    def delete_vectors(self, collection_name: str, ids: List[Any]) -> None:
+        """
+        Delete vectors by their identifiers, unknown identifiers are ignored.
+
+        :param collection_name: Name of the collection.
+        :param ids: Identifiers of the vectors to delete.
+        """
+        pass
+
     @abstractmethod
     def search_vectors(self, collection_name: str, query_vector: List[float], top_k: int) -> List[Dict[str, Any]]:
         """
@@ -47,6 +165,18 @@ class VectorDb(ABC):
         """
         pass
 
+    def search_vectors_batch(self, collection_name: str, query_vectors: List[List[float]],
+                             top_k: int) -> List[List[Dict[str, Any]]]:
+        """
+        Search for several query vectors at once. Implementations override it to use a single round-trip.
+
+        :param collection_name: Name of the collection to search.
+        :param query_vectors: The query vectors to search with.
+        :param top_k: Number of top results to return per query.
+        :return: One list of results (as in search_vectors) per query vector, in input order.
+        """
+        return [self.search_vectors(collection_name, query_vector, top_k) for query_vector in query_vectors]
+
     @abstractmethod
     def delete_collection(self, collection_name: str) -> None:
         """
@@ -70,6 +200,62 @@ class VectorDb(ABC):
         """
         pass
 
+    def retrieve_contexts_batch(self, collection_name: str, queries: List[str],
+                                top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieve relevant contexts for several queries at once.
+
+        :param collection_name: Name of the collection to search.
+        :param queries: The query strings to embed and search for.
+        :param top_k: Number of top results to return per query.
+        :return: One list of contexts (as in retrieve_contexts) per query, in input order.
+        """
+        return [self.retrieve_contexts(collection_name, query, top_k) for query in queries]
+
+    @abstractmethod
+    def retrieve_payloads(self, collection_name: str, ids: List[Any]) -> Dict[Any, dict]:
+        """
+        Fetch payloads by vector identifiers.
+
+        :param collection_name: Name of the collection.
+        :param ids: Identifiers of the vectors, unknown identifiers are left out of the result.
+        :return: Payload per identifier.
+        """
+        pass
+
+    def hybrid_retrieve(self, collection_name: str, query: str, top_k: int = 5,
+                        candidates: int = 20) -> List[Dict[str, Any]]:
+        """
+        Retrieve contexts ranked by both vector similarity and BM25 keyword relevance, merged with
+        reciprocal-rank fusion. Exact dates, codes and names rank high even where the embedding misses them,
+        so fewer contexts are needed per question.
+
+        :param collection_name: Name of the collection to search.
+        :param query: The query string.
+        :param top_k: Number of contexts to return.
+        :param candidates: Results taken from each retriever before fusion.
+        :return: Contexts like retrieve_contexts, 'score' being the fused score.
+        :raises ValueError: If the collection was initialized without keywords.
+        """
+        keyword_index = self.keyword_index(collection_name)
+        query_vector = query_embeddings.embed([query])[0]
+        dense = self.search_vectors(collection_name, query_vector, candidates)
+        sparse = keyword_index.search(query, candidates)
+
+        fused = reciprocal_rank_fusion([[result["id"] for result in dense],
+                                        [result["id"] for result in sparse]])[:top_k]
+
+        payloads = {result["id"]: result["payload"] for result in dense}
+        missing = [point_id for point_id, _ in fused if point_id not in payloads]
+        if missing:
+            payloads.update(self.retrieve_payloads(collection_name, missing))
+
+        return [
+            {"content": payloads[point_id].get("content", ""), "filename": payloads[point_id].get("filename", ""),
+             "score": score}
+            for point_id, score in fused if point_id in payloads
+        ]
+
     @abstractmethod
     def collection_exists(self, collection_name: str) -> bool:
         """
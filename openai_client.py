@@ -1,34 +1,204 @@
+import asyncio
 import base64
+import itertools
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
 from numbers import Number
 from pathlib import Path
 from statistics import median
-from typing import List, Any
+from typing import List, Any, AsyncIterable, AsyncIterator, Awaitable, Dict, Iterable, Iterator, Optional, Tuple, \
+    TypeVar
+from urllib.parse import urlparse
 
+import httpx
+import numpy as np
 import openai
 import requests
 from PIL import Image
 from openai import ChatCompletion
 from openai.types.audio.transcription import Transcription
+from pydantic import BaseModel
 from singleton_decorator import singleton
-from transformers import CLIPProcessor, CLIPModel
 
-from env import OPENAI_API_KEY
+import http_transport
+from env import OPENAI_API_KEY, OPENAI_RESPONSE_CACHE_PATH
 from logger import logger
+from response_cache import ResponseCache, CacheStats
+from text_utils import count_tokens, truncate_to_tokens
+
+T = TypeVar("T")
+
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+EMBEDDING_MODEL = "text-embedding-ada-002"
+# Limits of the embeddings endpoint: tokens per single input, inputs per request and tokens per request
+EMBEDDING_MAX_INPUT_TOKENS = 8191
+EMBEDDING_MAX_BATCH_ITEMS = 2048
+EMBEDDING_MAX_BATCH_TOKENS = 300_000
+
+
+class _ResponseCacheMixin:
+    """
+    Opt-in response caching shared by the sync and async clients.
+    All helpers are no-ops while no cache is configured.
+    """
+    _cache: Optional[ResponseCache] = None
+
+    def enable_cache(self, cache: Optional[ResponseCache] = None):
+        """
+        Enable the on-disk response cache, by default stored under OPENAI_RESPONSE_CACHE_PATH.
+        """
+        self._cache = cache if cache else ResponseCache(OPENAI_RESPONSE_CACHE_PATH or ResponseCache.DEFAULT_PATH)
+
+    def disable_cache(self):
+        self._cache = None
+
+    @property
+    def cache_stats(self) -> Optional[CacheStats]:
+        return self._cache.stats if self._cache else None
+
+    def _cache_key(self, method: str, model: str = None, messages: Any = None, params: dict = None,
+                   input_digest: str = None) -> Optional[str]:
+        if not self._cache:
+            return None
+        return ResponseCache.make_key(method, model=model, messages=messages, params=params,
+                                      input_digest=input_digest)
+
+    def _cache_get(self, key: Optional[str]) -> Optional[Any]:
+        if not key:
+            return None
+        value = self._cache.get(key)
+        if value is not None:
+            logger.debug(f"Response cache hit for {key}")
+        return value
+
+    def _cache_put(self, key: Optional[str], value: Any):
+        if key and value is not None:
+            self._cache.put(key, value)
+
+    @staticmethod
+    def _response_format_params(response_format) -> dict:
+        if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+            return {"response_format": response_format.model_json_schema()}
+        return {"response_format": str(response_format)}
+
+
+def _pack_embedding_batches(texts: List[str], model_name: str = EMBEDDING_MODEL) -> List[List[str]]:
+    """
+    Greedily pack texts into the fewest requests respecting the per-request item and token limits.
+    Inputs longer than the per-input limit are truncated, the API would reject them otherwise.
+    """
+    batches: List[List[str]] = []
+    batch: List[str] = []
+    batch_tokens = 0
+
+    for text in texts:
+        tokens = count_tokens(text, model_name)
+        if tokens > EMBEDDING_MAX_INPUT_TOKENS:
+            logger.warning(f"Text '{text[:30]}...' has {tokens} tokens, truncating to {EMBEDDING_MAX_INPUT_TOKENS}")
+            text = truncate_to_tokens(text, EMBEDDING_MAX_INPUT_TOKENS, model_name)
+            tokens = EMBEDDING_MAX_INPUT_TOKENS
+
+        if batch and (len(batch) >= EMBEDDING_MAX_BATCH_ITEMS or batch_tokens + tokens > EMBEDDING_MAX_BATCH_TOKENS):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+
+        batch.append(text)
+        batch_tokens += tokens
+
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def iter_completed_items(partials: Iterable[dict], field: str) -> Iterator[Any]:
+    """
+    Yield items of a list field from streamed partial objects (see `json_mode_stream`) as soon as
+    each item is complete. An item is complete once the next one has started or the stream ended.
+    """
+    emitted = 0
+    items: list = []
+    for partial in partials:
+        items = partial.get(field) or []
+        while emitted < len(items) - 1:
+            yield items[emitted]
+            emitted += 1
+    for item in items[emitted:]:
+        yield item
+
+
+async def aiter_completed_items(partials: AsyncIterable[dict], field: str) -> AsyncIterator[Any]:
+    """
+    Async variant of `iter_completed_items`.
+    """
+    emitted = 0
+    items: list = []
+    async for partial in partials:
+        items = partial.get(field) or []
+        while emitted < len(items) - 1:
+            yield items[emitted]
+            emitted += 1
+    for item in items[emitted:]:
+        yield item
 
 
 @singleton
-class OpenAIClient:
-    def __init__(self, model_name: str = "gpt-4o"):
+class OpenAIClient(_ResponseCacheMixin):
+    def __init__(self, model_name: str = "gpt-4o", cache: Optional[ResponseCache] = None,
+                 http_client: httpx.Client = None, prewarm_clip: bool = False):
+        """
+        :param model_name: Default chat model.
+        :param cache: Optional response cache, see `enable_cache`.
+        :param http_client: Custom HTTP client for the OpenAI API (proxies, stubbed transports).
+        :param prewarm_clip: Load the CLIP model in a background thread right away instead of on first use.
+        """
         if not OPENAI_API_KEY:
             logger.error("OpenAI API key not found. Please set it in the .env file.")
             raise ValueError("OpenAI API key not found. Please set it in the .env file.")
 
         self._model_name: str = model_name
-        self._client = openai.OpenAI(api_key=OPENAI_API_KEY)
-        self._clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-        self._clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+        self._client = openai.OpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+        self._cache = cache
+        if self._cache is None and OPENAI_RESPONSE_CACHE_PATH:
+            self.enable_cache()
+
+        # CLIP is only needed by embed_image and costs seconds and hundreds of MB to load
+        self._clip_model = None
+        self._clip_processor = None
+        self._clip_lock = threading.Lock()
+        if prewarm_clip:
+            self.prewarm_clip()
         logger.info(f"Initialized OpenAIClient with model {self._model_name}")
 
+    def _load_clip(self):
+        if self._clip_model is None:
+            with self._clip_lock:
+                if self._clip_model is None:
+                    from transformers import CLIPProcessor, CLIPModel
+
+                    logger.info(f"Loading CLIP model {CLIP_MODEL_NAME}")
+                    self._clip_processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+                    self._clip_model = CLIPModel.from_pretrained(CLIP_MODEL_NAME)
+        return self._clip_model, self._clip_processor
+
+    def prewarm_clip(self, background: bool = True) -> Optional[threading.Thread]:
+        """
+        Load the CLIP model ahead of the first embed_image call.
+
+        :param background: Load in a daemon thread and return it, otherwise load synchronously.
+        """
+        if not background:
+            self._load_clip()
+            return None
+
+        thread = threading.Thread(target=self._load_clip, name="clip-prewarm", daemon=True)
+        thread.start()
+        return thread
+
     def transcribe_audio(self, audio_source: str, save: bool = True) -> str:
         """
         Transcribe audio from a local file path or URL.
@@ -42,31 +212,38 @@ class OpenAIClient:
             # Determine if the source is a URL or a local file
             if audio_source.startswith("http://") or audio_source.startswith("https://"):
                 # Download the audio file
-                response = requests.get(audio_source, stream=True)
-                response.raise_for_status()  # Ensure the request was successful
                 temp_file = Path("temp_audio_file.mp3")  # Change extension as needed
-                with open(temp_file, "wb") as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
+                with http_transport.get(audio_source, stream=True) as response:
+                    response.raise_for_status()  # Ensure the request was successful
+                    with open(temp_file, "wb") as f:
+                        for chunk in response.iter_content(chunk_size=8192):
+                            f.write(chunk)
                 logger.info(f"Downloaded audio from URL: {audio_source}")
                 audio_file_path = temp_file
             else:
                 # Assume the source is a local file path
                 audio_file_path = Path(audio_source)
 
-            # Transcribe the audio
-            with open(audio_file_path, "rb") as audio_file:
-                transcript: Transcription = self._client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file
-                )
+            key = self._cache_key("transcribe_audio", model="whisper-1",
+                                  input_digest=ResponseCache.digest_file(audio_file_path) if self._cache else None)
+            transcript_text = self._cache_get(key)
+
+            if transcript_text is None:
+                # Transcribe the audio
+                with open(audio_file_path, "rb") as audio_file:
+                    transcript: Transcription = self._client.audio.transcriptions.create(
+                        model="whisper-1",
+                        file=audio_file
+                    )
+                transcript_text = transcript.text
+                self._cache_put(key, transcript_text)
             logger.info(f"Transcription completed for {audio_source}")
 
             # Save transcription if required
             if save:
                 transcript_path = audio_file_path.with_suffix('.txt')
                 with open(transcript_path, "w", encoding="utf-8") as f:
-                    f.write(transcript.text)
+                    f.write(transcript_text)
                 logger.info(f"Saved transcript to {transcript_path.name}")
 
             # Clean up temporary file if downloaded
@@ -74,7 +251,7 @@ class OpenAIClient:
                 audio_file_path.unlink()
                 logger.info(f"Deleted temporary file: {audio_file_path.name}")
 
-            return transcript.text
+            return transcript_text
         except Exception as e:
             logger.error(f"Error transcribing audio from {audio_source}: {e}", exc_info=True)
             raise
@@ -84,12 +261,22 @@ class OpenAIClient:
         logger.debug(f"Asking question with image {image_file_path}")
         try:
 
-            image_data = ""
+            image_bytes = b""
             if image_file_path:
                 with open(image_file_path, "rb") as image_file:
-                    image_data = f"data:image/jpeg;base64,{base64.b64encode(image_file.read()).decode("utf-8")}"
+                    image_bytes = image_file.read()
             elif image_file_url:
-                image_data = image_file_url
+                # Downloaded here rather than by the API, so the cache is keyed by the image and not its URL
+                response = http_transport.get(image_file_url)
+                response.raise_for_status()
+                image_bytes = response.content
+            image_data = f"data:image/jpeg;base64,{base64.b64encode(image_bytes).decode("utf-8")}"
+
+            key = self._cache_key("ask_with_image", model=self._model_name, messages=[system_message, question],
+                                  input_digest=ResponseCache.digest_bytes(image_bytes))
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
 
             messages = [
                 {"role": "system", "content": "You are a helpful assistant." if not system_message else system_message},
@@ -107,7 +294,9 @@ class OpenAIClient:
                 messages=messages,
             )
             logger.info(f"Received response for question with image {image_file_path}")
-            return response.choices[0].message.content
+            content = response.choices[0].message.content
+            self._cache_put(key, content)
+            return content
         except Exception as e:
             logger.error(f"Error asking question with image {image_file_path}: {e}", exc_info=True)
             raise
@@ -165,14 +354,62 @@ class OpenAIClient:
 
             messages.append({"role": "user", "content": question})
 
+            model_name = model_name if model_name else self._model_name
+            key = self._cache_key("ask_question", model=model_name, messages=messages,
+                                  params={"temperature": temperature})
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+
             response = self._client.chat.completions.create(
-                model=model_name if model_name else self._model_name,
+                model=model_name,
                 messages=messages,
                 temperature=temperature,
                 stream=False
             )
             logger.info(f"Received response for question: {question}")
-            return response.choices[0].message.content
+            content = response.choices[0].message.content
+            self._cache_put(key, content)
+            return content
+        except Exception as e:
+            logger.error(f"Error asking question: {question}: {e}", exc_info=True)
+            raise
+
+    def ask_question_stream(self, question: str, system_message: str = None, model_name: str = None,
+                            temperature=1) -> Iterator[str]:
+        """
+        Same as `ask_question` but yields text deltas as soon as they arrive.
+        """
+        logger.debug(f"Asking question (streaming): {question}")
+        messages = []
+
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+
+        messages.append({"role": "user", "content": question})
+
+        model_name = model_name if model_name else self._model_name
+        key = self._cache_key("ask_question", model=model_name, messages=messages,
+                              params={"temperature": temperature})
+        cached = self._cache_get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        try:
+            parts: List[str] = []
+            with self._client.chat.completions.create(
+                    model=model_name,
+                    messages=messages,
+                    temperature=temperature,
+                    stream=True
+            ) as stream:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            logger.info(f"Received streamed response for question: {question}")
+            self._cache_put(key, "".join(parts))
         except Exception as e:
             logger.error(f"Error asking question: {question}: {e}", exc_info=True)
             raise
@@ -213,8 +450,15 @@ class OpenAIClient:
             # Log the constructed message payload
             # logger.debug(f"Constructed messages payload: {messages}")
 
+            model_name = model_name if model_name else self._model_name
+            key = self._cache_key("json_mode", model=model_name, messages=messages,
+                                  params={"temperature": temperature, **self._response_format_params(response_format)})
+            cached = self._cache_get(key)
+            if cached is not None:
+                return response_format.model_validate(cached)
+
             response = self._client.beta.chat.completions.parse(
-                model=model_name if model_name else self._model_name,
+                model=model_name,
                 messages=messages,
                 temperature=temperature,
                 response_format=response_format
@@ -224,6 +468,7 @@ class OpenAIClient:
             if message.parsed:
                 # Log the response metadata
                 logger.info(f"Received response from OpenAI: {message.parsed}")
+                self._cache_put(key, message.parsed.model_dump(mode="json"))
                 return message.parsed
             else:
                 logger.error(f"{message.refusal}")
@@ -232,6 +477,51 @@ class OpenAIClient:
             logger.error(f"Error while sending prompt to OpenAI. Prompt: {prompt}, Error: {e}", exc_info=True)
             raise
 
+    def json_mode_stream(self, prompt: str = None, system_message: str = None, model_name: str = None,
+                         temperature=1, response_format=None) -> Iterator[dict]:
+        """
+        Structured output like `json_mode`, but yields the partially parsed object (a dict) after every
+        streamed chunk. The last yielded value is the complete object. Use `iter_completed_items` to
+        consume list fields item by item.
+        """
+        messages = []
+
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+
+        messages.append({"role": "user", "content": [
+            {"type": "text", "text": prompt},
+        ]})
+
+        model_name = model_name if model_name else self._model_name
+        key = self._cache_key("json_mode", model=model_name, messages=messages,
+                              params={"temperature": temperature, **self._response_format_params(response_format)})
+        cached = self._cache_get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        try:
+            with self._client.beta.chat.completions.stream(
+                    model=model_name,
+                    messages=messages,
+                    temperature=temperature,
+                    response_format=response_format
+            ) as stream:
+                for event in stream:
+                    if event.type == "content.delta" and event.parsed is not None:
+                        yield event.parsed
+
+                message = stream.get_final_completion().choices[0].message
+            if message.parsed:
+                logger.info(f"Received streamed response from OpenAI: {message.parsed}")
+                self._cache_put(key, message.parsed.model_dump(mode="json"))
+            else:
+                logger.error(f"{message.refusal}")
+        except Exception as e:
+            logger.error(f"Error while streaming prompt to OpenAI. Prompt: {prompt}, Error: {e}", exc_info=True)
+            raise
+
     def generate_image(self, prompt: str, model_name: str = "dall-e-3") -> str:
         logger.debug(f"Generating image with prompt: {prompt}")
         try:
@@ -252,28 +542,145 @@ class OpenAIClient:
     def embed_text(self, text):
         logger.debug(f"Embedding text: {text[:30]}...")  # Log first 30 characters
         try:
+            key = self._cache_key("embed_text", model=EMBEDDING_MODEL, messages=text)
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+
             response = self._client.embeddings.create(
-                model="text-embedding-ada-002",
+                model=EMBEDDING_MODEL,
                 input=text
             )
             logger.info("Text embedding generated successfully.")
-            return response.data[0].embedding
+            embedding = response.data[0].embedding
+            self._cache_put(key, embedding)
+            return embedding
         except Exception as e:
             logger.error(f"Error embedding text: {text[:30]}: {e}", exc_info=True)
             raise
 
+    def embed_texts(self, texts: List[str], model_name: str = EMBEDDING_MODEL) -> np.ndarray:
+        """
+        Embed many texts with as few requests as possible.
+
+        Identical inputs are embedded once and the inputs are packed into batches under the
+        endpoint's item and token limits. Results share the cache entries of `embed_text`.
+
+        :param texts: Texts to embed.
+        :param model_name: Embedding model.
+        :return: Contiguous float32 matrix with one row per input text, in input order.
+        """
+        logger.debug(f"Embedding {len(texts)} texts")
+        unique_texts = list(dict.fromkeys(texts))
+        vectors: Dict[str, np.ndarray] = {}
+        keys: Dict[str, Optional[str]] = {}
+
+        pending: List[str] = []
+        for text in unique_texts:
+            keys[text] = self._cache_key("embed_text", model=model_name, messages=text)
+            cached = self._cache_get(keys[text])
+            if cached is not None:
+                vectors[text] = np.asarray(cached, dtype=np.float32)
+            else:
+                pending.append(text)
+
+        try:
+            offset = 0
+            batches = _pack_embedding_batches(pending, model_name)
+            for batch in batches:
+                response = self._client.embeddings.create(model=model_name, input=batch)
+                for item in response.data:
+                    # Map back through the original text, the batch may hold a truncated version
+                    text = pending[offset + item.index]
+                    vectors[text] = np.asarray(item.embedding, dtype=np.float32)
+                    self._cache_put(keys[text], item.embedding)
+                offset += len(batch)
+            logger.info(f"Embedded {len(texts)} texts ({len(unique_texts)} unique) in {len(batches)} requests")
+        except Exception as e:
+            logger.error(f"Error embedding {len(pending)} texts: {e}", exc_info=True)
+            raise
+
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        matrix = np.empty((len(texts), len(vectors[texts[0]])), dtype=np.float32)
+        for row, text in enumerate(texts):
+            matrix[row] = vectors[text]
+        return matrix
+
     def embed_image(self, image_path):
         logger.debug(f"Embedding image from {image_path}")
         try:
             image = Image.open(image_path)
-            inputs = self._clip_processor(images=image, return_tensors="pt", padding=True)
-            embedding = self._clip_model.get_image_features(**inputs).detach().numpy().flatten()
+            clip_model, clip_processor = self._load_clip()
+            inputs = clip_processor(images=image, return_tensors="pt", padding=True)
+            embedding = clip_model.get_image_features(**inputs).detach().numpy().flatten()
             logger.info(f"Image embedding generated for {image_path}")
             return embedding
         except Exception as e:
             logger.error(f"Error embedding image from {image_path}: {e}", exc_info=True)
             raise
 
+    def embed_images(self, image_paths: Iterable, batch_size: int = 32,
+                     workers: int = 4) -> Iterator[Tuple[Any, np.ndarray]]:
+        """
+        Embed many images with CLIP, streaming the results.
+
+        Images are decoded and preprocessed in a thread pool while the model runs forward passes
+        on whole batches. At most `workers` batches are prepared ahead of the model, so memory stays
+        bounded regardless of the number of images. Images that cannot be decoded are logged and skipped.
+
+        :param image_paths: Paths of the images, may be a lazy iterable.
+        :param batch_size: Number of images per forward pass.
+        :param workers: Number of preprocessing threads.
+        :return: Generator of (path, embedding) pairs in input order.
+        """
+        import torch
+
+        clip_model, clip_processor = self._load_clip()
+
+        def prepare_batch(paths: List[Any]):
+            loaded_paths, images = [], []
+            for path in paths:
+                try:
+                    with Image.open(path) as image:
+                        # Let JPEG decoding downscale right away, CLIP only needs 224px anyway
+                        image.draft("RGB", (448, 448))
+                        images.append(image.convert("RGB"))
+                    loaded_paths.append(path)
+                except Exception as e:
+                    logger.error(f"Skipping image {path}, it could not be decoded: {e}")
+
+            if not images:
+                return loaded_paths, None
+            return loaded_paths, clip_processor(images=images, return_tensors="pt")["pixel_values"]
+
+        path_iterator = iter(image_paths)
+        batches = iter(lambda: list(itertools.islice(path_iterator, batch_size)), [])
+
+        embedded = 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="clip-preprocess") as executor:
+            pending = deque(executor.submit(prepare_batch, batch) for batch in itertools.islice(batches, workers))
+
+            while pending:
+                paths, pixel_values = pending.popleft().result()
+                next_batch = next(batches, None)
+                if next_batch:
+                    pending.append(executor.submit(prepare_batch, next_batch))
+
+                if pixel_values is None:
+                    continue
+
+                with torch.inference_mode():
+                    embeddings = clip_model.get_image_features(pixel_values=pixel_values).numpy()
+
+                for path, embedding in zip(paths, embeddings):
+                    yield path, embedding
+                embedded += len(paths)
+                logger.debug(f"Embedded {embedded} images")
+
+        logger.info(f"Image embeddings generated for {embedded} images")
+
     def describe_image(self, image_source: str) -> str:
         """
         Generates a textual description of an image from a local file or URL.
@@ -287,17 +694,25 @@ class OpenAIClient:
             # Determine if the input is a URL or a local file
             if image_source.startswith("http://") or image_source.startswith("https://"):
                 # Download the image
-                response = requests.get(image_source)
+                response = http_transport.get(image_source)
                 response.raise_for_status()
-                encoded_image = base64.b64encode(response.content).decode("utf-8")
+                image_bytes = response.content
+                encoded_image = base64.b64encode(image_bytes).decode("utf-8")
                 logger.info(f"Downloaded and encoded image from URL: {image_source}")
             else:
                 # Handle local file
                 image_file_path = Path(image_source)
                 with open(image_file_path, "rb") as image_file:
-                    encoded_image = base64.b64encode(image_file.read()).decode("utf-8")
+                    image_bytes = image_file.read()
+                    encoded_image = base64.b64encode(image_bytes).decode("utf-8")
                 logger.info(f"Loaded and encoded local image: {image_file_path}")
 
+            key = self._cache_key("describe_image", model=self._model_name,
+                                  input_digest=ResponseCache.digest_bytes(image_bytes))
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+
             # Prepare messages for the API request
             messages = [
                 {"role": "system", "content": "You are a helpful assistant that describes images."},
@@ -319,7 +734,9 @@ class OpenAIClient:
                 messages=messages,
             )
             logger.info(f"Received response for image description from {image_source}")
-            return response.choices[0].message.content
+            content = response.choices[0].message.content
+            self._cache_put(key, content)
+            return content
 
         except requests.RequestException as e:
             logger.error(f"Error downloading image from URL: {image_source}: {e}", exc_info=True)
@@ -349,3 +766,491 @@ class OpenAIClient:
         except Exception as e:
             logger.error(f"Error embedding audio from {audio_path}: {e}", exc_info=True)
             raise
+
+
+@dataclass
+class RateBudget:
+    """
+    Per-model request/token budget enforced by AsyncOpenAIClient.
+    None means the dimension is not limited.
+    """
+    requests_per_minute: Optional[int] = None
+    tokens_per_minute: Optional[int] = None
+
+
+class _RateLimiter:
+    """
+    Token bucket refilled continuously, one for requests and one for tokens.
+    Waiters are served in FIFO order because the lock is held while sleeping.
+    """
+
+    def __init__(self, budget: RateBudget):
+        self._budget = budget
+        self._requests = float(budget.requests_per_minute or 0)
+        self._tokens = float(budget.tokens_per_minute or 0)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self._budget.requests_per_minute:
+            self._requests = min(float(self._budget.requests_per_minute),
+                                 self._requests + elapsed * self._budget.requests_per_minute / 60)
+        if self._budget.tokens_per_minute:
+            self._tokens = min(float(self._budget.tokens_per_minute),
+                               self._tokens + elapsed * self._budget.tokens_per_minute / 60)
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = 0.0
+        if self._budget.requests_per_minute and self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60 / self._budget.requests_per_minute)
+        if self._budget.tokens_per_minute and self._tokens < tokens:
+            wait = max(wait, (tokens - self._tokens) * 60 / self._budget.tokens_per_minute)
+        return wait
+
+    async def acquire(self, tokens: int):
+        # A single request larger than the whole budget would otherwise wait forever
+        if self._budget.tokens_per_minute:
+            tokens = min(tokens, self._budget.tokens_per_minute)
+
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+
+            if self._budget.requests_per_minute:
+                self._requests -= 1
+            if self._budget.tokens_per_minute:
+                self._tokens -= tokens
+
+
+def _estimate_tokens(messages: List[dict]) -> int:
+    """Rough token estimate (~4 characters per token) used only for rate budgeting."""
+    characters = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            characters += len(content)
+        elif isinstance(content, list):
+            characters += sum(len(part.get("text", "")) for part in content)
+    return characters // 4 + 1
+
+
+def _encode_image_file(image_file_path) -> str:
+    with open(image_file_path, "rb") as image_file:
+        return f"data:image/jpeg;base64,{base64.b64encode(image_file.read()).decode("utf-8")}"
+
+
+@singleton
+class AsyncOpenAIClient(_ResponseCacheMixin):
+    """
+    Asynchronous counterpart of OpenAIClient for fan-out workloads.
+
+    Every call goes through a semaphore limiting the number of requests in flight
+    and through an optional per-model RateBudget, so callers can simply `gather`
+    hundreds of coroutines without tripping the API limits.
+    """
+
+    def __init__(self, model_name: str = "gpt-4o", max_in_flight: int = 8,
+                 rate_budgets: Optional[Dict[str, RateBudget]] = None, http_client: httpx.AsyncClient = None,
+                 cache: Optional[ResponseCache] = None):
+        if not OPENAI_API_KEY:
+            logger.error("OpenAI API key not found. Please set it in the .env file.")
+            raise ValueError("OpenAI API key not found. Please set it in the .env file.")
+
+        self._model_name: str = model_name
+        self._max_in_flight: int = max_in_flight
+        self._rate_budgets: Dict[str, RateBudget] = rate_budgets or {}
+        self._client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+        self._http_client = http_client
+        # asyncio primitives are bound to the loop they are first used in, keep a set per loop
+        self._loop_limits: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._cache = cache
+        if self._cache is None and OPENAI_RESPONSE_CACHE_PATH:
+            self.enable_cache()
+        logger.info(f"Initialized AsyncOpenAIClient with model {self._model_name}, max in flight {max_in_flight}")
+
+    def use_http_client(self, http_client: httpx.AsyncClient):
+        """
+        Route API calls through the given client, e.g. a long-lived pooled client owned by a web app.
+        The SDK keeps its own retries, a client from http_transport.create_async_client doesn't repeat its POSTs.
+        Images and audios given by URL are downloaded through it too.
+        """
+        self._client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+        self._http_client = http_client
+
+    async def _download(self, url: str) -> bytes:
+        # Pooled keep-alive connections with retries, the app's client or the shared one of http_transport
+        http_client = self._http_client or http_transport.get_async_client()
+        response = await http_client.get(url, follow_redirects=True)
+        response.raise_for_status()
+        return response.content
+
+    def set_rate_budget(self, model_name: str, budget: RateBudget):
+        self._rate_budgets[model_name] = budget
+        for _, limiters in self._loop_limits.values():
+            limiters.pop(model_name, None)
+
+    def _limits(self, model_name: str) -> Tuple[asyncio.Semaphore, Optional[_RateLimiter]]:
+        loop = asyncio.get_running_loop()
+        if loop not in self._loop_limits:
+            self._loop_limits[loop] = (asyncio.Semaphore(self._max_in_flight), {})
+        semaphore, limiters = self._loop_limits[loop]
+
+        budget = self._rate_budgets.get(model_name)
+        if budget and model_name not in limiters:
+            limiters[model_name] = _RateLimiter(budget)
+        return semaphore, limiters.get(model_name)
+
+    @asynccontextmanager
+    async def _slot(self, model_name: str, tokens: int = 1):
+        semaphore, limiter = self._limits(model_name)
+        async with semaphore:
+            if limiter:
+                await limiter.acquire(tokens)
+            yield
+
+    @staticmethod
+    async def gather(coroutines: Iterable[Awaitable[T]], return_exceptions: bool = False) -> List[T]:
+        """
+        Run coroutines concurrently and return their results in input order.
+        Concurrency is bounded by the client's semaphore, not by this helper.
+        """
+        return list(await asyncio.gather(*coroutines, return_exceptions=return_exceptions))
+
+    async def ask_question(self, question: str, system_message: str = None, model_name: str = None,
+                           temperature=1) -> str:
+        logger.debug(f"Asking question: {question}")
+        model_name = model_name if model_name else self._model_name
+        try:
+            messages = []
+
+            if system_message:
+                messages.append({"role": "system", "content": system_message})
+
+            messages.append({"role": "user", "content": question})
+
+            key = self._cache_key("ask_question", model=model_name, messages=messages,
+                                  params={"temperature": temperature})
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+
+            async with self._slot(model_name, _estimate_tokens(messages)):
+                response = await self._client.chat.completions.create(
+                    model=model_name,
+                    messages=messages,
+                    temperature=temperature,
+                    stream=False
+                )
+            logger.info(f"Received response for question: {question}")
+            content = response.choices[0].message.content
+            self._cache_put(key, content)
+            return content
+        except Exception as e:
+            logger.error(f"Error asking question: {question}: {e}", exc_info=True)
+            raise
+
+    async def ask_question_stream(self, question: str, system_message: str = None, model_name: str = None,
+                                  temperature=1) -> AsyncIterator[str]:
+        """
+        Same as `ask_question` but yields text deltas as soon as they arrive.
+        """
+        logger.debug(f"Asking question (streaming): {question}")
+        model_name = model_name if model_name else self._model_name
+        messages = []
+
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+
+        messages.append({"role": "user", "content": question})
+
+        key = self._cache_key("ask_question", model=model_name, messages=messages,
+                              params={"temperature": temperature})
+        cached = self._cache_get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        try:
+            parts: List[str] = []
+            async with self._slot(model_name, _estimate_tokens(messages)):
+                async with await self._client.chat.completions.create(
+                        model=model_name,
+                        messages=messages,
+                        temperature=temperature,
+                        stream=True
+                ) as stream:
+                    async for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            parts.append(chunk.choices[0].delta.content)
+                            yield chunk.choices[0].delta.content
+            logger.info(f"Received streamed response for question: {question}")
+            self._cache_put(key, "".join(parts))
+        except Exception as e:
+            logger.error(f"Error asking question: {question}: {e}", exc_info=True)
+            raise
+
+    async def json_mode_stream(self, prompt: str = None, system_message: str = None, model_name: str = None,
+                               temperature=1, response_format=None) -> AsyncIterator[dict]:
+        """
+        Structured output like `json_mode`, but yields the partially parsed object (a dict) after every
+        streamed chunk. The last yielded value is the complete object. Use `aiter_completed_items` to
+        consume list fields item by item.
+        """
+        model_name = model_name if model_name else self._model_name
+        messages = []
+
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+
+        messages.append({"role": "user", "content": [
+            {"type": "text", "text": prompt},
+        ]})
+
+        key = self._cache_key("json_mode", model=model_name, messages=messages,
+                              params={"temperature": temperature, **self._response_format_params(response_format)})
+        cached = self._cache_get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        try:
+            async with self._slot(model_name, _estimate_tokens(messages)):
+                async with self._client.beta.chat.completions.stream(
+                        model=model_name,
+                        messages=messages,
+                        temperature=temperature,
+                        response_format=response_format
+                ) as stream:
+                    async for event in stream:
+                        if event.type == "content.delta" and event.parsed is not None:
+                            yield event.parsed
+
+                    message = (await stream.get_final_completion()).choices[0].message
+            if message.parsed:
+                logger.info(f"Received streamed response from OpenAI: {message.parsed}")
+                self._cache_put(key, message.parsed.model_dump(mode="json"))
+            else:
+                logger.error(f"{message.refusal}")
+        except Exception as e:
+            logger.error(f"Error while streaming prompt to OpenAI. Prompt: {prompt}, Error: {e}", exc_info=True)
+            raise
+
+    async def json_mode(self, prompt: str = None, system_message: str = None, model_name: str = None, temperature=1,
+                        response_format=None, image_file_url: str = None, image_file_path: str = None) -> Any:
+        model_name = model_name if model_name else self._model_name
+
+        image_data = None
+        if image_file_path:
+            image_data = _encode_image_file(image_file_path)
+        elif image_file_url:
+            image_data = image_file_url
+
+        try:
+            messages = []
+
+            if system_message:
+                messages.append({"role": "system", "content": system_message})
+
+            user_message = {"role": "user", "content": [
+                {"type": "text", "text": prompt},
+            ]}
+
+            if image_data:
+                user_message["content"].append({
+                    "type": "image_url",
+                    "image_url": {"url": image_data},
+                })
+            messages.append(user_message)
+
+            key = self._cache_key("json_mode", model=model_name, messages=messages,
+                                  params={"temperature": temperature, **self._response_format_params(response_format)})
+            cached = self._cache_get(key)
+            if cached is not None:
+                return response_format.model_validate(cached)
+
+            async with self._slot(model_name, _estimate_tokens(messages)):
+                response = await self._client.beta.chat.completions.parse(
+                    model=model_name,
+                    messages=messages,
+                    temperature=temperature,
+                    response_format=response_format
+                )
+
+            message = response.choices[0].message
+            if message.parsed:
+                logger.info(f"Received response from OpenAI: {message.parsed}")
+                self._cache_put(key, message.parsed.model_dump(mode="json"))
+                return message.parsed
+            else:
+                logger.error(f"{message.refusal}")
+
+        except Exception as e:
+            logger.error(f"Error while sending prompt to OpenAI. Prompt: {prompt}, Error: {e}", exc_info=True)
+            raise
+
+    async def ask_with_image(self, question: str, system_message: str = None, image_file_path: Path = None,
+                             image_file_url: str = None) -> str:
+        logger.debug(f"Asking question with image {image_file_path or image_file_url}")
+        try:
+            image_bytes = b""
+            if image_file_path:
+                image_bytes = Path(image_file_path).read_bytes()
+            elif image_file_url:
+                # Downloaded here rather than by the API, so the cache is keyed by the image and not its URL
+                image_bytes = await self._download(image_file_url)
+            image_data = f"data:image/jpeg;base64,{base64.b64encode(image_bytes).decode("utf-8")}"
+
+            key = self._cache_key("ask_with_image", model=self._model_name, messages=[system_message, question],
+                                  input_digest=ResponseCache.digest_bytes(image_bytes))
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+
+            messages = [
+                {"role": "system", "content": "You are a helpful assistant." if not system_message else system_message},
+                {"role": "user", "content": [
+                    {"type": "text", "text": question},
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": image_data},
+                    }
+                ]}
+            ]
+
+            async with self._slot(self._model_name, _estimate_tokens(messages)):
+                response: ChatCompletion = await self._client.chat.completions.create(
+                    model=self._model_name,
+                    messages=messages,
+                )
+            logger.info(f"Received response for question with image {image_file_path or image_file_url}")
+            content = response.choices[0].message.content
+            self._cache_put(key, content)
+            return content
+        except Exception as e:
+            logger.error(f"Error asking question with image {image_file_path or image_file_url}: {e}", exc_info=True)
+            raise
+
+    async def describe_image(self, image_source: str) -> str:
+        """
+        Generates a textual description of an image from a local file or URL.
+
+        :param image_source: Path to the image file or URL.
+        :return: A descriptive caption of the image.
+        """
+        logger.debug(f"Describing image from {image_source}")
+        try:
+            if image_source.startswith("http://") or image_source.startswith("https://"):
+                # Downloaded here rather than by the API, so the cache is keyed by the image and not its URL
+                image_bytes = await self._download(image_source)
+                logger.info(f"Downloaded image from URL: {image_source}")
+            else:
+                image_bytes = Path(image_source).read_bytes()
+            image_data = f"data:image/jpeg;base64,{base64.b64encode(image_bytes).decode("utf-8")}"
+
+            key = self._cache_key("describe_image", model=self._model_name,
+                                  input_digest=ResponseCache.digest_bytes(image_bytes))
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+
+            messages = [
+                {"role": "system", "content": "You are a helpful assistant that describes images."},
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": "Describe the following image."},
+                        {
+                            "type": "image_url",
+                            "image_url": {"url": image_data},
+                        },
+                    ],
+                },
+            ]
+
+            async with self._slot(self._model_name, _estimate_tokens(messages)):
+                response = await self._client.chat.completions.create(
+                    model=self._model_name,
+                    messages=messages,
+                )
+            logger.info(f"Received response for image description from {image_source}")
+            content = response.choices[0].message.content
+            self._cache_put(key, content)
+            return content
+        except Exception as e:
+            logger.error(f"Error describing image from {image_source}: {e}", exc_info=True)
+            raise
+
+    async def embed_text(self, text: str, model_name: str = EMBEDDING_MODEL) -> List[float]:
+        logger.debug(f"Embedding text: {text[:30]}...")
+        try:
+            key = self._cache_key("embed_text", model=model_name, messages=text)
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+
+            async with self._slot(model_name, len(text) // 4 + 1):
+                response = await self._client.embeddings.create(
+                    model=model_name,
+                    input=text
+                )
+            logger.info("Text embedding generated successfully.")
+            embedding = response.data[0].embedding
+            self._cache_put(key, embedding)
+            return embedding
+        except Exception as e:
+            logger.error(f"Error embedding text: {text[:30]}: {e}", exc_info=True)
+            raise
+
+    async def transcribe_audio(self, audio_source: str, save: bool = True) -> str:
+        """
+        Transcribe audio from a local file path or URL.
+
+        :param audio_source: Path to the local audio file or a URL.
+        :param save: If True, save the transcription next to a local audio file.
+        :return: Transcription text.
+        """
+        audio_source = str(audio_source)
+        logger.debug(f"Transcribing audio from {audio_source}")
+        try:
+            is_url = audio_source.startswith("http://") or audio_source.startswith("https://")
+            if is_url:
+                # Keep the download in memory, a shared temp file would race between concurrent calls
+                audio_file = (Path(urlparse(audio_source).path).name or "audio.mp3", await self._download(audio_source))
+                logger.info(f"Downloaded audio from URL: {audio_source}")
+            else:
+                audio_file = Path(audio_source)
+
+            input_digest = None
+            if self._cache:
+                input_digest = ResponseCache.digest_bytes(audio_file[1]) if is_url else ResponseCache.digest_file(
+                    audio_file)
+            key = self._cache_key("transcribe_audio", model="whisper-1", input_digest=input_digest)
+            transcript_text = self._cache_get(key)
+
+            if transcript_text is None:
+                async with self._slot("whisper-1"):
+                    transcript: Transcription = await self._client.audio.transcriptions.create(
+                        model="whisper-1",
+                        file=audio_file
+                    )
+                transcript_text = transcript.text
+                self._cache_put(key, transcript_text)
+            logger.info(f"Transcription completed for {audio_source}")
+
+            if save and not is_url:
+                transcript_path = Path(audio_source).with_suffix('.txt')
+                with open(transcript_path, "w", encoding="utf-8") as f:
+                    f.write(transcript_text)
+                logger.info(f"Saved transcript to {transcript_path.name}")
+
+            return transcript_text
+        except Exception as e:
+            logger.error(f"Error transcribing audio from {audio_source}: {e}", exc_info=True)
+            raise
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+from logger import logger
+
+# Eviction frees space down to this share of the bound, so a full cache doesn't evict on every put
+EVICTION_TARGET = 0.9
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class ResponseCache:
+    """
+    Persistent content-addressed cache for API responses backed by SQLite.
+
+    Values are stored as JSON, keyed by a SHA-256 of the request description (see `make_key`).
+    The total stored size is bounded: least recently used entries are evicted first, once an insert
+    pushes the running total over the bound.
+    Entries may carry a TTL after which they are treated as misses and removed.
+    """
+    DEFAULT_PATH = ".cache/openai_responses.sqlite"
+
+    def __init__(self, path: str = DEFAULT_PATH, max_size_bytes: int = 512 * 1024 * 1024,
+                 default_ttl: Optional[float] = None):
+        """
+        :param path: Location of the SQLite database file.
+        :param max_size_bytes: Upper bound for the summed size of stored values.
+        :param default_ttl: Time to live in seconds for new entries, None means entries never expire.
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._path = path
+        self._max_size_bytes = max_size_bytes
+        self._default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " accessed REAL NOT NULL,"
+            " expires REAL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires)")
+        # Kept up to date by this instance, so a put doesn't have to sum the whole table
+        self._total_size = self._stored_size()
+        logger.info(f"Opened response cache at {path}")
+
+    @staticmethod
+    def make_key(method: str, model: Optional[str] = None, messages: Any = None, params: Optional[dict] = None,
+                 input_digest: Optional[str] = None) -> str:
+        """
+        Build a content-addressed key for a request.
+
+        :param method: Name of the client method, e.g. 'ask_question'.
+        :param model: Model used for the request.
+        :param messages: Prompt / messages payload, must be JSON serializable.
+        :param params: Remaining parameters influencing the response (temperature, response schema, ...).
+        :param input_digest: Digest of input file bytes (image, audio), see `digest_bytes` / `digest_file`.
+        :return: Hex SHA-256 of the canonical JSON representation.
+        """
+        description = {
+            "method": method,
+            "model": model,
+            "messages": messages,
+            "params": params or {},
+            "input_digest": input_digest,
+        }
+        canonical = json.dumps(description, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def digest_bytes(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def digest_file(file_path, chunk_size: int = 1024 * 1024) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as file:
+            for chunk in iter(lambda: file.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Return the cached value or None on a miss (absent or expired entry).
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("SELECT value, size, expires FROM entries WHERE key = ?",
+                                           (key,)).fetchone()
+
+            if row is None:
+                self.stats.misses += 1
+                return None
+
+            value, size, expires = row
+            if expires is not None and expires <= now:
+                self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._total_size -= size
+                self.stats.misses += 1
+                return None
+
+            self._connection.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self.stats.hits += 1
+
+        return json.loads(value)
+
+    def put(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Store a JSON serializable value and evict least recently used entries above the size bound.
+        """
+        ttl = ttl if ttl is not None else self._default_ttl
+        now = time.time()
+        serialized = json.dumps(value, ensure_ascii=False)
+        size = len(serialized.encode("utf-8"))
+
+        if size > self._max_size_bytes:
+            logger.warning(f"Value for key {key} is larger than the whole cache, not storing it")
+            return
+
+        with self._lock:
+            replaced = self._connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, accessed, expires) VALUES (?, ?, ?, ?, ?)",
+                (key, serialized, size, now, now + ttl if ttl is not None else None)
+            )
+            self._total_size += size - (replaced[0] if replaced else 0)
+            if self._total_size > self._max_size_bytes:
+                self._evict(now)
+
+    def _stored_size(self) -> int:
+        return self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _evict(self, now: float) -> None:
+        self._connection.execute("DELETE FROM entries WHERE expires IS NOT NULL AND expires <= ?", (now,))
+
+        # Other processes may share the file, start from the real total
+        total_size = self._stored_size()
+        self._total_size = total_size
+        if total_size <= self._max_size_bytes:
+            return
+
+        target = self._max_size_bytes * EVICTION_TARGET
+        cursor = self._connection.execute("SELECT key, size FROM entries ORDER BY accessed")
+        evicted = []
+        for key, size in cursor:
+            if total_size <= target:
+                break
+            evicted.append((key,))
+            total_size -= size
+        cursor.close()
+
+        self._connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        self._total_size = total_size
+        self.stats.evictions += len(evicted)
+        logger.debug(f"Evicted {len(evicted)} entries from response cache")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM entries")
+            self._total_size = 0
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -1,3 +1,4 @@
+import asyncio
 from enum import Enum
 from pathlib import PosixPath
 
@@ -6,7 +7,8 @@ import utils
 from aidevs3 import send_answer, Answer
 from env import S02E04_URL_DATA
 from logger import logger
-from openai_client import OpenAIClient
+from lib.ingestion import IngestionPipeline, IngestionItem, TEXT
+from openai_client import AsyncOpenAIClient
 from utils import filter_files_by_extension
 
 SYSTEM_MESSAGE = """
@@ -22,7 +24,10 @@ Respond with 'none' if the data does not contain any relevant information about
 Any other information about humans or machines should be ignored - like regular activity of people or software repair/update.
 """
 
-openai_client = OpenAIClient(model_name="gpt-4o")
+async_openai_client = AsyncOpenAIClient(model_name="gpt-4o", max_in_flight=10)
+# The answer must cover every file, a file that can't be read fails the run
+ingestion_pipeline = IngestionPipeline(async_openai_client, image_prompt="Return text visible on the image",
+                                       raise_errors=True)
 
 DATA_DIR = './data'
 
@@ -38,9 +43,9 @@ class ModelResponse(Enum):
     NONE = "none"
 
 
-def verify_text_contains_useful_data(input: str, filename=None) -> ModelResponse:
-    response: str = openai_client.ask_question(question=input, system_message=SYSTEM_MESSAGE,
-                                               model_name="gpt-4o").strip().lower()
+async def verify_text_contains_useful_data(input: str, filename=None) -> ModelResponse:
+    response: str = (await async_openai_client.ask_question(question=input, system_message=SYSTEM_MESSAGE,
+                                                            model_name="gpt-4o")).strip().lower()
 
     logger.info("-----------")
     if filename:
@@ -60,41 +65,39 @@ def add_to_response(model_response: ModelResponse, filename: str):
 
 
 filepath: str = download_utils.download_file(S02E04_URL_DATA, DATA_DIR)
-files: list[PosixPath] = utils.unzip_file(filepath)
+# Reports are read straight from the archive, only media the API needs as files is extracted
+text_reports: dict[str, bytes] = dict(utils.iter_zip_members(filepath, ['txt']))
+files: list[PosixPath] = utils.unzip_file(filepath, ['mp3', 'png'])
 
-text_files = filter_files_by_extension(files, ['txt'])
 audio_files = filter_files_by_extension(files, ['mp3'])
 image_files = filter_files_by_extension(files, ['png'])
 
 
-def transform_data_and_put_in_common_structure():
-    for text_file in text_files:
-        text: str = utils.read_text_file(text_file)
+async def transform_data_and_put_in_common_structure():
+    # Reports, transcriptions and OCR run side by side, each modality within its own concurrency limit
+    items = [IngestionItem(source=name, modality=TEXT, content=content) for name, content in text_reports.items()]
+    items += [IngestionItem(source=str(audio_file)) for audio_file in audio_files]
+    items += [IngestionItem(source=str(image_file)) for image_file in image_files]
 
-        transformed_data[text_file.name] = text
+    async for record in ingestion_pipeline.ingest(items):
+        transformed_data[record.metadata["name"]] = record.text
 
-    for audio_file in audio_files:
-        transcription = openai_client.transcribe_audio(audio_file, save=False)
 
-        transformed_data[audio_file.name] = transcription
+async def classify_all():
+    filenames = list(transformed_data.keys())
+    responses: list[ModelResponse] = await async_openai_client.gather(
+        verify_text_contains_useful_data(transformed_data[filename], filename) for filename in filenames)
 
-    for image_file in image_files:
-        text = openai_client.ask_with_image(image_file, question="Return text visible on the image")
-
-        transformed_data[image_file.name] = text
-
-
-def classify_all():
-    for filename, text in transformed_data.items():
-        response: ModelResponse = verify_text_contains_useful_data(text, filename)
+    for filename, response in zip(filenames, responses):
         add_to_response(response, filename)
 
 
-transform_data_and_put_in_common_structure()
-# serialize(transformed_data)
-# transformed_data = deserialize()
+async def main():
+    await transform_data_and_put_in_common_structure()
+    await classify_all()
+
 
-classify_all()
+asyncio.run(main())
 
 send_answer(Answer(task="kategorie", answer={
     "people": sorted(people),
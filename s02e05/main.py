@@ -1,17 +1,33 @@
-import uuid
-from typing import List, Tuple
+import asyncio
+import json
+import time
+from dataclasses import asdict
+from typing import Dict, List, Tuple
 
 import download_utils
 from aidevs3 import send_answer, Answer
 from env import S02E05_URL_DATA_ARTICLE, S02E05_URL_DATA_QUESTIONS
-from lib.html_parser import parse_html_from_url, ParsedHtml
-from lib.vector_db.qdrant_db import QdrantDb
+from lib.chunker import Chunker
+from lib.context_packer import ContextPacker
+from lib.html_parser import parse_html_from_url, ParsedHtml, Section
+from lib.ingestion import IngestionPipeline, enrich_media
+from lib.ingestion_manifest import IngestionManifest, content_hash
+from lib.vector_db.qdrant_db import QdrantDb, QdrantParams
 from logger import logger
-from openai_client import OpenAIClient
+from openai_client import OpenAIClient, AsyncOpenAIClient, EMBEDDING_MODEL
 
 COLLECTION_NAME = "multimodal-embeddings"
 VECTOR_SIZE = 1536  # Adjust based on embedding model dimensions
 DATA_DIR = "./data"
+# Token budget of the retrieved context in every answer prompt
+CONTEXT_TOKENS = 3000
+# Sections with their image descriptions and transcripts are embedded in overlapping chunks of that size
+CHUNK_TOKENS = 512
+CHUNK_OVERLAP_TOKENS = 64
+# Recorded in the manifest, a different model or chunking re-ingests every section
+EMBEDDING_SETUP = f"{EMBEDDING_MODEL}:chunks-{CHUNK_TOKENS}-{CHUNK_OVERLAP_TOKENS}"
+# Questions answered at the same time
+QA_CONCURRENCY = 8
 
 SYSTEM_MESSAGE = """
 """
@@ -22,27 +38,43 @@ download_utils.download_file(S02E05_URL_DATA_QUESTIONS, DATA_DIR)
 logger.info("Download completed.")
 
 qdrant = QdrantDb(url="http://localhost:6333")
-qdrant.initialize_collection(collection_name=COLLECTION_NAME, vector_size=VECTOR_SIZE, recreate=False)
+# int8 vectors in RAM, originals on disk for rescoring
+qdrant.initialize_collection(collection_name=COLLECTION_NAME, vector_size=VECTOR_SIZE, recreate=False,
+                             params=QdrantParams(quantization="scalar", on_disk=True,
+                                                 payload_indexes={"source": "keyword", "type": "keyword"}))
 logger.info(f"Initialized Qdrant collection '{COLLECTION_NAME}' with vector size {VECTOR_SIZE}.")
 
+manifest = IngestionManifest(COLLECTION_NAME)
+if qdrant.is_collection_empty(COLLECTION_NAME):
+    # Nothing recorded in the manifest is stored anymore
+    manifest.clear()
+
 openai_client = OpenAIClient()
+async_openai_client = AsyncOpenAIClient(max_in_flight=QA_CONCURRENCY)
+media_pipeline = IngestionPipeline(async_openai_client)
+context_packer = ContextPacker(max_tokens=CONTEXT_TOKENS)
+chunker = Chunker(max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS)
 
 
-def generate_answer(query: str, contexts: List[dict], system_context="") -> str:
+async def generate_answer(query: str, contexts: List[dict], system_context="") -> str:
     """
     Generate an answer based on the given query and retrieved contexts.
 
     :param query: The user's query.
-    :param contexts: A list of contexts retrieved from Qdrant.
+    :param contexts: A list of contexts retrieved from Qdrant, packed into CONTEXT_TOKENS best first.
     :return: The generated answer.
     """
-    context_text = "\n".join(ctx['content'] for ctx in contexts)
+    context_text = context_packer.pack(contexts).text
     prompt = f"Query: {query}\n\nContext:\n{context_text}"
 
-    return openai_client.ask_question(prompt, system_message=system_context)
+    return await async_openai_client.ask_question(prompt, system_message=system_context)
+
+
+def section_hash(section: Section) -> str:
+    return content_hash(json.dumps(asdict(section), sort_keys=True, ensure_ascii=False))
 
 
-def process_and_store_content(url: str):
+async def process_and_store_content(url: str):
     """
     Parses HTML content from a URL, processes its sections, and stores embeddings in Qdrant.
 
@@ -53,10 +85,32 @@ def process_and_store_content(url: str):
     parsed_content: ParsedHtml = parse_html_from_url(url)
     logger.debug("Parsed HTML content.")
 
+    # Sections are hashed as parsed, so unchanged ones skip description, transcription and embedding
+    sections = {f"{url}#section-{i}": section for i, section in enumerate(parsed_content.sections)}
+    hashes = {source: section_hash(section) for source, section in sections.items()}
+    plan = manifest.plan(hashes, model=EMBEDDING_SETUP, scope=f"{url}#")
+
+    for entry in plan.removed:
+        qdrant.delete_vectors(COLLECTION_NAME, entry.point_ids)
+        manifest.remove(entry.source)
+
+    # Describe and transcribe every unique image and audio of the changed sections once, concurrently
+    failed_media = set(await enrich_media(parsed_content, [sections[source] for source in plan.pending],
+                                          media_pipeline))
+
+    # A section missing a description is neither embedded nor recorded, so the next run retries it
+    incomplete = [source for source in plan.pending
+                  if any(detail.url in failed_media for detail in [*sections[source].images, *sections[source].audios])]
+    if incomplete:
+        logger.warning(f"Skipping {len(incomplete)} sections with failed media until the next run: {incomplete}")
+
     embeddings = []
 
-    # Process sections
-    for i, section in enumerate(parsed_content.sections):
+    # Process new and changed sections
+    for source in plan.pending:
+        if source in incomplete:
+            continue
+        section = sections[source]
         header = section.header or ""
         combined_text = f"{header}\n{' '.join(section.content)}"
 
@@ -73,7 +127,7 @@ def process_and_store_content(url: str):
                 f"------\n"
                 f"Image caption: {image_detail.caption or 'No caption'}\n"
                 f"------\n"
-                f"Image description: {openai_client.describe_image(image_detail.url)}\n"
+                f"Image description: {image_detail.description or 'No description'}\n"
                 f"------"
             )
             image_info_list.append(image_info)
@@ -87,7 +141,7 @@ def process_and_store_content(url: str):
                 f"------\n"
                 f"Audio caption: {audio_detail.caption or 'No caption'}\n"
                 f"------\n"
-                f"Audio description: {openai_client.transcribe_audio(audio_detail.url)}\n"
+                f"Audio description: {audio_detail.description or 'No description'}\n"
                 f"------"
             )
             audio_info_list.append(audio_info)
@@ -102,37 +156,79 @@ def process_and_store_content(url: str):
             audios_desc = "Audios in section:\n\n" + "\n\n".join(audio_info_list)
             full_content_description += "\n\n" + audios_desc
 
-        # Generate text embedding
-        text_vector = openai_client.embed_text(full_content_description)
-
-        embeddings.append({
-            "id": str(uuid.uuid4()),
-            "vector": text_vector,
-            "payload": {
-                "header": header,
-                "content": full_content_description,
-                "images": [image.__dict__ for image in section.images],  # Serialize ImageDetail objects
-                "audios": [audio.__dict__ for audio in section.audios],  # Serialize AudioDetail objects
-                "type": "section",
-                "source": url
-            }
-        })
+        # Long sections are split instead of being truncated at the embedding model's input limit
+        for chunk in chunker.split_text(full_content_description, parent=source):
+            embeddings.append({
+                "id": manifest.point_id(source, chunk.index),
+                "section": source,
+                "payload": {
+                    "header": header,
+                    "content": chunk.text,
+                    "images": [image.__dict__ for image in section.images],  # Serialize ImageDetail objects
+                    "audios": [audio.__dict__ for audio in section.audios],  # Serialize AudioDetail objects
+                    "type": "section",
+                    "source": url,
+                    "parent": chunk.parent,
+                    "chunk": chunk.index,
+                    "start": chunk.start,
+                    "end": chunk.end
+                }
+            })
+
+    if not embeddings:
+        logger.info(f"All sections of {url} are up to date.")
+        return
+
+    # Generate text embeddings for all chunks in as few requests as possible
+    text_vectors = openai_client.embed_texts([embedding["payload"]["content"] for embedding in embeddings])
+    for embedding, text_vector in zip(embeddings, text_vectors):
+        embedding["vector"] = text_vector.tolist()
 
     # Store embeddings
     qdrant.store_vectors(collection_name=COLLECTION_NAME, vectors=embeddings)
+    point_ids: Dict[str, List[str]] = {}
+    for embedding in embeddings:
+        point_ids.setdefault(embedding["section"], []).append(embedding["id"])
+    for source, ids in point_ids.items():
+        # A section that shrank leaves chunks of its previous version behind
+        stale = manifest.record(source, hashes[source], EMBEDDING_SETUP, ids)
+        qdrant.delete_vectors(COLLECTION_NAME, stale)
     logger.info(f"Stored {len(embeddings)} embeddings in Qdrant collection '{COLLECTION_NAME}'.")
 
 
-def process_questions(file_path: str, collection_name: str):
+async def answer_question(id: str, question: str, contexts: List[dict]) -> Tuple[str, float]:
+    """
+    Answer one question from its retrieved contexts.
+
+    :return: The answer and the seconds it took.
+    """
+    start = time.perf_counter()
+    answer = await generate_answer(query=question, contexts=contexts, system_context="Answer with one sentence.")
+    elapsed = time.perf_counter() - start
+
+    # Display the results, logged together so concurrent questions don't interleave
+    contexts_log = "\n".join(f"- {ctx['content']} (Score: {ctx['score']})" for ctx in contexts)
+    logger.info(f"Question {id} ({elapsed:.2f}s): {question}\nAnswer:\n{answer}\nRelevant Contexts:\n{contexts_log}\n"
+                + "-" * 80)
+    return answer, elapsed
+
+
+def _id_order(id: str):
+    # Numeric ids sort by value, "10" after "9"
+    return (0, int(id), "") if id.isdigit() else (1, 0, id)
+
+
+async def process_questions(file_path: str, collection_name: str):
     """
-    Reads questions from a file and processes each one.
+    Reads questions from a file and answers them concurrently, at most QA_CONCURRENCY at a time,
+    so the run takes about as long as the slowest question instead of the sum of all of them.
 
     Args:
         file_path (str): Path to the file containing questions.
         collection_name (str): Name of the Qdrant collection to query.
 
     Returns:
-        None
+        dict: Answers by question id, ordered by id.
     """
 
     def parse_file(file_path: str) -> List[Tuple[str, str]]:
@@ -152,42 +248,39 @@ def process_questions(file_path: str, collection_name: str):
 
         return questions
 
-    response = {}
-    # Iterate through each question
-    for id, question in parse_file(file_path):
-        question = question.strip()  # Remove any leading/trailing whitespace
-        if not question:
-            continue  # Skip empty lines
+    # Skip empty lines, remove any leading/trailing whitespace
+    questions = [(id, question.strip()) for id, question in parse_file(file_path) if question.strip()]
 
-        logger.info(f"Processing Question {id}: {question}")
+    # Retrieve relevant contexts of all questions with one embedding request and one Qdrant round-trip
+    start = time.perf_counter()
+    all_contexts = await asyncio.to_thread(qdrant.retrieve_contexts_batch, collection_name=collection_name,
+                                           queries=[question for _, question in questions], top_k=2)
+    logger.info(f"Retrieved contexts of {len(questions)} questions in {time.perf_counter() - start:.2f}s")
 
-        # Retrieve relevant contexts from Qdrant
-        contexts = qdrant.retrieve_contexts(collection_name=collection_name, query=question, top_k=2)
+    results = await async_openai_client.gather(
+        answer_question(id, question, contexts) for (id, question), contexts in zip(questions, all_contexts))
 
-        # Generate an answer
-        answer = generate_answer(query=question, contexts=contexts, system_context="Answer with one sentence.")
+    timings = sorted(((elapsed, id) for (id, _), (_, elapsed) in zip(questions, results)), reverse=True)
+    logger.info(f"Answered {len(questions)} questions in {time.perf_counter() - start:.2f}s, slowest: "
+                + ", ".join(f"{id} {elapsed:.2f}s" for elapsed, id in timings[:5]))
 
-        response[id] = answer
-
-        # Display the results
-        logger.info("Answer:")
-        logger.info(answer)
-        logger.info("\nRelevant Contexts:")
-        for ctx in contexts:
-            logger.info(f"- {ctx['content']} (Score: {ctx['score']})")
-        logger.info("\n" + "-" * 80 + "\n")
-
-    return response
+    answers = {id: answer for (id, _), (answer, _) in zip(questions, results)}
+    return {id: answers[id] for id in sorted(answers, key=_id_order)}
 
 
 # File path to questions file
 questions_file = "./data/arxiv.txt"
 
-# Uncomment the next line if you need to process the article content
-process_and_store_content(S02E05_URL_DATA_ARTICLE)
 
-# Process questions
-response = process_questions(file_path=questions_file, collection_name=COLLECTION_NAME)
+async def main():
+    # Uncomment the next line if you need to process the article content
+    await process_and_store_content(S02E05_URL_DATA_ARTICLE)
+
+    # Process questions
+    return await process_questions(file_path=questions_file, collection_name=COLLECTION_NAME)
+
+
+response = asyncio.run(main())
 
 # logger.info(f"Content from {S02E05_URL_DATA_ARTICLE} has been processed and stored!")
 
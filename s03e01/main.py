@@ -1,9 +1,12 @@
+import asyncio
 from pathlib import Path
 
 import utils
 from aidevs3 import send_answer, Answer
+from lib.context_packer import ContextPacker
+from lib.vector_db.keyword_index import KeywordIndex
 from logger import logger
-from openai_client import OpenAIClient
+from openai_client import AsyncOpenAIClient
 from s03e01.s03e01_lib import parse_filename
 from s03e01_lib import download_unzip_data
 from utils import read_files_from_paths, normalize_whitespace
@@ -13,13 +16,16 @@ DATA_DIR = "./data"
 FACTS_DIR = "./data/facts"
 
 IGNORE_PHRASE = "entry deleted"
+# Token budget of the facts added to every tagging prompt
+FACTS_TOKENS = 4000
 
 PERSONALITY = """"
 You are a metadata extraction expert specializing in generating rich, contextually relevant meta tags in Polish to enhance document searchability. 
 Analyze the <report> text, enrich it with information from <context>, and produce rich, accurate tags in nominative form, avoiding generic terms and ensuring relevance and clarity.
 """
 
-openai_client = OpenAIClient()
+openai_client = AsyncOpenAIClient(max_in_flight=10)
+context_packer = ContextPacker(max_tokens=FACTS_TOKENS, separator="\n#############\n")
 
 files = download_unzip_data(DATA_DIR)
 
@@ -40,10 +46,24 @@ reports_data: dict = read_files_from_paths(txt_reports)
 facts_data: dict = {key: value for key, value in read_files_from_paths(txt_facts).items() if
                     not value.startswith(IGNORE_PHRASE)}
 
-facts_context = build_facts_context(list(facts_data.values()))
+facts = {name: normalize_whitespace(fact) for name, fact in facts_data.items()}
 
+# Facts are ranked per report by the terms they share with it, in memory only
+facts_index = KeywordIndex("facts", path=":memory:")
+facts_index.add(facts.items())
 
-def build_response(report, tags_in_filename):
+
+def select_facts(report: str) -> list:
+    """
+    The facts most relevant to the report that fit in FACTS_TOKENS, facts sharing no term with it come last.
+    """
+    scores = {result["id"]: result["score"] for result in facts_index.search(report, top_k=len(facts))}
+    packed = context_packer.pack([{"content": fact, "score": scores.get(name, 0.0)} for name, fact in facts.items()])
+    return packed.contents
+
+
+async def build_response(report, tags_in_filename):
+    facts_context = build_facts_context(select_facts(f"{tags_in_filename}\n{report}"))
     prompt = f"""
     <prompt_objective>
     Generate rich, contextually accurate meta tags in Polish by analyzing the <report> text and enriching it with information from the <context> section to improve document searchability.
@@ -58,18 +78,20 @@ def build_response(report, tags_in_filename):
     <report>[{tags_in_filename}]\n{report}</report>
     <context>{facts_context}</context>
     """
-    response_tags = openai_client.ask_question(question=prompt, system_message=PERSONALITY)
+    response_tags = await openai_client.ask_question(question=prompt, system_message=PERSONALITY)
     response_tags += ", " + tags_in_filename
 
     return response_tags
 
 
-result = {}
+async def tag_all_reports() -> dict:
+    filenames = list(reports_data.keys())
+    all_tags = await openai_client.gather(
+        build_response(reports_data[filename], parse_filename(filename)) for filename in filenames)
+    return dict(zip(filenames, all_tags))
+
 
-for filename, report in reports_data.items():
-    tags_in_filename: str = parse_filename(filename)
-    tags = build_response(report, tags_in_filename)
-    result[filename] = tags
+result = asyncio.run(tag_all_reports())
 
 # logger.info(f"Content from {S02E05_URL_DATA_ARTICLE} has been processed and stored!")
 
@@ -18,7 +18,9 @@ def download_unzip_data(dir: str) -> List[Path]:
     if not any(Path(dir).iterdir()):
         logging.info(f"Directory '{dir}' is empty. Downloading and extracting data.")
         zipfile = download_utils.download_file(S03E01_URL_DATA, dir)
-        return utils.unzip_file(zipfile)
+        # Reports are the top-level files, nested folders (e.g. facts) are read separately
+        extracted = utils.unzip_file(zipfile)
+        return [path for path in extracted if path.parent == Path(dir)]
 
     logging.info(f"Directory '{dir}' is not empty. Returning existing files.")
     return list(Path(dir).iterdir())
@@ -1,4 +1,3 @@
-import uuid
 from datetime import datetime
 from pathlib import Path
 
@@ -6,9 +5,11 @@ import download_utils
 import utils
 from aidevs3 import Answer, send_answer
 from env import S03E02_URL_DATA
-from lib.vector_db.qdrant_db import QdrantDb
+from lib.chunker import Chunker
+from lib.ingestion_manifest import IngestionManifest, content_hash
+from lib.vector_db.numpy_db import NumpyDb
 from logger import logger
-from openai_client import OpenAIClient
+from openai_client import OpenAIClient, EMBEDDING_MODEL
 
 VECTOR_SIZE = 1536
 DATA_DIR = "./data"
@@ -16,16 +17,24 @@ WEAPONS_TESTS_DIR = "./data/weapons_tests"
 DOCUMENTS_DIR = "./data/weapons_tests/do-not-share"
 
 COLLECTION_NAME = "weapons"
+CHUNK_TOKENS = 512
+CHUNK_OVERLAP_TOKENS = 64
+# Recorded in the manifest, a different model or chunking re-ingests every report
+EMBEDDING_SETUP = f"{EMBEDDING_MODEL}:chunks-{CHUNK_TOKENS}-{CHUNK_OVERLAP_TOKENS}"
+
 QUESTION = "W raporcie, z którego dnia znajduje się wzmianka o kradzieży prototypu broni?"
 
 openai_client = OpenAIClient()
-qdrant_db = QdrantDb()
+# A few dozen reports, searched in-process without a Qdrant server
+vector_db = NumpyDb()
+manifest = IngestionManifest(COLLECTION_NAME)
+chunker = Chunker(max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS)
 
 
 def download_and_extract_data():
     if not Path(WEAPONS_TESTS_DIR).exists():
         zip_file = download_utils.download_file(S03E02_URL_DATA, DATA_DIR)
-        utils.unzip_file(zip_file, ["zip"])
+        utils.unzip_file(zip_file)
 
     if not Path(WEAPONS_TESTS_DIR).exists():
         utils.unzip_file(Path(DATA_DIR).joinpath(Path("weapons_tests.zip")).as_posix(), extract_to=WEAPONS_TESTS_DIR,
@@ -33,26 +42,57 @@ def download_and_extract_data():
 
 
 def add_doc_embedings():
-    embeddings: list = []
+    """
+    Embed new and changed documents only and drop the vectors of removed ones.
+    """
+    doc_files = {doc_file.name: doc_file for doc_file in Path(DOCUMENTS_DIR).iterdir()}
+    hashes = {name: content_hash(doc_file.read_bytes()) for name, doc_file in doc_files.items()}
+
+    plan = manifest.plan(hashes, model=EMBEDDING_SETUP)
+
+    for entry in plan.removed:
+        vector_db.delete_vectors(COLLECTION_NAME, entry.point_ids)
+        manifest.remove(entry.source)
 
-    for doc_file in list(Path(DOCUMENTS_DIR).iterdir()):
-        document = utils.read_text_file(doc_file)
-        text_vector = openai_client.embed_text(document)
+    if not plan.pending:
+        return
 
+    # Reports are read in blocks and embedded in overlapping chunks, a long one is no longer truncated
+    chunks = [chunk for name in plan.pending for chunk in chunker.split_file(doc_files[name])]
+
+    # One embedding request and one write of the collection for all changed reports
+    text_vectors = openai_client.embed_texts([chunk.text for chunk in chunks])
+
+    embeddings: list = []
+    for chunk, text_vector in zip(chunks, text_vectors):
         embeddings.append({
-            "id": str(uuid.uuid4()),
-            "vector": text_vector,
+            "id": manifest.point_id(chunk.parent, chunk.index),
+            "vector": text_vector.tolist(),
             "payload": {
-                "content": document,
-                "filename": doc_file.name
+                "content": chunk.text,
+                "filename": chunk.parent,
+                "chunk": chunk.index,
+                "start": chunk.start,
+                "end": chunk.end
             }
         })
 
-    qdrant_db.store_vectors(COLLECTION_NAME, embeddings)
+    vector_db.store_vectors(COLLECTION_NAME, embeddings)
+
+    point_ids = {name: [] for name in plan.pending}
+    for embedding in embeddings:
+        point_ids[embedding["payload"]["filename"]].append(embedding["id"])
+
+    stale = []
+    for name, ids in point_ids.items():
+        # A report that shrank leaves chunks of its previous version behind
+        stale += manifest.record(name, hashes[name], EMBEDDING_SETUP, ids)
+    vector_db.delete_vectors(COLLECTION_NAME, stale)
 
 
 def search_for_result() -> str:
-    result = qdrant_db.retrieve_contexts(COLLECTION_NAME, QUESTION, top_k=1)
+    # The question hinges on the word "kradzież", matched by the keyword index regardless of its inflection
+    result = vector_db.hybrid_retrieve(COLLECTION_NAME, QUESTION, top_k=1)
     logger.info(result[0]['content'])
     return result[0]['filename']
 
@@ -78,10 +118,13 @@ def filename_to_date(filename: str) -> str:
 
 download_and_extract_data()
 
-qdrant_db.initialize_collection(collection_name=COLLECTION_NAME, vector_size=VECTOR_SIZE, recreate=False)
+vector_db.initialize_collection(collection_name=COLLECTION_NAME, vector_size=VECTOR_SIZE, recreate=False,
+                                keywords=True)
 
-if qdrant_db.is_collection_empty(COLLECTION_NAME):
-    add_doc_embedings()
+if vector_db.is_collection_empty(COLLECTION_NAME) or not len(vector_db.keyword_index(COLLECTION_NAME)):
+    # The collection was (re)created or stored before it had a keyword index, re-ingest everything
+    manifest.clear()
+add_doc_embedings()
 
 filename = search_for_result()
 
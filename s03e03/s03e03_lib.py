@@ -1,7 +1,6 @@
 import re
 
-import requests
-
+import http_transport
 from env import AIDEVS_API_KEY, S03E03_URL_API_DB
 from logger import logger
 from openai_client import OpenAIClient
@@ -10,7 +9,7 @@ openai_client = OpenAIClient()
 
 def query_api(task, query):
     logger.info(f"Querying API with task: {task}, query: {query}")
-    response = requests.post(
+    response = http_transport.post(
         S03E03_URL_API_DB,
         json={"task": task, "apikey": AIDEVS_API_KEY, "query": query},
     )
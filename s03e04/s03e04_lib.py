@@ -3,9 +3,9 @@ from dataclasses import dataclass
 from typing import List
 
 import pandas as pd
-import requests
 from names_dataset import NameDataset
 
+import http_transport
 import text_utils
 from env import AIDEVS_API_KEY, S03E04_URL_API_PEOPLE, S03E04_URL_API_PLACES
 from logger import logger
@@ -35,7 +35,7 @@ def query_people_api(person) -> dict:
     :return:
     '''
     logger.info(f"Querying [people] API, query: {person}")
-    response = requests.post(
+    response = http_transport.post(
         S03E04_URL_API_PEOPLE,
         json={"apikey": AIDEVS_API_KEY, "query": person},
     )
@@ -73,7 +73,7 @@ def query_places_api(place):
     :return:
     '''
     logger.info(f"Querying [places] API, query: {place}")
-    response = requests.post(
+    response = http_transport.post(
         S03E04_URL_API_PLACES,
         json={"apikey": AIDEVS_API_KEY, "query": place},
     )
@@ -1,16 +1,16 @@
 import csv
 import os
 
-import requests
 from neo4j import GraphDatabase
 
+import http_transport
 from env import AIDEVS_API_KEY, S03E03_URL_API_DB
 from logger import logger
 
 
 def query_api(task, query):
     logger.info(f"Querying API with task: {task}, query: {query}")
-    response = requests.post(
+    response = http_transport.post(
         S03E03_URL_API_DB,
         json={"task": task, "apikey": AIDEVS_API_KEY, "query": query},
     )
@@ -0,0 +1,9 @@
+import os
+
+# Number of uvicorn worker processes
+WORKERS = int(os.getenv("S04E04_WORKERS", "1"))
+# Maximum number of concurrent OpenAI requests per worker
+MAX_IN_FLIGHT = int(os.getenv("S04E04_MAX_IN_FLIGHT", "32"))
+# Size of the shared keep-alive connection pool per worker
+MAX_CONNECTIONS = int(os.getenv("S04E04_MAX_CONNECTIONS", "64"))
+KEEPALIVE_EXPIRY = 30.0
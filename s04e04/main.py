@@ -1,20 +1,34 @@
-from typing import List
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterable, AsyncIterator, Iterable, List, Union
 
 import numpy as np
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 
-from aidevs3 import send_answer, Answer, send_answer_async
+from aidevs3 import Answer, send_answer_async
+from http_transport import create_async_client
+from lib.lru_cache import LRUCache
 from logger import logger
-from openai_client import OpenAIClient
+from openai_client import AsyncOpenAIClient, aiter_completed_items
 from s04e04.api.entities import ResponseEntity, RequestEntity
+from s04e04.config import WORKERS, MAX_IN_FLIGHT, MAX_CONNECTIONS, KEEPALIVE_EXPIRY
 from s04e04.llm.inscrutions_response import InstructionLLMResponse, CoordinateShiftLLMResponse
+from s04e04.metrics import StageMetrics
+from s04e04.move_parser import parse_move, normalize_fragment
 
-openai_client = OpenAIClient()
+openai_client = AsyncOpenAIClient(max_in_flight=MAX_IN_FLIGHT)
+metrics = StageMetrics()
 
+# Operators repeat the same phrases constantly, remember what the model answered for them
+CACHE_SIZE = 1024
+normalized_instructions: LRUCache[str, str] = LRUCache(CACHE_SIZE)
+split_instructions: LRUCache[str, List[str]] = LRUCache(CACHE_SIZE)
+coordinate_shifts: LRUCache[str, List[int]] = LRUCache(CACHE_SIZE)
 
-def split_instruction(instruction) -> List[str]:
-    system_message = """
+SPLIT_INSTRUCTION_SYSTEM_MESSAGE = """
     Twoim zadaniem jest podzielenie złożonej instrukcji na odrębne kroki, gdzie każdy krok jest pojedynczą akcją do wykonania.
 
     Przykład:
@@ -26,12 +40,50 @@ def split_instruction(instruction) -> List[str]:
     a później na samą górę
     """
 
-    response: InstructionLLMResponse = openai_client.json_mode(system_message=system_message, prompt=instruction,
-                                                               response_format=InstructionLLMResponse)
+
+async def split_instruction(instruction) -> List[str]:
+    cached = split_instructions.get(instruction.strip())
+    if cached is not None:
+        return list(cached)
+
+    response: InstructionLLMResponse = await openai_client.json_mode(
+        system_message=SPLIT_INSTRUCTION_SYSTEM_MESSAGE, prompt=instruction, response_format=InstructionLLMResponse)
+    split_instructions.put(instruction.strip(), list(response.instructions))
     return response.instructions
 
 
-def transform_instruction_to_coordinates_move(instruction):
+async def split_instruction_stream(instruction) -> AsyncIterator[str]:
+    """
+    Same as split_instruction, but yields every step as soon as the model finished writing it.
+    """
+    started = time.perf_counter()
+    cached = split_instructions.get(instruction.strip())
+    if cached is not None:
+        for step in cached:
+            yield step
+    else:
+        partials = openai_client.json_mode_stream(system_message=SPLIT_INSTRUCTION_SYSTEM_MESSAGE,
+                                                  prompt=instruction, response_format=InstructionLLMResponse)
+        instructions = []
+        async for step in aiter_completed_items(partials, "instructions"):
+            instructions.append(step)
+            yield step
+        split_instructions.put(instruction.strip(), instructions)
+
+    metrics.observe("split_instruction", time.perf_counter() - started)
+
+
+async def transform_instruction_to_coordinates_move(instruction):
+    # Common phrases are parsed without the model, then previously seen phrases are served from memory
+    move = parse_move(instruction)
+    if move is not None:
+        return move
+
+    fragment = normalize_fragment(instruction)
+    cached = coordinate_shifts.get(fragment)
+    if cached is not None:
+        return list(cached)
+
     system_message = """
     Jesteś programem, który przetwarza polecenia ruchu zapisane w języku naturalnym i zamienia je na przesunięcia współrzędnych kartezjańskich (Δx, Δy) — różnice w położeniu w osi x (poziomej) i y (pionowej).
 
@@ -93,18 +145,23 @@ def transform_instruction_to_coordinates_move(instruction):
     Dane wyjściowe: (0, -3)
     """
 
-    response: CoordinateShiftLLMResponse = openai_client.json_mode(system_message=system_message, prompt=instruction,
-                                                                   response_format=CoordinateShiftLLMResponse)
+    response: CoordinateShiftLLMResponse = await openai_client.json_mode(
+        system_message=system_message, prompt=instruction, response_format=CoordinateShiftLLMResponse)
 
+    coordinate_shifts.put(fragment, list(response.shift))
     return response.shift
 
 
-def transform_instructions_to_moves(instructions) -> List[List[int]]:
-    moves = []
-    for instruction in instructions:
-        move = transform_instruction_to_coordinates_move(instruction)
-        moves.append(move)
-    return moves
+async def transform_instructions_to_moves(instructions: Union[Iterable[str], AsyncIterable[str]]) -> List[List[int]]:
+    # Steps are independent of each other, convert them concurrently and keep their order
+    tasks = []
+    if isinstance(instructions, AsyncIterable):
+        async for instruction in instructions:
+            tasks.append(asyncio.create_task(transform_instruction_to_coordinates_move(instruction)))
+    else:
+        for instruction in instructions:
+            tasks.append(asyncio.create_task(transform_instruction_to_coordinates_move(instruction)))
+    return list(await asyncio.gather(*tasks))
 
 
 map_4x4 = np.array([
@@ -126,7 +183,7 @@ def get_terrain(moves: List[List[int]]) -> str:
     return map_4x4[current_position[1], current_position[0]]
 
 
-def normalize_instruction(instruction: str):
+async def normalize_instruction(instruction: str):
     prompt = """
         Given a text with multiple instructions, focus only on navigation-related commands and remove any unrelated, redundant, or indecisive statements. Normalize the output to retain the final clear instruction. Here are examples:
         
@@ -143,36 +200,71 @@ def normalize_instruction(instruction: str):
         W prawo i dopiero teraz w dół 
      """
 
-    normalized = openai_client.ask_question(question=instruction, system_message=prompt)
+    cached = normalized_instructions.get(instruction.strip())
+    if cached is not None:
+        return cached
+
+    normalized = await openai_client.ask_question(question=instruction, system_message=prompt)
+    normalized_instructions.put(instruction.strip(), normalized)
 
     logger.info(f"Normalizing: \n{instruction} ---> {normalized}")
     return normalized
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One keep-alive HTTP/2 pool per worker, shared by every request and every OpenAI call.
+    # app.state.http_transport lets benchmarks and tests plug in a stubbed transport.
+    http_client = create_async_client(max_connections=MAX_CONNECTIONS, keepalive_expiry=KEEPALIVE_EXPIRY,
+                                      transport=getattr(app.state, "http_transport", None))
+    openai_client.use_http_client(http_client)
+    app.state.http_client = http_client
+    yield
+    await http_client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.post("/api", response_model=ResponseEntity)
-def process_request(request: RequestEntity):
+async def process_request(request: RequestEntity):
     logger.info(f"[Request] {request}")
 
-    normalized_instruction = normalize_instruction(request.instruction)
-    instructions: List[str] = split_instruction(normalized_instruction)
-    moves = transform_instructions_to_moves(instructions)
-    terrain: str = get_terrain(moves)
+    with metrics.time("request"):
+        # A plain single-step instruction needs no model at all
+        move = parse_move(request.instruction)
+        if move is not None:
+            moves = [move]
+        else:
+            with metrics.time("normalize_instruction"):
+                normalized_instruction = await normalize_instruction(request.instruction)
+            # Steps are converted while the model is still writing the following ones, so this stage
+            # overlaps with split_instruction
+            with metrics.time("transform_instructions_to_moves"):
+                moves = await transform_instructions_to_moves(split_instruction_stream(normalized_instruction))
+
+        with metrics.time("get_terrain"):
+            terrain: str = get_terrain(moves)
 
     logger.info(f"[Response] {terrain}")
 
     return ResponseEntity(description=terrain)
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return metrics.render_prometheus()
+
+
 @app.get("/send")
-def send_api_url():
+async def send_api_url():
     logger.info("send api url")
-    answer = send_answer(Answer(task="webhook", answer="https://azyl-52263.ag3nts.org/api"))
+    answer = await send_answer_async(Answer(task="webhook", answer="https://azyl-52263.ag3nts.org/api"),
+                                     client=app.state.http_client)
     logger.info(answer)
 
 
 if __name__ == "__main__":
     logger.info(f"Click to send API URL: http://127.0.0.1:3000/send")
-    uvicorn.run("main:app", host="127.0.0.1", port=3000, reload=True)
+    # Reloading is only supported with a single worker
+    uvicorn.run("main:app", host="127.0.0.1", port=3000, workers=WORKERS, reload=WORKERS == 1)
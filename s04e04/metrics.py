@@ -0,0 +1,88 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Sequence
+
+# Upper bounds in seconds, an implicit +Inf bucket follows the last one
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class LatencyHistogram:
+    """
+    Cumulative latency histogram compatible with the Prometheus histogram type.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def cumulative_counts(self) -> list:
+        cumulative, total = [], 0
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+
+class StageMetrics:
+    """
+    Per-stage latency histograms of the webhook, rendered in the Prometheus text format.
+    Metrics are kept per process, with several uvicorn workers every worker reports its own.
+    """
+
+    def __init__(self, namespace: str = "s04e04", buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self._namespace = namespace
+        self._buckets = buckets
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            if stage not in self._histograms:
+                self._histograms[stage] = LatencyHistogram(self._buckets)
+            self._histograms[stage].observe(seconds)
+
+    @contextmanager
+    def time(self, stage: str):
+        """
+        Measure the wrapped block, works around awaits as well.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                stage: {"count": histogram.count, "sum": histogram.sum,
+                        "buckets": dict(zip([*histogram.buckets, float("inf")], histogram.cumulative_counts()))}
+                for stage, histogram in self._histograms.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+    def render_prometheus(self) -> str:
+        name = f"{self._namespace}_stage_latency_seconds"
+        lines = [f"# HELP {name} Latency of webhook processing stages.", f"# TYPE {name} histogram"]
+
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                for bound, count in zip([*histogram.buckets, float("inf")], histogram.cumulative_counts()):
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,76 @@
+import re
+from typing import List, Optional
+
+from text_utils import remove_diacritics
+
+MAX_STEPS = 3
+
+# Patterns work on lowercase text without Polish diacritics
+DIRECTIONS = {
+    (1, 0): re.compile(r"\bpraw(o|a|ej)?\b"),
+    (-1, 0): re.compile(r"\blew(o|a|ej)?\b"),
+    (0, -1): re.compile(r"\bgor(e|y|a)?\b"),
+    (0, 1): re.compile(r"\bdol(u)?\b"),
+}
+
+MAX_MOVE = re.compile(r"\b(sam|sama|samo|samej|samego|konca|maksymalnie|maks|max|pelny|pelnym|calkiem|skraj\w*"
+                      r"|oporu|scian\w*|ile (tylko )?(mozemy|mozna|sie da))\b")
+
+STEP_COUNTS = {
+    "jeden": 1, "jedno": 1, "jedna": 1, "jednego": 1, "1": 1,
+    "dwa": 2, "dwie": 2, "dwoch": 2, "2": 2,
+    "trzy": 3, "trzech": 3, "3": 3,
+}
+STEP_COUNT = re.compile(r"\b(" + "|".join(STEP_COUNTS) + r")\b")
+
+# Words that don't change the move; a phrase with any other word is left to the LLM, it may hold a distance
+FILLER = re.compile(r"w|we|na|do|a|i|to|potem|pozniej|nastepnie|teraz|koniec|pole|pola|pol|polu|mapy|kolego"
+                    r"|\w*lec\w*|idziemy|ruszamy")
+
+# Words signalling a correction or hesitation, such phrases are left to the LLM
+AMBIGUOUS = re.compile(r"\b(nie|albo|czeka\w*|cofnij|cofamy|wroc\w*|zaraz|jednak)\b")
+
+
+def normalize_fragment(text: str) -> str:
+    """
+    Canonical form of an instruction fragment: lowercase words without diacritics and punctuation.
+    """
+    return " ".join(re.findall(r"\w+", remove_diacritics(text).lower()))
+
+
+def parse_move(instruction: str) -> Optional[List[int]]:
+    """
+    Deterministically translate a common single-step Polish movement phrase to a [dx, dy] shift,
+    e.g. "poleciałem jedno pole w prawo" -> [1, 0], "a później na sam dół" -> [0, 3].
+
+    :param instruction: Instruction fragment in natural language.
+    :return: The shift, or None when the phrase is not recognised with certainty.
+    """
+    text = normalize_fragment(instruction)
+
+    if AMBIGUOUS.search(text):
+        return None
+
+    remainder = MAX_MOVE.sub(" ", text).split()
+    known = [*DIRECTIONS.values(), STEP_COUNT, FILLER]
+    if any(not any(pattern.fullmatch(word) for pattern in known) for word in remainder):
+        return None
+
+    directions = [(direction, len(pattern.findall(text))) for direction, pattern in DIRECTIONS.items()]
+    directions = [(direction, count) for direction, count in directions if count]
+    if len(directions) != 1 or directions[0][1] != 1:
+        return None
+
+    step_counts = STEP_COUNT.findall(text)
+    if len(step_counts) > 1:
+        return None
+
+    if MAX_MOVE.search(text):
+        if step_counts:
+            return None
+        steps = MAX_STEPS
+    else:
+        steps = STEP_COUNTS[step_counts[0]] if step_counts else 1
+
+    (dx, dy), _ = directions[0]
+    return [dx * steps, dy * steps]
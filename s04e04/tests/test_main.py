@@ -5,7 +5,7 @@ import unittest
 from s04e04.main import split_instruction, transform_instruction_to_coordinates_move, get_terrain
 
 
-class TestMain(unittest.TestCase):
+class TestMain(unittest.IsolatedAsyncioTestCase):
 
     def normalize_string(self, text):
         """
@@ -35,7 +35,7 @@ class TestMain(unittest.TestCase):
         # Join words back into a string and return in lowercase
         return " ".join(words).strip().lower()
 
-    def test_split_instruction(self):
+    async def test_split_instruction(self):
         instruction = "Poleciałem jedno pole w prawo, a później na sam dół i na koniec jeden w prawo."
         expected = [
             "Poleciałem jedno pole w prawo",
@@ -44,7 +44,7 @@ class TestMain(unittest.TestCase):
         ]
 
         # Call the function to test
-        result = split_instruction(instruction)
+        result = await split_instruction(instruction)
 
         # Normalize both expected and result before comparison
         normalized_expected = [self.normalize_string(e) for e in expected]
@@ -58,16 +58,16 @@ class TestMain(unittest.TestCase):
                     f"Expected part '{expected_part}' not found in result part '{result_part}'."
                 )
 
-    def test_transform_instruction_to_coordinates_move__right_move(self):
+    async def test_transform_instruction_to_coordinates_move__right_move(self):
         instruction = "poleciałem jedno pole w prawo"
         expected = [1, 0]  # Replace with the actual expected coordinates
-        result = transform_instruction_to_coordinates_move(instruction)
+        result = await transform_instruction_to_coordinates_move(instruction)
         self.assertEqual(result, expected)
 
-    def test_transform_instruction_to_coordinates_move__bottom_move(self):
+    async def test_transform_instruction_to_coordinates_move__bottom_move(self):
         instruction = "a później na sam dół"
         expected = [0, 3]  # Replace with the actual expected coordinates
-        result = transform_instruction_to_coordinates_move(instruction)
+        result = await transform_instruction_to_coordinates_move(instruction)
         self.assertEqual(result, expected)
 
     def test_get_terrain_basic_move(self):
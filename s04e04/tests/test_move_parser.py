@@ -0,0 +1,55 @@
+import unittest
+
+from s04e04.move_parser import parse_move, normalize_fragment
+
+
+class TestMoveParser(unittest.TestCase):
+
+    def test_parse_move__single_step_right(self):
+        self.assertEqual([1, 0], parse_move("poleciałem jedno pole w prawo"))
+
+    def test_parse_move__to_the_bottom(self):
+        self.assertEqual([0, 3], parse_move("a później na sam dół"))
+
+    def test_parse_move__to_the_top(self):
+        self.assertEqual([0, -3], parse_move("na samą górę"))
+
+    def test_parse_move__two_steps_left(self):
+        self.assertEqual([-2, 0], parse_move("Poleciałem dwa pola w lewo."))
+
+    def test_parse_move__max_right(self):
+        self.assertEqual([3, 0], parse_move("W prawo maksymalnie idziemy"))
+
+    def test_parse_move__as_far_as_we_can(self):
+        self.assertEqual([3, 0], parse_move("ile tylko możemy polecimy w prawo"))
+
+    def test_parse_move__to_the_wall(self):
+        self.assertEqual([-3, 0], parse_move("w lewo do ściany"))
+
+    def test_parse_move__all_the_way(self):
+        self.assertEqual([3, 0], parse_move("W prawo do oporu"))
+
+    def test_parse_move__unknown_words_are_left_to_llm(self):
+        self.assertIsNone(parse_move("w prawo aż do drzewa"))
+
+    def test_parse_move__finally_is_not_max(self):
+        self.assertEqual([1, 0], parse_move("i na koniec jeden w prawo"))
+
+    def test_parse_move__default_single_step(self):
+        self.assertEqual([0, 1], parse_move("lecimy w dół"))
+
+    def test_parse_move__multiple_directions_are_left_to_llm(self):
+        self.assertIsNone(parse_move("W prawo i dopiero teraz w dół"))
+
+    def test_parse_move__corrections_are_left_to_llm(self):
+        self.assertIsNone(parse_move("Lecimy w dół, albo nie! nie! czekaaaaj."))
+
+    def test_parse_move__no_direction(self):
+        self.assertIsNone(parse_move("Co widzisz?"))
+
+    def test_normalize_fragment(self):
+        self.assertEqual("a pozniej na sam dol", normalize_fragment("  A później, na sam dół! "))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+import download_utils
+
+
+class RangeServer(ThreadingHTTPServer):
+    """
+    Serves one file with byte ranges and If-Range like a static file server, and records the requests.
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), RangeHandler)
+        self.data = os.urandom(1000)
+        self.etag = '"v1"'
+        self.last_modified = "Mon, 01 Jan 2024 00:00:00 GMT"
+        self.ignore_ranges = False
+        self.requests = []
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/file.bin"
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def send_headers(self, status: int, length: int, content_range: str = None):
+        self.send_response(status)
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        if self.server.etag:
+            self.send_header("ETag", self.server.etag)
+        if self.server.last_modified:
+            self.send_header("Last-Modified", self.server.last_modified)
+        if content_range:
+            self.send_header("Content-Range", content_range)
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.send_headers(200, len(self.server.data))
+
+    def do_GET(self):
+        server, data = self.server, self.server.data
+        byte_range, if_range = self.headers.get("Range"), self.headers.get("If-Range")
+        server.requests.append((byte_range, if_range))
+
+        # A weak ETag never matches If-Range
+        validators = {server.last_modified}
+        if server.etag and not server.etag.startswith("W/"):
+            validators.add(server.etag)
+        if not byte_range or server.ignore_ranges or (if_range and if_range not in validators):
+            self.send_headers(200, len(data))
+            self.wfile.write(data)
+            return
+
+        start, end = byte_range.removeprefix("bytes=").split("-")
+        start, end = int(start), int(end) if end else len(data) - 1
+        if start >= len(data):
+            self.send_headers(416, 0, f"bytes */{len(data)}")
+            return
+        self.send_headers(206, end - start + 1, f"bytes {start}-{end}/{len(data)}")
+        self.wfile.write(data[start:end + 1])
+
+
+class TestDownloadFile(unittest.TestCase):
+
+    def setUp(self):
+        self.server = RangeServer()
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.target = Path(self.directory.name)
+
+        # Small parts, so a 1000 byte file is split in several ranges
+        patcher = mock.patch("download_utils.MIN_PART_SIZE", 100)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def leave_interrupted_download(self, part: bytes):
+        download_utils._write_sidecar(str(self.target / "file.bin.download.json"), {
+            "url": self.server.url, "etag": self.server.etag, "last_modified": self.server.last_modified,
+            "size": len(self.server.data), "complete": False})
+        (self.target / "file.bin.part.0").write_bytes(part)
+
+    def assert_downloaded(self, path: str):
+        self.assertEqual(self.server.data, Path(path).read_bytes())
+        self.assertEqual(["file.bin", "file.bin.download.json"], sorted(os.listdir(self.target)))
+
+    def test_download_file__in_parallel_parts(self):
+        path = download_utils.download_file(self.server.url, str(self.target),
+                                            sha256=hashlib.sha256(self.server.data).hexdigest())
+
+        self.assert_downloaded(path)
+        self.assertEqual(4, len(self.server.requests))
+
+    def test_download_file__up_to_date_file_is_not_downloaded_again(self):
+        download_utils.download_file(self.server.url, str(self.target))
+        self.server.requests.clear()
+
+        download_utils.download_file(self.server.url, str(self.target))
+
+        self.assertEqual([], self.server.requests)
+
+    def test_download_file__changed_etag_downloads_again(self):
+        download_utils.download_file(self.server.url, str(self.target))
+        self.server.data, self.server.etag = os.urandom(1000), '"v2"'
+
+        self.assert_downloaded(download_utils.download_file(self.server.url, str(self.target)))
+
+    def test_download_file__resumes_interrupted_part(self):
+        self.leave_interrupted_download(self.server.data[:300])
+
+        self.assert_downloaded(download_utils.download_file(self.server.url, str(self.target), parts=1))
+        self.assertEqual([("bytes=300-", '"v1"')], self.server.requests)
+
+    def test_download_file__complete_part_is_done(self):
+        self.leave_interrupted_download(self.server.data)
+
+        self.assert_downloaded(download_utils.download_file(self.server.url, str(self.target), parts=1))
+
+    def test_download_file__weak_etag_resumes_with_last_modified(self):
+        self.server.etag = 'W/"v1"'
+        self.leave_interrupted_download(self.server.data[:300])
+
+        self.assert_downloaded(download_utils.download_file(self.server.url, str(self.target), parts=1))
+        self.assertEqual([("bytes=300-", self.server.last_modified)], self.server.requests)
+
+    def test_download_file__weak_etag_without_date_starts_over(self):
+        self.server.etag, self.server.last_modified = 'W/"v1"', None
+        self.leave_interrupted_download(b"x" * 300)
+
+        self.assert_downloaded(download_utils.download_file(self.server.url, str(self.target), parts=1))
+        self.assertEqual([(None, None)], self.server.requests)
+
+    def test_download_file__ignored_ranges_start_over(self):
+        self.server.ignore_ranges = True
+        self.leave_interrupted_download(b"x" * 100)
+
+        self.assert_downloaded(download_utils.download_file(self.server.url, str(self.target)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+from unittest import mock
+
+import httpx
+import requests
+
+import http_transport
+
+
+class StubTransport(httpx.AsyncBaseTransport):
+    """
+    Answers with the given outcomes in turn, an exception class is raised instead of answering.
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.requests = []
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, type):
+            raise outcome("stub")
+        return httpx.Response(outcome)
+
+
+class TestRetryingAsyncTransport(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        patcher = mock.patch("http_transport.asyncio.sleep", new_callable=mock.AsyncMock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def send(self, method: str, transport: StubTransport) -> int:
+        async with http_transport.create_async_client(transport=transport) as client:
+            return (await client.request(method, "http://stub/")).status_code
+
+    async def test_get__retried_on_server_errors(self):
+        transport = StubTransport(503, 429, 200)
+
+        self.assertEqual(200, await self.send("GET", transport))
+        self.assertEqual(3, len(transport.requests))
+
+    async def test_get__retried_on_read_errors(self):
+        transport = StubTransport(httpx.ReadError, 200)
+
+        self.assertEqual(200, await self.send("GET", transport))
+
+    async def test_post__not_retried_on_server_errors(self):
+        transport = StubTransport(503, 200)
+
+        self.assertEqual(503, await self.send("POST", transport))
+        self.assertEqual(1, len(transport.requests))
+
+    async def test_post__not_retried_on_read_errors(self):
+        transport = StubTransport(httpx.ReadError, 200)
+
+        with self.assertRaises(httpx.ReadError):
+            await self.send("POST", transport)
+
+    async def test_post__retried_when_connecting_failed(self):
+        transport = StubTransport(httpx.ConnectError, 200)
+
+        self.assertEqual(200, await self.send("POST", transport))
+
+    async def test_get__gives_up_after_max_retries(self):
+        transport = StubTransport(*[503] * (http_transport.MAX_RETRIES + 1))
+
+        self.assertEqual(503, await self.send("GET", transport))
+        self.assertEqual(http_transport.MAX_RETRIES + 1, len(transport.requests))
+
+
+class TestRequest(unittest.TestCase):
+
+    def setUp(self):
+        self.session = mock.Mock()
+        patchers = [mock.patch("http_transport.get_session", return_value=self.session),
+                    mock.patch("http_transport.MAX_CONNECTIONS_PER_HOST", 1),
+                    mock.patch.dict(http_transport._host_slots, clear=True)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def respond(self) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = mock.Mock()
+        self.session.request.return_value = response
+        return response
+
+    def slot_is_free(self, url: str) -> bool:
+        slot = http_transport._host_slot(url)
+        if slot.acquire(blocking=False):
+            slot.release()
+            return True
+        return False
+
+    def test_session__retries_only_idempotent_methods(self):
+        retry = http_transport._build_session().get_adapter("https://stub/").max_retries
+
+        self.assertIn("GET", retry.allowed_methods)
+        self.assertNotIn("POST", retry.allowed_methods)
+
+    def test_request__releases_host_slot(self):
+        self.respond()
+        http_transport.get("http://stub/file")
+
+        self.assertTrue(self.slot_is_free("http://stub/other"))
+
+    def test_request__streamed_response_holds_host_slot_until_closed(self):
+        self.respond()
+        with http_transport.get("http://stub/file", stream=True):
+            self.assertFalse(self.slot_is_free("http://stub/other"))
+
+        self.assertTrue(self.slot_is_free("http://stub/other"))
+
+    def test_request__slots_are_per_host(self):
+        self.respond()
+        with http_transport.get("http://stub/file", stream=True):
+            self.assertTrue(self.slot_is_free("http://other-host/file"))
+
+    def test_request__failed_request_releases_host_slot(self):
+        self.session.request.side_effect = requests.ConnectionError("stub")
+
+        with self.assertRaises(requests.ConnectionError):
+            http_transport.get("http://stub/file")
+        self.assertTrue(self.slot_is_free("http://stub/other"))
+
+
+if __name__ == '__main__':
+    unittest.main()
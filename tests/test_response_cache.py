@@ -0,0 +1,98 @@
+import itertools
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from response_cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.directory.name) / "cache.sqlite")
+        # Every call to time.time() is one second later, so access order is never a tie
+        patcher = mock.patch("response_cache.time")
+        self.time = patcher.start()
+        self.time.time.side_effect = itertools.count(1000)
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def cache(self, **kwargs) -> ResponseCache:
+        cache = ResponseCache(self.path, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_get__returns_stored_value(self):
+        cache = self.cache()
+        cache.put("key", {"answer": [1, 2]})
+
+        self.assertEqual({"answer": [1, 2]}, cache.get("key"))
+        self.assertEqual(1, cache.stats.hits)
+
+    def test_get__miss(self):
+        cache = self.cache()
+
+        self.assertIsNone(cache.get("missing"))
+        self.assertEqual(1, cache.stats.misses)
+
+    def test_get__expired_entry_is_a_miss_and_removed(self):
+        cache = self.cache()
+        cache.put("key", "value", ttl=0)
+
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(0, cache.count())
+
+    def test_put__evicts_least_recently_used(self):
+        # Every value is 10 bytes of JSON
+        cache = self.cache(max_size_bytes=30)
+        cache.put("a", "a" * 8)
+        cache.put("b", "b" * 8)
+        cache.put("c", "c" * 8)
+        cache.get("a")
+
+        cache.put("d", "d" * 8)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual("a" * 8, cache.get("a"))
+        self.assertEqual("d" * 8, cache.get("d"))
+
+    def test_put__replacing_a_key_does_not_count_it_twice(self):
+        cache = self.cache(max_size_bytes=30)
+        cache.put("a", "a" * 8)
+        for _ in range(10):
+            cache.put("b", "b" * 8)
+
+        self.assertEqual(0, cache.stats.evictions)
+        self.assertEqual(2, cache.count())
+
+    def test_put__value_larger_than_cache_is_not_stored(self):
+        cache = self.cache(max_size_bytes=5)
+        cache.put("key", "too large")
+
+        self.assertEqual(0, cache.count())
+
+    def test_put__size_of_existing_entries_survives_reopening(self):
+        self.cache(max_size_bytes=30).put("a", "a" * 8)
+        cache = self.cache(max_size_bytes=30)
+        cache.put("b", "b" * 8)
+        cache.put("c", "c" * 8)
+
+        cache.put("d", "d" * 8)
+
+        self.assertIsNone(cache.get("a"))
+
+    def test_make_key__depends_on_input_digest(self):
+        first = ResponseCache.make_key("describe_image", model="gpt-4o", input_digest=ResponseCache.digest_bytes(b"1"))
+        second = ResponseCache.make_key("describe_image", model="gpt-4o", input_digest=ResponseCache.digest_bytes(b"2"))
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(first, ResponseCache.make_key("describe_image", model="gpt-4o",
+                                                       input_digest=ResponseCache.digest_bytes(b"1")))
+
+
+if __name__ == '__main__':
+    unittest.main()
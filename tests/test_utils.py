@@ -0,0 +1,95 @@
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+
+import pyzipper
+
+import utils
+
+
+class TestUnzipFile(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.root = Path(self.directory.name)
+
+    def archive(self, members: dict, name: str = "archive.zip") -> str:
+        path = self.root / name
+        with zipfile.ZipFile(path, "w") as zip_file:
+            for member, content in members.items():
+                zip_file.writestr(member, content)
+        return str(path)
+
+    def extracted(self, target: Path) -> list:
+        return sorted(path.relative_to(target).as_posix() for path in target.rglob("*") if path.is_file())
+
+    def test_unzip_file__extracts_everything_without_filter(self):
+        zip_path = self.archive({"a.txt": "a", "b.mp3": "b", "facts/c.txt": "c"})
+
+        files = utils.unzip_file(zip_path, extract_to=str(self.root / "out"))
+
+        self.assertEqual(["a.txt", "b.mp3", "facts/c.txt"], self.extracted(self.root / "out"))
+        self.assertEqual(3, len(files))
+        self.assertFalse(Path(zip_path).exists())
+
+    def test_unzip_file__extensions_match_top_level_members_only(self):
+        zip_path = self.archive({"a.txt": "a", "b.mp3": "b", "facts/c.txt": "c"})
+
+        files = utils.unzip_file(zip_path, ["txt"], extract_to=str(self.root / "out"))
+
+        self.assertEqual(["a.txt"], self.extracted(self.root / "out"))
+        self.assertEqual([self.root / "out" / "a.txt"], files)
+
+    def test_unzip_file__globs_select_directories(self):
+        zip_path = self.archive({"a.txt": "a", "facts/c.txt": "c", "facts/d.mp3": "d"})
+
+        utils.unzip_file(zip_path, ["facts/*.txt", "*.txt"], extract_to=str(self.root / "out"))
+
+        self.assertEqual(["a.txt", "facts/c.txt"], self.extracted(self.root / "out"))
+
+    def test_unzip_file__parallel_extraction_creates_nested_directories(self):
+        members = {f"dir{index % 5}/sub{index % 3}/file{index}.txt": str(index) for index in range(40)}
+        zip_path = self.archive(members)
+
+        utils.unzip_file(zip_path, extract_to=str(self.root / "out"), workers=4)
+
+        self.assertEqual(sorted(members), self.extracted(self.root / "out"))
+        self.assertEqual("7", (self.root / "out" / "dir2/sub1/file7.txt").read_text())
+
+    def test_unzip_file__members_stay_inside_target(self):
+        zip_path = self.archive({"../evil.txt": "evil", "good.txt": "good"})
+
+        utils.unzip_file(zip_path, extract_to=str(self.root / "out"), workers=2)
+
+        self.assertEqual(["evil.txt", "good.txt"], self.extracted(self.root / "out"))
+        self.assertFalse((self.root / "evil.txt").exists())
+
+    def test_unzip_file__aes_encrypted_archive(self):
+        zip_path = self.root / "secret.zip"
+        with pyzipper.AESZipFile(zip_path, "w", encryption=pyzipper.WZ_AES) as zip_file:
+            zip_file.setpassword(b"1670")
+            zip_file.writestr("a.txt", "a")
+            zip_file.writestr("b.txt", "b")
+
+        utils.unzip_file(str(zip_path), password="1670", extract_to=str(self.root / "out"))
+
+        self.assertEqual("b", (self.root / "out" / "b.txt").read_text())
+
+
+class TestIterZipMembers(unittest.TestCase):
+
+    def test_iter_zip_members__reads_matching_members(self):
+        with tempfile.TemporaryDirectory() as directory:
+            zip_path = Path(directory) / "archive.zip"
+            with zipfile.ZipFile(zip_path, "w") as zip_file:
+                zip_file.writestr("a.txt", "a")
+                zip_file.writestr("b.mp3", "b")
+
+            self.assertEqual([("a.txt", b"a")], list(utils.iter_zip_members(str(zip_path), ["txt"])))
+            self.assertEqual([], [path.name for path in Path(directory).iterdir() if path.suffix != ".zip"])
+
+
+if __name__ == '__main__':
+    unittest.main()
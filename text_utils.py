@@ -1,5 +1,7 @@
+import functools
 import re
 
+import tiktoken
 import unidecode
 
 
@@ -9,3 +11,23 @@ def remove_whitespace_chars(text: str):
 
 def remove_diacritics(text):
     return unidecode.unidecode(text)
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model_name: str) -> tiktoken.Encoding:
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model_name: str = "gpt-4o") -> int:
+    return len(get_encoding(model_name).encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model_name: str = "gpt-4o") -> str:
+    encoding = get_encoding(model_name)
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
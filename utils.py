@@ -1,10 +1,13 @@
 import csv
+import fnmatch
 import json
 import os
 import pickle
 import re
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Iterator, Tuple
 
 import pyzipper
 from bs4 import BeautifulSoup
@@ -27,8 +30,88 @@ def extract_human_readable_text(html: str) -> str:
     return human_readable_text
 
 
+UNZIP_WORKERS = 4
+# Compression method id of WinZip AES encrypted members
+AES_COMPRESSION = 99
+
+
+def _member_patterns(extensions: Optional[List[str]]) -> Optional[List[str]]:
+    # Plain extensions like "txt" or ".txt" are accepted next to globs like "*.txt" and member names
+    if not extensions:
+        return None
+    return [f"*.{ext.lstrip('.')}" if re.fullmatch(r"\.?\w+", ext) else ext for ext in extensions]
+
+
+def _member_matches(name: str, patterns: Optional[List[str]]) -> bool:
+    """
+    Glob semantics relative to the archive root: "*.txt" matches top-level files only, "facts/*" one level deeper.
+    """
+    if patterns is None:
+        return True
+    name_parts = name.rstrip("/").split("/")
+    for pattern in patterns:
+        pattern_parts = pattern.split("/")
+        if len(pattern_parts) == len(name_parts) and all(
+                fnmatch.fnmatchcase(part, part_pattern) for part, part_pattern in zip(name_parts, pattern_parts)):
+            return True
+    return False
+
+
+def _selected_members(zip_ref: zipfile.ZipFile, patterns: Optional[List[str]]) -> List[zipfile.ZipInfo]:
+    return [info for info in zip_ref.infolist() if not info.is_dir() and _member_matches(info.filename, patterns)]
+
+
+def iter_zip_members(zip_path: str, extensions: List[str] = None,
+                     password: Optional[str] = None) -> Iterator[Tuple[str, bytes]]:
+    """
+    Read matching archive members into memory one by one, nothing is written to disk.
+
+    :param zip_path: Path of the archive.
+    :param extensions: Extensions ("txt") or globs ("*.txt", "facts/*") of the members to read, all if missing.
+    :param password: Password of an encrypted archive.
+    :return: Iterator of (member name, content) pairs in archive order.
+    """
+    patterns = _member_patterns(extensions)
+    with pyzipper.AESZipFile(zip_path, 'r') as zip_ref:
+        if password:
+            zip_ref.pwd = password.encode('utf-8')
+        for info in _selected_members(zip_ref, patterns):
+            yield info.filename, zip_ref.read(info)
+
+
+def _member_target(extract_path: Path, name: str) -> Path:
+    # Same sanitizing as ZipFile.extract: no drive, no absolute path, no "." or ".." components
+    arcname = name.replace('/', os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    parts = [part for part in arcname.split(os.path.sep) if part not in ('', os.path.curdir, os.path.pardir)]
+    return extract_path.joinpath(*parts)
+
+
+def _extract_members(zip_path: str, names: List[str], extract_path: Path, password: Optional[str]) -> List[Path]:
+    # Each worker needs its own handle, a shared ZipFile serializes reads on its file object
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        if password:
+            zip_ref.setpassword(password.encode('utf-8'))
+        return [Path(zip_ref.extract(name, extract_path)) for name in names]
+
+
 def unzip_file(zip_path: str, extensions: List[str] = None, password: Optional[str] = None,
-               extract_to: Optional[str] = None) -> List[Path]:
+               extract_to: Optional[str] = None, workers: int = UNZIP_WORKERS) -> List[Path]:
+    """
+    Extract the matching members of an archive and remove the archive afterwards.
+
+    Members are filtered before extraction, so unneeded files are never written. Archives without AES
+    encryption are extracted by several workers in parallel.
+
+    :param zip_path: Path of the archive.
+    :param extensions: Extensions ("txt") or globs ("*.txt", "facts/*") of the members to extract, all if missing.
+    :param password: Password of an encrypted archive.
+    :param extract_to: Target directory, the archive's directory by default.
+    :param workers: Maximum number of parallel extraction workers.
+    :return: Paths of the extracted files.
+    """
     # Set the extraction directory
     if extract_to:
         extract_path = Path(extract_to)
@@ -38,25 +121,31 @@ def unzip_file(zip_path: str, extensions: List[str] = None, password: Optional[s
     # Ensure the extraction directory exists
     extract_path.mkdir(parents=True, exist_ok=True)
 
-    extracted_files = []
+    patterns = _member_patterns(extensions)
 
-    with pyzipper.AESZipFile(zip_path, 'r') as zip_ref:
-        if password:
-            zip_ref.pwd = password.encode('utf-8')
+    # The standard library lists AES members with their raw compression method, pyzipper hides it
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        members = _selected_members(zip_ref, patterns)
+    names = [info.filename for info in members]
 
-        # Extract all files
-        zip_ref.extractall(extract_path)
+    if any(info.compress_type == AES_COMPRESSION for info in members) or workers <= 1 or len(members) <= 1:
+        with pyzipper.AESZipFile(zip_path, 'r') as zip_ref:
+            if password:
+                zip_ref.pwd = password.encode('utf-8')
+            extracted_files = [Path(zip_ref.extract(name, extract_path)) for name in names]
+    else:
+        # ZipFile.extract creates missing parents with a check-then-create race, create them up front
+        for name in names:
+            _member_target(extract_path, name).parent.mkdir(parents=True, exist_ok=True)
+
+        batches = [names[index::workers] for index in range(min(workers, len(names)))]
+        with ThreadPoolExecutor(max_workers=len(batches), thread_name_prefix="unzip") as executor:
+            extracted = executor.map(lambda batch: _extract_members(zip_path, batch, extract_path, password), batches)
+            extracted_files = [path for paths in extracted for path in paths]
 
     # Remove the original ZIP file
     os.remove(zip_path)
 
-    # Filter files by extensions if provided
-    if extensions:
-        for ext in extensions:
-            extracted_files.extend(extract_path.glob(ext))
-    else:
-        extracted_files = list(extract_path.iterdir())
-
     return extracted_files
 
 
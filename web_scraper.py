@@ -1,6 +1,8 @@
 import requests
 from bs4 import BeautifulSoup
 
+import http_transport
+
 
 class WebScraper:
     def __init__(self):
@@ -19,7 +21,7 @@ class WebScraper:
         """
         try:
             # Send an HTTP GET request to the specified URL
-            response = requests.get(url)
+            response = http_transport.get(url)
             response.raise_for_status()  # Raise an exception for HTTP errors
 
             # Parse the HTML content and store it in the instance's state